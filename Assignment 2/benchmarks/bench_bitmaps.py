@@ -0,0 +1,122 @@
+# bench_bitmaps.py
+# Multi-tag and count-threshold queries over a large catalog, answered by
+# intersecting in-memory sets of imageId strings (as Find by Tags used
+# to) vs from a tag bitmap snapshot. Both sides run warm: the sets are
+# already built, the snapshot's bitmaps already unpacked. DynamoDB is not
+# involved; a stand-in serves the tag versions, which match the
+# snapshot, and marks the snapshot published, so no journal is read.
+# Usage: python bench_bitmaps.py [--images 200000] [--repeat 5]
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+
+from common import ROOT
+
+sys.path.insert(0, ROOT)
+import test_data  # noqa: E402
+from pixtag import bitmaps  # noqa: E402
+from pixtag.bitmaps import BITMAP_CACHE  # noqa: E402
+from pixtag.journal import now_ms  # noqa: E402
+
+QUERIES = [
+    {'person': 1, 'car': 1},
+    {'person': 1, 'car': 1, 'dog': 1},
+    {'person': 2, 'chair': 1},
+    {'person': 3, 'car': 2},
+    {'bicycle': 1, 'person': 1, 'car': 1, 'truck': 1}
+]
+
+
+class StatsStandIn:
+    """Answers the tag-stats reads of bitmaps.find_images"""
+
+    def __init__(self, versions, since):
+        self.versions = versions
+        self.since = since
+
+    def get_item(self, **kwargs):
+        # Only the published-snapshot marker is read this way
+        return {'Item': {'since': self.since}}
+
+    def batch_get_item(self, RequestItems):
+        table, request = next(iter(RequestItems.items()))
+        items = [{'tag': key['tag'], 'version': self.versions.get(key['tag'], 0)} for key in request['Keys']]
+        return {'Responses': {table: items}, 'UnprocessedKeys': {}}
+
+
+def with_sets(postings, query, page_size):
+    matches = None
+    for tag, min_count in query.items():
+        images = {image_id for image_id, count in postings[tag].items() if count >= min_count}
+        matches = images if matches is None else matches & images
+    return sorted(matches)[:page_size]
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=200000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Generating {args.images} images...")
+    images = list(test_data.generate_images(args.images))
+    tracemalloc.start()
+    postings = {}
+    for image_id, tags in images:
+        for tag, count in tags.items():
+            postings.setdefault(tag, {})[image_id] = count
+    sets_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    versions = {tag: 1 for tag in postings}
+    since = now_ms()
+    data = bitmaps.encode_snapshot(postings, versions, since=since)
+    encode_ms = (time.perf_counter() - started) * 1000
+    snapshot = bitmaps.Snapshot(data)
+    bitmaps.use_snapshot(snapshot)
+    client = StatsStandIn(versions, since)
+
+    tracemalloc.start()
+    for query in QUERIES:
+        # Unpacks every bitmap the queries touch
+        bitmaps.find_images(client, query, min(query, key=lambda tag: len(postings[tag])), args.page_size)
+    bitmaps_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    sizes = {tag: len(postings[tag]) for tag in ('person', 'car', 'dog')}
+    print(f"Tag sizes: {sizes}")
+    print(f"Snapshot: {len(data) / 1024:.0f} KB on disk, encoded in {encode_ms:.0f}ms; "
+          f"{BITMAP_CACHE.size / 1024:.0f} KB of bitmaps unpacked")
+    print(f"Memory: {sets_bytes / 1024 / 1024:.1f} MB as id dicts, "
+          f"{bitmaps_bytes / 1024 / 1024:.1f} MB as bitmaps (queried tags only)")
+    print(f"{'query':<40} {'sets':>9} {'bitmaps':>9} {'speedup':>8}")
+    for query in QUERIES:
+        driving_tag = min(query, key=lambda tag: len(postings[tag]))
+        expected, sets_ms = timed(lambda: with_sets(postings, query, args.page_size), args.repeat)
+        (found, _), bitmaps_ms = timed(
+            lambda: bitmaps.find_images(client, query, driving_tag, args.page_size), args.repeat
+        )
+        if all(count <= 1 for count in query.values()):
+            assert found == expected, 'bitmaps changed the results'
+        else:
+            # Ordered by the driving tag's count first, like the index
+            assert set(found) <= set(with_sets(postings, query, None)), 'bitmaps changed the results'
+        label = ' '.join(f'{tag}>={count}' for tag, count in query.items())
+        print(f"{label:<40} {sets_ms:>7.1f}ms {bitmaps_ms:>7.2f}ms {sets_ms / bitmaps_ms:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# bench_cold_start.py
+# Init (cold start) cost of every Lambda handler: each run imports one
+# handler in a fresh interpreter, the way Lambda's init phase does, and
+# records the time to load it and the peak RSS (VmHWM) afterwards.
+# Nothing is called, so no AWS access is needed.
+# Usage: python bench_cold_start.py [--runs 5] [--first-client]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from common import LAMBDAS_DIR
+
+HANDLERS = [
+    'queries/Find by Tags.py',
+    'queries/Find by thumbnail.py',
+    'queries/Find by image.py',
+    'queries/Tag stats.py',
+    'queries/Manage tags.py',
+    'queries/Delete images.py',
+    'thumbnail/Create thumbnail.py',
+    'upload/Upload image.py',
+    'yolo/Detect objects.py'
+]
+
+CHILD = r'''
+import importlib.util, json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {lambdas!r})
+spec = importlib.util.spec_from_file_location('handler', os.path.join({lambdas!r}, {path!r}))
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+init_ms = (time.perf_counter() - start) * 1000
+client_ms = None
+if {first_client!r}:
+    # Time until the first DynamoDB client is usable, wherever it is made
+    start = time.perf_counter()
+    try:
+        from pixtag import runtime
+        runtime.dynamodb().meta
+    except ImportError:
+        module.dynamodb.meta.client
+    client_ms = (time.perf_counter() - start) * 1000
+with open('/proc/self/status') as f:
+    hwm = next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))
+print(json.dumps({{'initMs': init_ms, 'clientMs': client_ms, 'peakRssMb': hwm / 1024}}))
+'''
+
+
+def measure(path, first_client):
+    env = dict(os.environ, AWS_DEFAULT_REGION='us-east-1', AWS_ACCESS_KEY_ID='testing',
+               AWS_SECRET_ACCESS_KEY='testing', DETECTOR='stub')
+    code = CHILD.format(lambdas=LAMBDAS_DIR, path=path, first_client=first_client)
+    output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--first-client', action='store_true',
+                        help='also time creating the first DynamoDB client')
+    args = parser.parse_args()
+
+    print(f"{'handler':<32} {'init ms':>8} {'+client ms':>10} {'peak RSS MB':>11}")
+    for path in HANDLERS:
+        try:
+            runs = [measure(path, args.first_client) for _ in range(args.runs)]
+        except subprocess.CalledProcessError as e:
+            print(f"{path:<32} failed: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        init_ms = statistics.median(run['initMs'] for run in runs)
+        client = statistics.median(run['clientMs'] for run in runs) if args.first_client else None
+        rss = statistics.median(run['peakRssMb'] for run in runs)
+        client_text = f'{client:>10.1f}' if client is not None else f"{'-':>10}"
+        print(f"{path:<32} {init_ms:>8.1f} {client_text} {rss:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
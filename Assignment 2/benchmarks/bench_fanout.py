@@ -0,0 +1,77 @@
+# bench_fanout.py
+# Latency of multi-tag queries with the per-tag index reads issued one
+# after another (a single fan-out worker) vs concurrently on the fan-out
+# pool. Posting-list caching is switched off so every tag is read from
+# the index, as for tags too big to cache, and every DynamoDB call gets
+# --latency-ms of simulated network time. moto spends real CPU time per
+# item under the GIL, which no amount of concurrency hides, so a small
+# catalog with a high latency is closest to DynamoDB's network-bound calls.
+# Usage: python bench_fanout.py [--images 200] [--latency-ms 100] [--tags 1,2,3,5]
+import argparse
+import statistics
+import sys
+import time
+from moto import mock_aws
+
+from common import ROOT, add_latency, create_tables
+
+sys.path.insert(0, ROOT)
+import test_data  # noqa: E402
+from pixtag import fanout, runtime, search, similarity, tag_index  # noqa: E402
+from pixtag.search import PROBE_CACHE  # noqa: E402
+from pixtag.stats import COUNTS_CACHE  # noqa: E402
+from pixtag.tag_index import POSTINGS_CACHE  # noqa: E402
+
+
+def timed_median(func, repeat):
+    times = []
+    for _ in range(repeat):
+        POSTINGS_CACHE.clear()
+        PROBE_CACHE.clear()
+        started = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=100.0)
+    parser.add_argument('--tags', default='1,2,3,5')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with mock_aws():
+        client = runtime.new_client('dynamodb')
+        create_tables(client)
+        test_data.seed_catalog(client, args.images, exponent=0.5)
+        add_latency(client, args.latency_ms)
+        COUNTS_CACHE.clear()
+
+        # Every tag goes to the index, and every extra tag is merged
+        tag_index.MAX_CACHED_POSTINGS = 0
+        search.PROBE_RATIO = 10 ** 9
+
+        workers = fanout.FANOUT_WORKERS
+        popular = test_data.VOCABULARY[:max(int(n) for n in args.tags.split(','))]
+        print(f"{args.images} images, {args.latency_ms:.0f} ms per call; median of {args.repeat}")
+        print(f"{'query':<16} {'tags':>4} {'sequential':>11} {'fan-out':>9} {'speedup':>8}")
+        for n in [int(n) for n in args.tags.split(',')]:
+            tags = popular[:n]
+            queries = {
+                'find_images': lambda: search.find_images(client, {tag: 1 for tag in tags}, page_size=100),
+                'rank_similar': lambda: similarity.rank_similar(client, {tag: 1 for tag in tags}, 50)
+            }
+            for name, query in queries.items():
+                fanout.configure(1)
+                sequential, sequential_ms = timed_median(query, args.repeat)
+                fanout.configure(workers)
+                concurrent, concurrent_ms = timed_median(query, args.repeat)
+                assert sequential == concurrent, 'fan-out changed the results'
+                print(f"{name:<16} {n:>4} {sequential_ms:>9.0f}ms {concurrent_ms:>7.0f}ms "
+                      f"{sequential_ms / concurrent_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
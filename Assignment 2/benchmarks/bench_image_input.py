@@ -0,0 +1,197 @@
+# bench_image_input.py
+# Peak Python heap per request for the old JSON/base64 image input versus
+# read_image with JSON, raw octet-stream and multipart bodies, for growing
+# image sizes. The event body itself is built before measuring, as it is
+# in Lambda; spooled inputs are mapped from /tmp and don't count as heap.
+# The second table runs the whole Find by image handler (moto DynamoDB, a
+# local stand-in for the YOLO Lambda that enforces its 6 MB payload limit)
+# with big images inlined as base64, as before, or staged in S3. S3 request
+# bodies are drained at the wire, a chunk at a time like a socket send,
+# because moto's in-process S3 would hold every object on the heap.
+# Usage: python bench_image_input.py [--sizes-mb 1,4,8,16]
+import argparse
+import base64
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from moto import mock_aws
+
+from common import ROOT, create_tables, load_handler
+
+sys.path.insert(0, ROOT)
+import test_data  # noqa: E402
+from botocore.awsrequest import AWSResponse  # noqa: E402
+from pixtag import detection, runtime  # noqa: E402
+from pixtag.detection import CachedDetector, LambdaDetector  # noqa: E402
+from pixtag.payload import read_image  # noqa: E402
+
+BOUNDARY = 'pixtagboundary'
+# Synchronous Lambda invoke request payload limit
+INVOKE_LIMIT = 6 * 1024 * 1024
+
+
+class Wire:
+    """Answers S3 requests after reading their bodies, remembering the keys put"""
+
+    def __init__(self, s3):
+        self.keys = set()
+        s3.meta.events.register_first('before-send.s3', self.send)
+
+    def send(self, request, **kwargs):
+        body = request.body
+        while hasattr(body, 'read') and body.read(64 * 1024):
+            pass
+        if request.method == 'PUT':
+            self.keys.add(request.url.split('?')[0].rsplit('/', 1)[1])
+        elif request.method == 'POST':
+            self.keys.clear()
+        return AWSResponse(request.url, 200, {'ETag': '"0"'}, EmptyBody())
+
+
+class EmptyBody:
+    def stream(self, **kwargs):
+        return iter(())
+
+    def read(self, *args):
+        return b''
+
+
+class LocalLambda:
+    """
+    The YOLO Lambda as seen from the query handler: checks the payload
+    size and that staged images were uploaded, and answers with fixed tags.
+    The worker's own download happens in its container, so isn't counted.
+    """
+
+    def __init__(self, wire):
+        self.wire = wire
+        self.largest = 0
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.largest = max(self.largest, len(Payload))
+        if len(Payload) > INVOKE_LIMIT:
+            raise RuntimeError('RequestEntityTooLargeException')
+        images = json.loads(Payload)['images']
+        for image in images:
+            if isinstance(image, dict):
+                assert image['key'].rsplit('/', 1)[-1] in self.wire.keys, image
+        result = {'detections': [{'tagCounts': {'person': 1, 'car': 1}} for _ in images]}
+        return {'Payload': io.BytesIO(json.dumps(result).encode())}
+
+
+def legacy(event):
+    """What the handler used to do before detection"""
+    body = json.loads(event.get('body', '{}'))
+    image_bytes = base64.b64decode(body.get('imageData'))
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def current(event):
+    with read_image(event) as payload:
+        return hashlib.sha256(payload.data).hexdigest()
+
+
+def make_events(image):
+    multipart = (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="topK"\r\n\r\n50\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="image"; filename="query.jpg"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'
+    ).encode() + image + f'\r\n--{BOUNDARY}--\r\n'.encode()
+    return {
+        'json': {
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'imageData': base64.b64encode(image).decode(), 'topK': 50})
+        },
+        'octet-stream': {
+            'headers': {'Content-Type': 'application/octet-stream'},
+            'isBase64Encoded': True,
+            'body': base64.b64encode(image).decode()
+        },
+        'multipart': {
+            'headers': {'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'},
+            'isBase64Encoded': True,
+            'body': base64.b64encode(multipart).decode()
+        }
+    }
+
+
+def peak_mb(func, event):
+    tracemalloc.start()
+    digest = func(event)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return digest, peak / (1024 * 1024)
+
+
+def run_handler(handler, s3, wire, event, inline_limit):
+    """(peak heap MB, ms, status, largest invoke payload MB) for one request"""
+    detection.INLINE_LIMIT = inline_limit
+    local = LocalLambda(wire)
+    handler.detector = CachedDetector(LambdaDetector(lambda_client=local, s3_client=s3))
+    tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = handler.lambda_handler(event, None)
+    elapsed = (time.perf_counter() - started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / (1024 * 1024), elapsed, response['statusCode'], local.largest / (1024 * 1024)
+
+
+def bench_handler(sizes_mb):
+    modes = ['json', 'octet-stream', 'multipart']
+    with mock_aws():
+        client = runtime.new_client('dynamodb')
+        create_tables(client)
+        test_data.seed_catalog(client, 200)
+        s3 = runtime.new_client('s3')
+        wire = Wire(s3)
+        handler = load_handler('queries/Find by image.py')
+        staged_limit = detection.INLINE_LIMIT
+
+        print()
+        print('Find by image handler: peak heap MB / ms / status (largest invoke payload MB)')
+        print(f"{'image MB':>8} {'mode':<13} {'inline base64':>30} {'staged in S3':>30}")
+        for size_mb in sizes_mb:
+            events = make_events(os.urandom(int(size_mb * 1024 * 1024)))
+            for mode in modes:
+                cells = []
+                for inline_limit in (float('inf'), staged_limit):
+                    peak, elapsed, status, largest = run_handler(handler, s3, wire, events[mode], inline_limit)
+                    cells.append(f'{peak:6.1f} / {elapsed:6.0f} / {status} ({largest:4.1f})')
+                print(f"{size_mb:>8g} {mode:<13} {cells[0]:>30} {cells[1]:>30}")
+        print(f"staged objects left in S3: {len(wire.keys)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes-mb', default='1,4,8,16')
+    args = parser.parse_args()
+
+    modes = ['json', 'octet-stream', 'multipart']
+    print(f"{'image MB':>8} {'legacy':>8} " + ' '.join(f'{mode:>13}' for mode in modes) + '   (peak heap MB)')
+    for size_mb in [float(size) for size in args.sizes_mb.split(',')]:
+        image = os.urandom(int(size_mb * 1024 * 1024))
+        expected = hashlib.sha256(image).hexdigest()
+        events = make_events(image)
+        del image
+
+        digest, legacy_peak = peak_mb(legacy, events['json'])
+        assert digest == expected
+        peaks = []
+        for mode in modes:
+            digest, peak = peak_mb(current, events[mode])
+            assert digest == expected, mode
+            peaks.append(peak)
+        print(f"{size_mb:>8g} {legacy_peak:>8.1f} " + ' '.join(f'{peak:>13.1f}' for peak in peaks))
+
+    bench_handler([float(size) for size in args.sizes_mb.split(',')])
+
+
+if __name__ == '__main__':
+    main()
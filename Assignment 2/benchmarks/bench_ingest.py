@@ -0,0 +1,88 @@
+# bench_ingest.py
+# Ingest throughput of the detection worker for growing micro-batch sizes.
+# An in-process queue.Queue stands in for SQS and a CPU stub detector with
+# a fixed per-call cost stands in for YOLO, so the numbers show how well
+# the per-call overhead is amortized.
+# Usage: python bench_ingest.py [--images 256] [--batch-sizes 1,4,8,16,32]
+#        [--call-ms 40] [--image-ms 5] [--latency-ms 2]
+import argparse
+import contextlib
+import io
+import json
+import os
+import queue
+import time
+import uuid
+
+os.environ['DETECTOR'] = 'stub'
+
+import boto3
+from moto import mock_aws
+
+from common import add_latency, create_tables, load_handler
+from pixtag import runtime
+from pixtag.detection import CachedDetector, StubDetector
+
+FULL_IMAGES_BUCKET = 'assignment2-images-1812'
+
+
+def seed(dynamodb, s3, count):
+    messages = queue.Queue()
+    table = dynamodb.Table('assignment2-images')
+    with table.batch_writer() as writer:
+        for _ in range(count):
+            image_id = str(uuid.uuid4())
+            key = f'{image_id}.jpg'
+            s3.put_object(Bucket=FULL_IMAGES_BUCKET, Key=key, Body=os.urandom(2048))
+            writer.put_item(Item={'imageId': image_id, 'tagCounts': {}})
+            messages.put({'imageId': image_id, 'bucket': FULL_IMAGES_BUCKET, 'key': key})
+    return messages
+
+
+def drain(handler, messages, batch_size):
+    """Feed the queue to the handler batch_size messages per invocation"""
+    invocations = 0
+    while not messages.empty():
+        records = []
+        while len(records) < batch_size and not messages.empty():
+            records.append({'messageId': str(uuid.uuid4()), 'body': json.dumps(messages.get())})
+        result = handler.lambda_handler({'Records': records}, None)
+        assert not result['batchItemFailures'], result
+        invocations += 1
+    return invocations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=256)
+    parser.add_argument('--batch-sizes', default='1,4,8,16,32')
+    parser.add_argument('--call-ms', type=float, default=40.0)
+    parser.add_argument('--image-ms', type=float, default=5.0)
+    parser.add_argument('--latency-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"{'batch':>6} {'calls':>6} {'seconds':>8} {'images/s':>9}")
+    for batch_size in [int(size) for size in args.batch_sizes.split(',')]:
+        with mock_aws():
+            dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+            s3 = boto3.client('s3', region_name='us-east-1')
+            create_tables(dynamodb.meta.client)
+            s3.create_bucket(Bucket=FULL_IMAGES_BUCKET)
+            messages = seed(dynamodb, s3, args.images)
+
+            handler = load_handler('yolo/Detect objects.py')
+            handler.BATCH_SIZE = batch_size
+            stub = StubDetector(call_overhead=args.call_ms / 1000.0, per_image=args.image_ms / 1000.0)
+            handler.dynamodb = runtime.new_client('dynamodb')
+            handler.detector = CachedDetector(stub, handler.dynamodb)
+            add_latency(handler.dynamodb, args.latency_ms)
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                drain(handler, messages, batch_size)
+            seconds = time.perf_counter() - start
+            print(f"{batch_size:>6} {stub.calls:>6} {seconds:>8.2f} {args.images / seconds:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# bench_metadata.py
+# Compares the old one-get_item-per-image loop with the batched metadata
+# layer for growing result sets.
+# Usage: python bench_metadata.py [--latency-ms 5] [--sizes 10,100,1000]
+import argparse
+import uuid
+
+import boto3
+from moto import mock_aws
+
+from common import add_latency, create_tables, timed
+from pixtag.metadata import get_thumbnail_urls
+
+
+def get_item_loop(table, image_ids):
+    thumbnail_urls = []
+    for image_id in image_ids:
+        response = table.get_item(Key={'imageId': image_id})
+        if 'Item' in response:
+            thumbnail_url = response['Item'].get('thumbnailUrl')
+            if thumbnail_url:
+                thumbnail_urls.append(thumbnail_url)
+    return thumbnail_urls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--sizes', default='10,100,1000,5000')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        create_tables(dynamodb.meta.client)
+        table = dynamodb.Table('assignment2-images')
+
+        image_ids = [str(uuid.uuid4()) for _ in range(max(sizes))]
+        with table.batch_writer() as writer:
+            for image_id in image_ids:
+                writer.put_item(Item={
+                    'imageId': image_id,
+                    'thumbnailUrl': f'https://assignment2-thumbnails-1812.s3.amazonaws.com/thumb/{image_id}.jpg',
+                    'fullImageUrl': f'https://assignment2-images-1812.s3.amazonaws.com/{image_id}.jpg',
+                    'tags': ['person']
+                })
+
+        add_latency(dynamodb.meta.client, args.latency_ms)
+
+        print(f"{'images':>8} {'get_item (ms)':>14} {'batched (ms)':>13} {'speedup':>8}")
+        for size in sizes:
+            ids = image_ids[:size]
+            loop_urls, loop_ms = timed(get_item_loop, table, ids)
+            batch_urls, batch_ms = timed(get_thumbnail_urls, dynamodb.meta.client, ids)
+            assert sorted(loop_urls) == sorted(batch_urls)
+            print(f"{size:>8} {loop_ms:>14.1f} {batch_ms:>13.1f} {loop_ms / batch_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
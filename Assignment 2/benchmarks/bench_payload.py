@@ -0,0 +1,74 @@
+# bench_payload.py
+# Response size and time for big result sets: full links vs compact mode,
+# each uncompressed, gzip and brotli (when installed), all built through
+# runtime.respond. "client ms" adds the transfer time at --mbps and the
+# time to decompress and parse, i.e. roughly what the browser waits for.
+# Usage: python bench_payload.py [--results 1000,5000] [--mbps 20]
+import argparse
+import base64
+import gzip
+import json
+import time
+import uuid
+
+import common  # noqa: F401  (puts pixtag on sys.path)
+from pixtag import runtime
+from pixtag.urls import compact_links
+
+BASE_URL = 'https://assignment2-thumbnails-1812.s3.amazonaws.com/thumb/'
+ENCODINGS = ['identity', 'gzip', 'br']
+
+
+def decode(response):
+    body = response['body']
+    if not response.get('isBase64Encoded'):
+        return body
+    data = base64.b64decode(body)
+    encoding = response['headers'].get('Content-Encoding')
+    if encoding == 'gzip':
+        return gzip.decompress(data).decode()
+    return runtime._optional_module('brotli').decompress(data).decode()
+
+
+def measure(payload, encoding, repeat=5):
+    event = {'headers': {'Accept-Encoding': encoding}}
+    started = time.perf_counter()
+    for _ in range(repeat):
+        response = runtime.respond(payload, event=event)
+    server_ms = (time.perf_counter() - started) * 1000 / repeat
+    started = time.perf_counter()
+    json.loads(decode(response))
+    client_ms = (time.perf_counter() - started) * 1000
+    wire = len(base64.b64decode(response['body'])) if response.get('isBase64Encoded') else len(response['body'])
+    return response['headers'].get('Content-Encoding', 'identity'), wire, server_ms, client_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--results', default='1000,5000')
+    parser.add_argument('--mbps', type=float, default=20.0, help='client bandwidth for the transfer estimate')
+    args = parser.parse_args()
+
+    print(f"JSON encoder: {'orjson' if runtime._optional_module('orjson') else 'json'}; "
+          f"brotli {'available' if runtime._optional_module('brotli') else 'not installed'}")
+    print(f"{'results':>7} {'mode':>8} {'encoding':>9} {'bytes':>9} {'server ms':>9} {'client ms':>9} {'size x':>7}")
+    for count in [int(value) for value in args.results.split(',')]:
+        links = [f'{BASE_URL}{uuid.uuid4()}.jpg' for _ in range(count)]
+        base_url, suffix, ids = compact_links(links)
+        payloads = {
+            'links': {'links': links, 'count': count, 'nextCursor': None},
+            'compact': {'baseUrl': base_url, 'suffix': suffix, 'ids': ids, 'count': count, 'nextCursor': None}
+        }
+        baseline = None
+        for mode, payload in payloads.items():
+            for encoding in ENCODINGS:
+                used, wire, server_ms, parse_ms = measure(payload, encoding)
+                if used != encoding:
+                    continue
+                baseline = baseline or wire
+                client_ms = server_ms + wire * 8 / (args.mbps * 1000) + parse_ms
+                print(f"{count:>7} {mode:>8} {used:>9} {wire:>9} {server_ms:>9.2f} {client_ms:>9.1f} {baseline / wire:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# bench_sharding.py
+# Ingest throughput of tag-index writes with hot tags spread over 1, 2, 4
+# or 8 shards, or as many as their size calls for (auto). The stand-in
+# table gives every partition key its own write budget (--rate writes/s,
+# a scaled-down version of DynamoDB's ~1000 WCU per partition) and hands
+# anything over it back as UnprocessedItems, the way DynamoDB throttles a
+# hot partition. Writes go through pixtag.batch.batch_write, so retries
+# and backoff are the real ones.
+# Usage: python bench_sharding.py [--images 5000] [--rate 200] [--shards 1,2,4,8,auto]
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+
+from common import ROOT
+
+sys.path.insert(0, ROOT)
+import test_data  # noqa: E402
+from pixtag import shards as sharding  # noqa: E402
+from pixtag.batch import batch_write, put_request  # noqa: E402
+from pixtag.tag_index import index_item  # noqa: E402
+
+
+class ThrottledTable:
+    """BatchWriteItem with a token bucket per partition key"""
+
+    def __init__(self, rate, latency_ms):
+        self.rate = rate
+        self.latency = latency_ms / 1000.0
+        self.buckets = {}
+        self.written = Counter()
+        self.throttled = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _take(self, key, now):
+        tokens, updated = self.buckets.get(key, (self.rate / 10.0, now))
+        # Refill at rate per second, with a tenth of a second of burst
+        tokens = min(self.rate / 10.0, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            return True
+        self.buckets[key] = (tokens, now)
+        return False
+
+    def batch_write_item(self, RequestItems):
+        time.sleep(self.latency)
+        unprocessed = {}
+        with self._lock:
+            self.calls += 1
+            now = time.monotonic()
+            for table, requests in RequestItems.items():
+                for request in requests:
+                    key = request['PutRequest']['Item']['tag']
+                    if self._take(key, now):
+                        self.written[key] += 1
+                    else:
+                        self.throttled += 1
+                        unprocessed.setdefault(table, []).append(request)
+        return {'UnprocessedItems': unprocessed}
+
+
+def ingest(table, images, shard_counts, batch_images):
+    """Write every image's index rows, one SQS-sized batch at a time"""
+    failed = 0
+    batch = []
+    for image_id, tags in images + [(None, None)]:
+        if image_id is not None:
+            batch.append((image_id, tags))
+            if len(batch) < batch_images:
+                continue
+        requests = [
+            put_request(index_item(tag, image, count, shard_counts.get(tag, 1)))
+            for image, tag_counts in batch for tag, count in tag_counts.items()
+        ]
+        try:
+            batch_write(table, 'assignment2-tag-index', requests, ('tag', 'imageId'))
+        except RuntimeError:
+            failed += len(requests)
+        batch = []
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=5000)
+    parser.add_argument('--rate', type=float, default=200.0, help='writes per second per partition')
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--batch-images', type=int, default=100, help='images per ingest batch')
+    parser.add_argument('--shards', default='1,2,4,8,auto')
+    args = parser.parse_args()
+
+    images = list(test_data.generate_images(args.images))
+    sizes = Counter(tag for _, tags in images for tag in tags)
+    rows = sum(sizes.values())
+    hottest, hottest_size = sizes.most_common(1)[0]
+    # Sized so the hottest tag ends up needing about 8 shards in auto mode
+    sharding.SHARD_SIZE = hottest_size // 8 + 1
+
+    print(f"{args.images} images, {rows} index rows; hottest tag {hottest!r} has {hottest_size} rows")
+    print(f"{args.rate:.0f} writes/s per partition, {args.latency_ms:.0f} ms per call")
+    print(f"{'shards':>6} {'seconds':>8} {'rows/s':>8} {'throttled':>10} {'failed':>7} {'hot shards':>11}")
+    baseline = None
+    for mode in args.shards.split(','):
+        if mode == 'auto':
+            shard_counts = {tag: sharding.target_shards(size) for tag, size in sizes.items()}
+        else:
+            shard_counts = {tag: int(mode) for tag in sizes}
+        table = ThrottledTable(args.rate, args.latency_ms)
+        started = time.perf_counter()
+        failed = ingest(table, images, shard_counts, args.batch_images)
+        seconds = time.perf_counter() - started
+        throughput = (rows - failed) / seconds
+        baseline = baseline or throughput
+        hot = sum(1 for key in table.written if key.split('#shard')[0] == hottest)
+        print(f"{mode:>6} {seconds:>8.1f} {throughput:>8.0f} {table.throttled:>10} {failed:>7} {hot:>11}"
+              f"   {throughput / baseline:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# bench_thumbnail.py
+# Thumbnails a corpus of large JPEGs two ways, each in its own process so
+# peak RSS is comparable:
+#   full  - decode every pixel, then resize (what a naive handler does)
+#   draft - the Create thumbnail handler (libjpeg scaled decode)
+# Usage: python bench_thumbnail.py [--megapixels 12,24] [--images 5]
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from common import load_handler
+
+
+def make_corpus(directory, megapixels, count):
+    paths = []
+    for mp in megapixels:
+        width = int((mp * 1_000_000 * 3 / 2) ** 0.5)
+        height = int(width * 2 / 3)
+        for i in range(count):
+            path = os.path.join(directory, f'{mp}mp_{i}.jpg')
+            if not os.path.exists(path):
+                # Noise over a gradient compresses like a real photo
+                image = Image.merge('RGB', [
+                    Image.effect_noise((width, height), 40 + 10 * band).convert('L')
+                    for band in range(3)
+                ])
+                image.save(path, 'JPEG', quality=90)
+            paths.append((mp, path))
+    return paths
+
+
+def peak_rss_mb():
+    # VmHWM resets on exec; ru_maxrss can carry over from the parent
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode, paths):
+    handler = load_handler('thumbnail/Create thumbnail.py')
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, 'rb') as source:
+            if mode == 'draft':
+                handler.make_thumbnail(source)
+            else:
+                with Image.open(source) as image:
+                    image.load()
+                    image.thumbnail((handler.THUMBNAIL_SIZE, handler.THUMBNAIL_SIZE), Image.LANCZOS)
+    elapsed = (time.perf_counter() - start) * 1000 / len(paths)
+    print(json.dumps({'ms_per_image': elapsed, 'peak_rss_mb': peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--megapixels', default='12,24')
+    parser.add_argument('--images', type=int, default=5)
+    parser.add_argument('--corpus', default=os.path.join(tempfile.gettempdir(), 'pixtag-thumb-corpus'))
+    parser.add_argument('--mode')
+    parser.add_argument('paths', nargs='*')
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.paths)
+        return
+
+    os.makedirs(args.corpus, exist_ok=True)
+    megapixels = [int(mp) for mp in args.megapixels.split(',')]
+    corpus = make_corpus(args.corpus, megapixels, args.images)
+
+    print(f"{'MP':>4} {'mode':>6} {'ms/image':>9} {'peak RSS (MB)':>14}")
+    for mp in megapixels:
+        paths = [path for size, path in corpus if size == mp]
+        for mode in ('full', 'draft'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--mode', mode] + paths,
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mp:>4} {mode:>6} {result['ms_per_image']:>9.1f} {result['peak_rss_mb']:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# common.py
+# Helpers shared by the benchmark scripts. Everything runs against moto's
+# in-memory AWS, so no real resources are touched.
+import importlib.util
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDAS_DIR = os.path.join(ROOT, 'lambdas')
+
+# Make `import pixtag` work the same way the Lambda layer does
+if LAMBDAS_DIR not in sys.path:
+    sys.path.insert(0, LAMBDAS_DIR)
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+# The tables exactly as infrastructure/setup_assignment2.py provisions them
+sys.path.insert(0, os.path.join(ROOT, 'infrastructure'))
+from setup_assignment2 import TABLES, ensure_tables  # noqa: E402,F401
+
+
+def load_handler(relative_path):
+    """Import a Lambda file such as 'queries/Find by Tags.py' as a module"""
+    path = os.path.join(LAMBDAS_DIR, relative_path)
+    name = os.path.splitext(os.path.basename(path))[0].replace(' ', '_').lower()
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_tables(client):
+    """Provision the tables through the setup script's own code path"""
+    for name, result in ensure_tables(client).items():
+        if isinstance(result, Exception):
+            raise RuntimeError(f"{name}: {result}") from result
+
+
+def add_latency(client, latency_ms):
+    """Sleep before every call so moto behaves a bit more like the network"""
+    if latency_ms <= 0:
+        return
+
+    def sleep(**kwargs):
+        time.sleep(latency_ms / 1000.0)
+
+    client.meta.events.register('before-call.dynamodb', sleep)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
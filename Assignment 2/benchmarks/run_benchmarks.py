@@ -0,0 +1,294 @@
+# run_benchmarks.py
+# Load test for every query Lambda. Seeds a synthetic Zipf catalog
+# (test_data.py) into moto, or into a local endpoint such as LocalStack,
+# then drives the lambda_handlers with a concurrent request mix. Reports
+# p50/p95/p99 latency, DynamoDB calls and consumed capacity per handler,
+# and writes them as JSON that later runs can be compared against.
+# Usage: python run_benchmarks.py [--sizes 10000,100000] [--requests 1000]
+#        [--concurrency 8] [--latency-ms 0] [--output results.json]
+#        [--compare previous.json] [--endpoint-url http://localhost:4566]
+#        [--traces traces.log]  (then: python trace_report.py traces.log)
+#        [--mix find_by_tags=40,tag_stats=25,...]
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DETECTOR', 'stub')
+
+import boto3
+
+from common import ROOT, add_latency, create_tables, load_handler
+
+sys.path.insert(0, ROOT)
+import test_data  # noqa: E402
+from pixtag import runtime  # noqa: E402
+from pixtag.facets import FACETS_CACHE  # noqa: E402
+from pixtag.metadata import METADATA_CACHE  # noqa: E402
+from pixtag.results import RESULTS_CACHE  # noqa: E402
+from pixtag.search import PROBE_CACHE  # noqa: E402
+from pixtag.stats import COUNTS_CACHE  # noqa: E402
+from pixtag.tag_index import POSTINGS_CACHE  # noqa: E402
+
+HANDLERS = {
+    'find_by_tags': 'queries/Find by Tags.py',
+    'tag_stats': 'queries/Tag stats.py',
+    'find_by_thumbnail': 'queries/Find by thumbnail.py',
+    'find_by_image': 'queries/Find by image.py',
+    'manage_tags': 'queries/Manage tags.py',
+    'delete_images': 'queries/Delete images.py'
+}
+DEFAULT_MIX = 'find_by_tags=40,tag_stats=25,find_by_thumbnail=15,find_by_image=10,manage_tags=7,delete_images=3'
+
+# Operations that accept ReturnConsumedCapacity
+CAPACITY_OPERATIONS = {
+    'GetItem', 'PutItem', 'UpdateItem', 'DeleteItem', 'Query', 'Scan',
+    'BatchGetItem', 'BatchWriteItem', 'TransactGetItems', 'TransactWriteItems'
+}
+
+
+class Meter:
+    """DynamoDB calls and capacity units seen by one handler's client"""
+
+    def __init__(self):
+        self.calls = 0
+        self.capacity = 0.0
+        self._lock = threading.Lock()
+
+    def attach(self, client):
+        client.meta.events.register('provide-client-params.dynamodb', self._request_capacity)
+        client.meta.events.register('after-call.dynamodb', self._record)
+
+    def _request_capacity(self, params, model, **kwargs):
+        if model.name in CAPACITY_OPERATIONS:
+            params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+    def _record(self, parsed, **kwargs):
+        consumed = parsed.get('ConsumedCapacity') or []
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        with self._lock:
+            self.calls += 1
+            self.capacity += sum(entry.get('CapacityUnits', 0) for entry in consumed)
+
+
+class Workload:
+    """Builds random but realistic events for each handler"""
+
+    def __init__(self, image_ids, seed=0):
+        self.rng = random.Random(seed)
+        self.image_ids = list(image_ids)
+        self.deletable = self.image_ids[len(self.image_ids) // 2:]
+        self.weights = test_data.zipf_weights(len(test_data.VOCABULARY))
+        # A handful of repeated query images, so the detection cache matters
+        self.query_images = [os.urandom(32 * 1024) for _ in range(20)]
+        self._lock = threading.Lock()
+
+    def tag(self):
+        return self.rng.choices(test_data.VOCABULARY, self.weights)[0]
+
+    def thumbnail_url(self, image_id=None):
+        image_id = image_id or self.rng.choice(self.image_ids)
+        return f'https://{test_data.THUMBNAILS_BUCKET}.s3.amazonaws.com/thumb/{image_id}.jpg'
+
+    def find_by_tags(self):
+        tags = list(dict.fromkeys(self.tag() for _ in range(self.rng.randint(1, 3))))
+        counts = [str(1 if self.rng.random() < 0.8 else 2) for _ in tags]
+        return {'queryStringParameters': {'tags': ','.join(tags), 'counts': ','.join(counts), 'pageSize': '100'}}
+
+    def tag_stats(self):
+        roll = self.rng.random()
+        if roll < 0.7:
+            tag = self.tag()
+            return {'queryStringParameters': {'prefix': tag[:self.rng.randint(1, 3)]}}
+        if roll < 0.85:
+            return {'queryStringParameters': {'limit': '20'}}
+        return {'queryStringParameters': {'tags': self.tag()}}
+
+    def find_by_thumbnail(self):
+        if self.rng.random() < 0.2:
+            return {'body': json.dumps({'thumbnailUrls': [self.thumbnail_url() for _ in range(20)]})}
+        return {'body': json.dumps({'thumbnailUrl': self.thumbnail_url()})}
+
+    def find_by_image(self):
+        image = self.rng.choice(self.query_images) if self.rng.random() < 0.5 else os.urandom(32 * 1024)
+        return {
+            'headers': {'Content-Type': 'application/octet-stream'},
+            'isBase64Encoded': True,
+            'body': base64.b64encode(image).decode(),
+            'queryStringParameters': {'topK': '50'}
+        }
+
+    def manage_tags(self):
+        urls = [self.thumbnail_url() for _ in range(self.rng.randint(1, 10))]
+        return {'body': json.dumps({'url': urls, 'type': self.rng.randint(0, 1), 'tags': [self.tag()]})}
+
+    def delete_images(self):
+        with self._lock:
+            image_id = self.deletable.pop() if self.deletable else self.rng.choice(self.image_ids)
+        return {'body': json.dumps({'url': [self.thumbnail_url(image_id)]})}
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def clear_caches():
+    for cache in (FACETS_CACHE, METADATA_CACHE, PROBE_CACHE, COUNTS_CACHE, POSTINGS_CACHE, RESULTS_CACHE):
+        cache.clear()
+
+
+def run_catalog(size, args, mix):
+    """Seed one catalog, run warmup and measured requests, return its report"""
+    start = time.perf_counter()
+    seeder = boto3.resource('dynamodb')
+    create_tables(seeder.meta.client)
+    s3 = boto3.client('s3')
+    for bucket in (test_data.FULL_IMAGES_BUCKET, test_data.THUMBNAILS_BUCKET):
+        s3.create_bucket(Bucket=bucket)
+    image_ids = test_data.seed_catalog(seeder.meta.client, size, seed=args.seed)
+    seed_seconds = time.perf_counter() - start
+    clear_caches()
+
+    handlers = {}
+    meters = {}
+    for name in mix:
+        handlers[name] = load_handler(HANDLERS[name])
+        meters[name] = Meter()
+        # One client per handler, as each Lambda has its own container
+        client = handlers[name].dynamodb = runtime.new_client('dynamodb')
+        meters[name].attach(client)
+        add_latency(client, args.latency_ms)
+
+    workload = Workload(image_ids, args.seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+
+    def invoke(name, event, record):
+        started = time.perf_counter()
+        try:
+            status = handlers[name].lambda_handler(event, None)['statusCode']
+        except Exception:
+            status = 'exception'
+        if record:
+            latencies[name].append((time.perf_counter() - started) * 1000)
+            statuses[name][status] += 1
+
+    def run(count, record):
+        # Events are built up front so the generator isn't timed
+        plan = [(name, getattr(workload, name)()) for name in workload.rng.choices(names, weights, k=count)]
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(lambda job: invoke(job[0], job[1], record), plan))
+
+    # Handlers log a trace line per request; keep the report readable
+    logs = io.StringIO()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run(args.warmup, record=False)
+    for meter in meters.values():
+        meter.calls, meter.capacity = 0, 0.0
+    with contextlib.redirect_stdout(logs):
+        started = time.perf_counter()
+        run(args.requests, record=True)
+        elapsed = time.perf_counter() - started
+    if args.traces:
+        with open(args.traces, 'a') as f:
+            f.write(logs.getvalue())
+
+    report = {'images': size, 'seedSeconds': round(seed_seconds, 1), 'seconds': round(elapsed, 2),
+              'throughput': round(args.requests / elapsed, 1), 'handlers': {}}
+    for name in names:
+        requests = len(latencies[name])
+        if not requests:
+            continue
+        report['handlers'][name] = {
+            'requests': requests,
+            'statusCodes': {str(code): count for code, count in statuses[name].items()},
+            'p50Ms': round(percentile(latencies[name], 0.50), 2),
+            'p95Ms': round(percentile(latencies[name], 0.95), 2),
+            'p99Ms': round(percentile(latencies[name], 0.99), 2),
+            'meanMs': round(sum(latencies[name]) / requests, 2),
+            'dynamodbCalls': meters[name].calls,
+            'callsPerRequest': round(meters[name].calls / requests, 2),
+            'consumedCapacity': round(meters[name].capacity, 1),
+            'capacityPerRequest': round(meters[name].capacity / requests, 2)
+        }
+    return report
+
+
+def print_report(report, previous=None):
+    print(f"\n{report['images']} images: {report['throughput']} req/s (seeded in {report['seedSeconds']} s)")
+    print(f"{'handler':<18} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'calls/req':>9} {'RCU+WCU/req':>11} {'p95 vs prev':>11}")
+    for name, stats in report['handlers'].items():
+        change = ''
+        before = (previous or {}).get('handlers', {}).get(name)
+        if before and before.get('p95Ms'):
+            change = f"{(stats['p95Ms'] / before['p95Ms'] - 1) * 100:+.0f}%"
+        print(f"{name:<18} {stats['requests']:>5} {stats['p50Ms']:>8.2f} {stats['p95Ms']:>8.2f} {stats['p99Ms']:>8.2f} "
+              f"{stats['callsPerRequest']:>9.2f} {stats['capacityPerRequest']:>11.2f} {change:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000', help='catalog sizes, e.g. 10000,100000,1000000')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated network latency per DynamoDB call')
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--endpoint-url', help='local AWS endpoint serving DynamoDB and S3 (LocalStack, moto_server)')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='earlier results file to compare p95 against')
+    parser.add_argument('--traces', help='append the per-request trace lines to this file')
+    args = parser.parse_args()
+
+    mix = {}
+    for entry in args.mix.split(','):
+        name, weight = entry.split('=')
+        if name not in HANDLERS:
+            parser.error(f'unknown handler {name}; choose from {", ".join(HANDLERS)}')
+        mix[name] = float(weight)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {catalog['images']: catalog for catalog in json.load(f)['catalogs']}
+
+    catalogs = []
+    for size in [int(size) for size in args.sizes.split(',')]:
+        if args.endpoint_url:
+            # Handlers create their clients at import; point all of them at the endpoint
+            os.environ['AWS_ENDPOINT_URL'] = args.endpoint_url
+            report = run_catalog(size, args, mix)
+        else:
+            from moto import mock_aws
+            with mock_aws():
+                report = run_catalog(size, args, mix)
+        print_report(report, previous.get(size))
+        catalogs.append(report)
+
+    results = {
+        'generatedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'traces')},
+        'catalogs': catalogs
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
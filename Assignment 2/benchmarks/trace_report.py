@@ -0,0 +1,73 @@
+# trace_report.py
+# Summarizes the {"trace": ...} lines the query Lambdas log (one per
+# request, see pixtag/tracing.py) to show which queries are expensive.
+# Feed it CloudWatch log exports or the file run_benchmarks.py --traces
+# writes. Groups requests by handler and tag combination and ranks the
+# groups by total time.
+# Usage: python trace_report.py traces.log [more.log ...] [--top 20]
+#        aws logs tail /aws/lambda/find_by_tags | python trace_report.py -
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+
+def read_traces(paths):
+    for path in paths:
+        f = sys.stdin if path == '-' else open(path)
+        with f:
+            for line in f:
+                start = line.find('{"trace"')
+                if start < 0:
+                    continue
+                try:
+                    yield json.loads(line[start:])['trace']
+                except ValueError:
+                    continue
+
+
+def query_key(trace):
+    query = trace.get('query')
+    if not query:
+        return trace['handler'], '-'
+    return trace['handler'], ','.join(f'{tag}>={count}' for tag, count in sorted(query.items()))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='+', help="log files, or - for stdin")
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    groups = defaultdict(list)
+    for trace in read_traces(args.paths):
+        groups[query_key(trace)].append(trace)
+    if not groups:
+        sys.exit('No trace lines found')
+
+    rows = []
+    for (handler, query), traces in groups.items():
+        durations = [trace['ms'] for trace in traces]
+        calls = sum(stats['calls'] for trace in traces for stats in trace['dynamodb'].values())
+        capacity = sum(stats['capacity'] for trace in traces for stats in trace['dynamodb'].values())
+        read = sum(trace['counters'].get('candidates.read', 0) for trace in traces)
+        matched = sum(trace['counters'].get('candidates.matched', 0) for trace in traces)
+        errors = sum(1 for trace in traces if trace.get('error'))
+        rows.append((sum(durations), handler, query, len(traces), percentile(durations, 0.5),
+                     percentile(durations, 0.95), calls / len(traces), capacity / len(traces),
+                     f'{matched / read:.0%}' if read else '-', errors))
+
+    print(f"{'handler':<18} {'query':<32} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'calls':>6} {'RCU+WCU':>8} {'kept':>5} {'errors':>6}")
+    for _, handler, query, n, p50, p95, calls, capacity, kept, errors in sorted(rows, reverse=True)[:args.top]:
+        print(f"{handler:<18} {query[:32]:<32} {n:>5} {p50:>8.1f} {p95:>8.1f} "
+              f"{calls:>6.1f} {capacity:>8.1f} {kept:>5} {errors:>6}")
+
+
+if __name__ == '__main__':
+    main()
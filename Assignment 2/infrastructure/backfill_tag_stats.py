@@ -0,0 +1,86 @@
+# backfill_tag_stats.py
+# Rebuilds the per-tag image counters in assignment2-tag-stats from
+# assignment2-tag-index, plus the catalog-wide image count kept under
+# '#catalog'. Run once after creating the stats table, or any time the
+# counters drift. Counters of tags that no longer have any rows are
+# zeroed rather than deleted, so their version stamp and shard layout
+# survive.
+import os
+import sys
+from collections import Counter
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from pixtag.shards import logical_tag
+
+
+def backfill_tag_stats(region='us-east-1'):
+    dynamodb = boto3.resource('dynamodb', region_name=region)
+    images_table = dynamodb.Table('assignment2-images')
+    tag_index_table = dynamodb.Table('assignment2-tag-index')
+    stats_table = dynamodb.Table('assignment2-tag-stats')
+
+    print("Counting images per tag...")
+    counts = Counter()
+    kwargs = {'ProjectionExpression': 'tag'}
+    while True:
+        response = tag_index_table.scan(**kwargs)
+        # Rows of a sharded tag count towards the tag, not their shard;
+        # '#'-prefixed partitions are bookkeeping (the change journal)
+        counts.update(
+            logical_tag(item['tag']) for item in response['Items'] if not item['tag'].startswith('#')
+        )
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    print("Counting images...")
+    catalog_count = 0
+    kwargs = {'Select': 'COUNT'}
+    while True:
+        response = images_table.scan(**kwargs)
+        catalog_count += response['Count']
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    stats_table.update_item(
+        Key={'tag': '#catalog'},
+        UpdateExpression='SET imageCount = :count',
+        ExpressionAttributeValues={':count': catalog_count}
+    )
+
+    # SET rather than put_item so each tag's version stamp survives
+    for tag, image_count in counts.items():
+        stats_table.update_item(
+            Key={'tag': tag},
+            UpdateExpression='SET imageCount = :count',
+            ExpressionAttributeValues={':count': image_count}
+        )
+
+    print("Zeroing counters of tags with no rows...")
+    stale = []
+    kwargs = {'ProjectionExpression': 'tag, imageCount'}
+    while True:
+        response = stats_table.scan(**kwargs)
+        # '#catalog', '#snapshot' and the like aren't tags
+        stale.extend(
+            item['tag'] for item in response['Items']
+            if not item['tag'].startswith('#') and item['tag'] not in counts and item.get('imageCount', 0) != 0
+        )
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    for tag in stale:
+        stats_table.update_item(
+            Key={'tag': tag},
+            UpdateExpression='SET imageCount = :zero',
+            ExpressionAttributeValues={':zero': 0}
+        )
+
+    print(f"✅ Wrote counters for {len(counts)} tags and {catalog_count} images, zeroed {len(stale)}")
+    return counts
+
+
+if __name__ == "__main__":
+    backfill_tag_stats()
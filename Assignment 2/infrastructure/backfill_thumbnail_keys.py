@@ -0,0 +1,88 @@
+# backfill_thumbnail_keys.py
+# Adds the thumbnailKey-index GSI to assignment2-images and fills in
+# thumbnailKey (the S3 key of the thumbnail) on rows that only have
+# thumbnailUrl, so any thumbnail URL can be resolved to its image.
+import os
+import sys
+import time
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from pixtag.urls import THUMBNAIL_KEY_INDEX, parse_s3_url
+
+TABLE_NAME = 'assignment2-images'
+
+
+def add_thumbnail_key_index(client):
+    """Create the thumbnailKey GSI and wait until it can be queried"""
+    table = client.describe_table(TableName=TABLE_NAME)['Table']
+    indexes = [index['IndexName'] for index in table.get('GlobalSecondaryIndexes', [])]
+
+    if THUMBNAIL_KEY_INDEX not in indexes:
+        client.update_table(
+            TableName=TABLE_NAME,
+            AttributeDefinitions=[{'AttributeName': 'thumbnailKey', 'AttributeType': 'S'}],
+            GlobalSecondaryIndexUpdates=[{
+                'Create': {
+                    'IndexName': THUMBNAIL_KEY_INDEX,
+                    'KeySchema': [{'AttributeName': 'thumbnailKey', 'KeyType': 'HASH'}],
+                    'Projection': {'ProjectionType': 'KEYS_ONLY'}
+                }
+            }]
+        )
+        print(f"   ✅ Requested {THUMBNAIL_KEY_INDEX}")
+    else:
+        print(f"   ⚠️  {THUMBNAIL_KEY_INDEX} already exists")
+
+    while True:
+        table = client.describe_table(TableName=TABLE_NAME)['Table']
+        status = next(
+            index['IndexStatus'] for index in table.get('GlobalSecondaryIndexes', [])
+            if index['IndexName'] == THUMBNAIL_KEY_INDEX
+        )
+        if status == 'ACTIVE':
+            return
+        print(f"   ⏳ {THUMBNAIL_KEY_INDEX} is {status}...")
+        time.sleep(10)
+
+
+def backfill_thumbnail_keys(client):
+    updated = 0
+    kwargs = {
+        'TableName': TABLE_NAME,
+        'ProjectionExpression': 'imageId, thumbnailUrl, thumbnailKey'
+    }
+    while True:
+        response = client.scan(**kwargs)
+        for item in response['Items']:
+            if 'thumbnailKey' in item or 'thumbnailUrl' not in item:
+                continue
+            try:
+                key = parse_s3_url(item['thumbnailUrl']).key
+            except ValueError:
+                print(f"   ⚠️  Skipping {item['imageId']}: {item['thumbnailUrl']}")
+                continue
+            try:
+                client.update_item(
+                    TableName=TABLE_NAME,
+                    Key={'imageId': item['imageId']},
+                    UpdateExpression='SET thumbnailKey = :key',
+                    ConditionExpression='attribute_exists(imageId)',
+                    ExpressionAttributeValues={':key': key}
+                )
+                updated += 1
+            except client.exceptions.ConditionalCheckFailedException:
+                pass
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    print(f"   ✅ Backfilled thumbnailKey on {updated} rows")
+    return updated
+
+
+if __name__ == "__main__":
+    client = boto3.resource('dynamodb', region_name='us-east-1').meta.client
+    print("\nAdding thumbnail key lookups to assignment2-images...")
+    add_thumbnail_key_index(client)
+    backfill_thumbnail_keys(client)
@@ -0,0 +1,155 @@
+# migrate_tag_count_index.py
+# Moves an existing assignment2-tag-index to the count-ordered layout:
+#   1. adds the tag-count-index GSI (tag, countKey) if it is missing
+#   2. backfills countKey on every row written before the change
+# and can measure the read cost of a minimum-count query before/after.
+#
+# Usage:
+#   python migrate_tag_count_index.py
+#   python migrate_tag_count_index.py --measure person --min-count 5
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from pixtag.tag_index import COUNT_INDEX, count_key
+
+TABLE_NAME = 'assignment2-tag-index'
+
+
+def add_count_index(client):
+    """Create the count GSI and wait until it can be queried"""
+    table = client.describe_table(TableName=TABLE_NAME)['Table']
+    indexes = [index['IndexName'] for index in table.get('GlobalSecondaryIndexes', [])]
+
+    if COUNT_INDEX not in indexes:
+        client.update_table(
+            TableName=TABLE_NAME,
+            AttributeDefinitions=[
+                {'AttributeName': 'tag', 'AttributeType': 'S'},
+                {'AttributeName': 'countKey', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexUpdates=[{
+                'Create': {
+                    'IndexName': COUNT_INDEX,
+                    'KeySchema': [
+                        {'AttributeName': 'tag', 'KeyType': 'HASH'},
+                        {'AttributeName': 'countKey', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'KEYS_ONLY'}
+                }
+            }]
+        )
+        print(f"   ✅ Requested {COUNT_INDEX}")
+    else:
+        print(f"   ⚠️  {COUNT_INDEX} already exists")
+
+    while True:
+        table = client.describe_table(TableName=TABLE_NAME)['Table']
+        status = next(
+            index['IndexStatus'] for index in table.get('GlobalSecondaryIndexes', [])
+            if index['IndexName'] == COUNT_INDEX
+        )
+        if status == 'ACTIVE':
+            return
+        print(f"   ⏳ {COUNT_INDEX} is {status}...")
+        time.sleep(10)
+
+
+def _backfill_segment(client, segment, total_segments):
+    updated = 0
+    kwargs = {
+        'TableName': TABLE_NAME,
+        'Segment': segment,
+        'TotalSegments': total_segments
+    }
+    while True:
+        response = client.scan(**kwargs)
+        for item in response['Items']:
+            expected = count_key(item.get('count', 1), item['imageId'])
+            # Change-journal rows ('#journal#...') stay out of the count index
+            if item.get('countKey') == expected or item['tag'].startswith('#'):
+                continue
+            try:
+                # Don't bring back rows deleted while the scan was running
+                client.update_item(
+                    TableName=TABLE_NAME,
+                    Key={'tag': item['tag'], 'imageId': item['imageId']},
+                    UpdateExpression='SET countKey = :key',
+                    ConditionExpression='attribute_exists(imageId)',
+                    ExpressionAttributeValues={':key': expected}
+                )
+                updated += 1
+            except client.exceptions.ConditionalCheckFailedException:
+                pass
+        if 'LastEvaluatedKey' not in response:
+            return updated
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def backfill_count_keys(client, total_segments=8):
+    """Parallel scan that writes countKey on rows that lack it"""
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        futures = [
+            executor.submit(_backfill_segment, client, segment, total_segments)
+            for segment in range(total_segments)
+        ]
+        updated = sum(future.result() for future in futures)
+    print(f"   ✅ Backfilled countKey on {updated} rows")
+    return updated
+
+
+def _run_query(client, **kwargs):
+    read, items, capacity = 0, [], 0.0
+    while True:
+        response = client.query(ReturnConsumedCapacity='TOTAL', **kwargs)
+        read += response['Count']
+        items.extend(response['Items'])
+        capacity += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
+        if 'LastEvaluatedKey' not in response:
+            return read, items, capacity
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def measure_count_query(client, tag, min_count):
+    """Compare items read and RCU of the old Python filter with the GSI range"""
+    read, items, before = _run_query(
+        client,
+        TableName=TABLE_NAME,
+        KeyConditionExpression=Key('tag').eq(tag)
+    )
+    kept = [item for item in items if item.get('count', 1) >= min_count]
+    print(f"   Before: read {read} rows, kept {len(kept)}, {before:.1f} RCU")
+
+    read, items, after = _run_query(
+        client,
+        TableName=TABLE_NAME,
+        IndexName=COUNT_INDEX,
+        KeyConditionExpression=Key('tag').eq(tag) & Key('countKey').gte(count_key(min_count, ''))
+    )
+    print(f"   After:  read {read} rows, kept {len(items)}, {after:.1f} RCU")
+    return before, after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--region', default='us-east-1')
+    parser.add_argument('--measure', metavar='TAG')
+    parser.add_argument('--min-count', type=int, default=2)
+    args = parser.parse_args()
+
+    # The resource's client takes plain Python values instead of {'S': ...}
+    client = boto3.resource('dynamodb', region_name=args.region).meta.client
+
+    if args.measure:
+        print(f"\nMeasuring tags={args.measure}&counts={args.min_count}...")
+        measure_count_query(client, args.measure, args.min_count)
+    else:
+        print("\nMigrating assignment2-tag-index to the count layout...")
+        add_count_index(client)
+        backfill_count_keys(client)
@@ -1,10 +1,95 @@
 # setup_assignment2.py
 import boto3
 import json
+import random
 import secrets
 import string
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+REGION = 'us-east-1'
+CONFIG_FILE = 'assignment2_config.json'
+LAMBDA_ROLE = 'assignment2-lambda-role'
+# Seconds between checks while a table or index is being built
+POLL_DELAY = 5
+
+# Buckets by role. Names get a random suffix the first time and are
+# reused from CONFIG_FILE after that, so the setup can be run again.
+BUCKET_PREFIXES = {
+    'full_images': 'assignment2-images',
+    'thumbnails': 'assignment2-thumbnails',
+    # Tag bitmap snapshots for Find by Tags (SNAPSHOT_BUCKET), private
+    'snapshots': 'assignment2-snapshots'
+}
+
+LAMBDA_POLICIES = [
+    'arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole',
+    # Lets stream-triggered Lambdas read the images table's stream
+    'arn:aws:iam::aws:policy/service-role/AWSLambdaDynamoDBExecutionRole',
+    'arn:aws:iam::aws:policy/AmazonS3FullAccess',
+    'arn:aws:iam::aws:policy/AmazonDynamoDBFullAccess'
+]
+
+# Every table the Lambdas use, with the indexes their queries need.
+# Existing tables are brought up to date instead of being recreated.
+TABLES = [
+    {
+        'TableName': 'assignment2-images',
+        'KeySchema': [{'AttributeName': 'imageId', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [
+            {'AttributeName': 'imageId', 'AttributeType': 'S'},
+            {'AttributeName': 'thumbnailKey', 'AttributeType': 'S'}
+        ],
+        # Resolves thumbnail URLs whose key isn't thumb/<imageId>.<ext>
+        'GlobalSecondaryIndexes': [{
+            'IndexName': 'thumbnailKey-index',
+            'KeySchema': [{'AttributeName': 'thumbnailKey', 'KeyType': 'HASH'}],
+            'Projection': {'ProjectionType': 'KEYS_ONLY'}
+        }],
+        # Every tag change with the tags before and after, so the tag
+        # index can be maintained asynchronously from the stream
+        'StreamSpecification': {'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'}
+    },
+    {
+        'TableName': 'assignment2-tag-index',
+        'KeySchema': [
+            {'AttributeName': 'tag', 'KeyType': 'HASH'},
+            {'AttributeName': 'imageId', 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'tag', 'AttributeType': 'S'},
+            {'AttributeName': 'imageId', 'AttributeType': 'S'},
+            {'AttributeName': 'countKey', 'AttributeType': 'S'}
+        ],
+        # countKey = zero-padded count + '#' + imageId, so minimum
+        # count queries are key ranges
+        'GlobalSecondaryIndexes': [{
+            'IndexName': 'tag-count-index',
+            'KeySchema': [
+                {'AttributeName': 'tag', 'KeyType': 'HASH'},
+                {'AttributeName': 'countKey', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'KEYS_ONLY'}
+        }],
+        # Journal rows (#journal#<tag>) expire if no snapshot trims them;
+        # index rows have no expires attribute and are kept
+        'TimeToLiveSpecification': {'AttributeName': 'expires', 'Enabled': True}
+    },
+    {
+        # Per-tag image counters used to plan multi-tag queries
+        'TableName': 'assignment2-tag-stats',
+        'KeySchema': [{'AttributeName': 'tag', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [{'AttributeName': 'tag', 'AttributeType': 'S'}]
+    },
+    {
+        # YOLO results keyed by SHA-256 of the image bytes
+        'TableName': 'assignment2-detection-cache',
+        'KeySchema': [{'AttributeName': 'contentHash', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [{'AttributeName': 'contentHash', 'AttributeType': 'S'}]
+    }
+]
+
 def setup_assignment2_team():
     """
     Setup AWS infrastructure for Assignment 2 - PixTag Project
@@ -98,110 +183,196 @@ def setup_assignment2_team():
     
     return credentials
 
-def create_assignment2_resources():
+def _bucket_exists(s3, bucket_name):
+    try:
+        s3.head_bucket(Bucket=bucket_name)
+        return True
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchBucket'):
+            return False
+        raise
+
+def ensure_bucket(s3, bucket_type, bucket_name):
     """
-    Create all AWS resources for Assignment 2
+    Create a bucket unless it exists, wait for it, then apply the
+    settings for its role (safe to repeat). Returns the actions taken.
     """
-    print("\n" + "="*50)
-    print("Creating Assignment 2 AWS Resources")
-    print("="*50 + "\n")
-    
-    import random
-    
-    s3 = boto3.client('s3', region_name='us-east-1')
-    dynamodb = boto3.client('dynamodb', region_name='us-east-1')
-    iam = boto3.client('iam')
-    
-    # Unique suffix for S3 buckets
-    suffix = random.randint(1000, 9999)
-    
-    config = {
-        'project': 'Assignment 2 - PixTag',
-        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'region': 'us-east-1'
-    }
-    
-    # 1. Create S3 Buckets
-    print("1️⃣ Creating S3 Buckets...")
-    buckets = {
-        'full_images': f'assignment2-images-{suffix}',
-        'thumbnails': f'assignment2-thumbnails-{suffix}'
-    }
-    
-    for bucket_type, bucket_name in buckets.items():
-        try:
-            s3.create_bucket(Bucket=bucket_name)
-            print(f"   ✅ Created: {bucket_name}")
-            
-            if 'thumbnails' in bucket_name:
-                # Make thumbnails public
-                s3.put_public_access_block(
-                    Bucket=bucket_name,
-                    PublicAccessBlockConfiguration={
-                        'BlockPublicAcls': False,
-                        'IgnorePublicAcls': False,
-                        'BlockPublicPolicy': False,
-                        'RestrictPublicBuckets': False
-                    }
-                )
-                
-                policy = {
-                    "Version": "2012-10-17",
-                    "Statement": [{
-                        "Effect": "Allow",
-                        "Principal": "*",
-                        "Action": "s3:GetObject",
-                        "Resource": f"arn:aws:s3:::{bucket_name}/*"
-                    }]
-                }
-                
-                s3.put_bucket_policy(
-                    Bucket=bucket_name,
-                    Policy=json.dumps(policy)
-                )
-                print(f"   ✅ Made {bucket_name} public")
-                
-        except Exception as e:
-            print(f"   ❌ Error: {e}")
-    
-    config['s3_buckets'] = buckets
-    
-    # 2. Create DynamoDB Tables
-    print("\n2️⃣ Creating DynamoDB Tables...")
-    tables_config = [
-        {
-            'TableName': 'assignment2-images',
-            'KeySchema': [{'AttributeName': 'imageId', 'KeyType': 'HASH'}],
-            'AttributeDefinitions': [{'AttributeName': 'imageId', 'AttributeType': 'S'}]
-        },
-        {
-            'TableName': 'assignment2-tag-index',
-            'KeySchema': [
-                {'AttributeName': 'tag', 'KeyType': 'HASH'},
-                {'AttributeName': 'imageId', 'KeyType': 'RANGE'}
-            ],
-            'AttributeDefinitions': [
-                {'AttributeName': 'tag', 'AttributeType': 'S'},
-                {'AttributeName': 'imageId', 'AttributeType': 'S'}
-            ]
+    actions = []
+    if not _bucket_exists(s3, bucket_name):
+        kwargs = {'Bucket': bucket_name}
+        if s3.meta.region_name != 'us-east-1':
+            kwargs['CreateBucketConfiguration'] = {'LocationConstraint': s3.meta.region_name}
+        s3.create_bucket(**kwargs)
+        actions.append('created')
+    s3.get_waiter('bucket_exists').wait(Bucket=bucket_name, WaiterConfig={'Delay': POLL_DELAY})
+
+    if bucket_type == 'thumbnails':
+        # Make thumbnails public
+        s3.put_public_access_block(
+            Bucket=bucket_name,
+            PublicAccessBlockConfiguration={
+                'BlockPublicAcls': False,
+                'IgnorePublicAcls': False,
+                'BlockPublicPolicy': False,
+                'RestrictPublicBuckets': False
+            }
+        )
+        policy = {
+            "Version": "2012-10-17",
+            "Statement": [{
+                "Effect": "Allow",
+                "Principal": "*",
+                "Action": "s3:GetObject",
+                "Resource": f"arn:aws:s3:::{bucket_name}/*"
+            }]
         }
-    ]
-    
-    for table in tables_config:
+        s3.put_bucket_policy(Bucket=bucket_name, Policy=json.dumps(policy))
+        actions.append('public')
+    elif bucket_type == 'full_images':
+        # Browsers upload multipart parts straight to this bucket
+        # and need to read each part's ETag
+        s3.put_bucket_cors(
+            Bucket=bucket_name,
+            CORSConfiguration={'CORSRules': [{
+                'AllowedOrigins': ['*'],
+                'AllowedMethods': ['PUT', 'GET'],
+                'AllowedHeaders': ['*'],
+                'ExposeHeaders': ['ETag'],
+                'MaxAgeSeconds': 3600
+            }]}
+        )
+        actions.append('browser uploads')
+        # Big Find by image queries are staged under query-images/ for the
+        # YOLO Lambda and deleted after; expire any that are left behind
+        s3.put_bucket_lifecycle_configuration(
+            Bucket=bucket_name,
+            LifecycleConfiguration={'Rules': [{
+                'ID': 'expire-query-images',
+                'Filter': {'Prefix': 'query-images/'},
+                'Status': 'Enabled',
+                'Expiration': {'Days': 1}
+            }]}
+        )
+        actions.append('query image expiry')
+    else:
+        s3.put_public_access_block(
+            Bucket=bucket_name,
+            PublicAccessBlockConfiguration={
+                'BlockPublicAcls': True,
+                'IgnorePublicAcls': True,
+                'BlockPublicPolicy': True,
+                'RestrictPublicBuckets': True
+            }
+        )
+        actions.append('private')
+    return actions
+
+def _stream_of(specification):
+    if not specification or not specification.get('StreamEnabled'):
+        return None
+    return specification['StreamViewType']
+
+def table_updates(table, spec):
+    """
+    The UpdateTable requests, as (kwargs, description), that bring a
+    described table in line with spec. DynamoDB takes one index or stream
+    change per request, so each is separate. Indexes and streams the
+    table has but spec doesn't are left alone; kwargs is None for a
+    difference that has to be fixed by hand.
+    """
+    updates = []
+    billing = table.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED')
+    if billing != 'PAY_PER_REQUEST':
+        updates.append(({'BillingMode': 'PAY_PER_REQUEST'}, 'switched to on-demand'))
+
+    existing = set(index['IndexName'] for index in table.get('GlobalSecondaryIndexes', []))
+    definitions = {attribute['AttributeName']: attribute for attribute in spec['AttributeDefinitions']}
+    for index in spec.get('GlobalSecondaryIndexes', []):
+        if index['IndexName'] in existing:
+            continue
+        names = sorted(set(key['AttributeName'] for key in index['KeySchema']))
+        updates.append(({
+            'AttributeDefinitions': [definitions[name] for name in names],
+            'GlobalSecondaryIndexUpdates': [{'Create': index}]
+        }, f"added {index['IndexName']}"))
+
+    current = _stream_of(table.get('StreamSpecification'))
+    wanted = _stream_of(spec.get('StreamSpecification'))
+    if wanted and not current:
+        updates.append(({'StreamSpecification': spec['StreamSpecification']}, f'enabled {wanted} stream'))
+    elif wanted and current != wanted:
+        # A view type can't change in place, and a new stream gets a new
+        # ARN that every consumer would have to be moved to
+        updates.append((None, f'⚠️  kept {current} stream, {wanted} wanted: replace it by hand'))
+    return updates
+
+def wait_for_table(dynamodb, table_name):
+    """Wait until the table and every index on it are ACTIVE; returns its description"""
+    dynamodb.get_waiter('table_exists').wait(TableName=table_name, WaiterConfig={'Delay': POLL_DELAY})
+    while True:
+        table = dynamodb.describe_table(TableName=table_name)['Table']
+        statuses = [table['TableStatus']] + [index['IndexStatus'] for index in table.get('GlobalSecondaryIndexes', [])]
+        if all(status == 'ACTIVE' for status in statuses):
+            return table
+        time.sleep(POLL_DELAY)
+
+def ensure_time_to_live(dynamodb, table_name, specification):
+    """Turn on TTL as in specification unless it already is; returns the actions taken"""
+    current = dynamodb.describe_time_to_live(TableName=table_name)['TimeToLiveDescription']
+    if current.get('TimeToLiveStatus') in ('ENABLED', 'ENABLING'):
+        if current.get('AttributeName') == specification['AttributeName']:
+            return []
+        # TTL can't move to another attribute in place
+        return [f"⚠️  kept TTL on {current.get('AttributeName')}, {specification['AttributeName']} wanted: change it by hand"]
+    dynamodb.update_time_to_live(TableName=table_name, TimeToLiveSpecification=specification)
+    return [f"enabled TTL on {specification['AttributeName']}"]
+
+def ensure_table(dynamodb, spec):
+    """
+    Create the table in spec, or bring the existing one up to it.
+    Returns (actions taken, table description) once everything is ACTIVE.
+    """
+    table_name = spec['TableName']
+    # Not a CreateTable parameter; set with its own call once the table is up
+    time_to_live = spec.get('TimeToLiveSpecification')
+    create = {key: value for key, value in spec.items() if key != 'TimeToLiveSpecification'}
+    try:
+        table = dynamodb.describe_table(TableName=table_name)['Table']
+    except dynamodb.exceptions.ResourceNotFoundException:
+        dynamodb.create_table(**create, BillingMode='PAY_PER_REQUEST')
+        actions = ['created']
+    else:
+        if table['KeySchema'] != spec['KeySchema']:
+            raise ValueError(f"{table_name} has a different key schema; it has to be recreated by hand")
+        actions = []
+        for update, description in table_updates(table, spec):
+            actions.append(description)
+            if update is None:
+                continue
+            wait_for_table(dynamodb, table_name)
+            dynamodb.update_table(TableName=table_name, **update)
+    table = wait_for_table(dynamodb, table_name)
+    if time_to_live:
+        actions += ensure_time_to_live(dynamodb, table_name, time_to_live)
+    return actions, table
+
+def ensure_tables(dynamodb, tables=TABLES):
+    """
+    ensure_table for every table at once; returns {name: (actions,
+    description)}, with the exception instead for a table that failed
+    """
+    with ThreadPoolExecutor(max_workers=len(tables)) as executor:
+        futures = {table['TableName']: executor.submit(ensure_table, dynamodb, table) for table in tables}
+    results = {}
+    for name, future in futures.items():
         try:
-            dynamodb.create_table(
-                **table,
-                BillingMode='PAY_PER_REQUEST'
-            )
-            print(f"   ✅ Created: {table['TableName']}")
-        except dynamodb.exceptions.ResourceInUseException:
-            print(f"   ⚠️  Table {table['TableName']} already exists")
-    
-    config['dynamodb_tables'] = ['assignment2-images', 'assignment2-tag-index']
-    
-    # 3. Create Lambda Role
-    print("\n3️⃣ Creating Lambda Execution Role...")
-    
+            results[name] = future.result()
+        except Exception as e:
+            results[name] = e
+    return results
+
+def ensure_lambda_role(iam):
+    """The Lambda execution role with every policy attached; returns its ARN"""
     trust_policy = {
         "Version": "2012-10-17",
         "Statement": [{
@@ -210,38 +381,104 @@ def create_assignment2_resources():
             "Action": "sts:AssumeRole"
         }]
     }
-    
     try:
-        role = iam.create_role(
-            RoleName='assignment2-lambda-role',
-            AssumeRolePolicyDocument=json.dumps(trust_policy)
-        )
-        
-        policies = [
-            'arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole',
-            'arn:aws:iam::aws:policy/AmazonS3FullAccess',
-            'arn:aws:iam::aws:policy/AmazonDynamoDBFullAccess'
-        ]
-        
-        for policy_arn in policies:
-            iam.attach_role_policy(
-                RoleName='assignment2-lambda-role',
-                PolicyArn=policy_arn
-            )
-        
-        config['lambda_role_arn'] = role['Role']['Arn']
-        print(f"   ✅ Created: assignment2-lambda-role")
-        
+        role = iam.create_role(RoleName=LAMBDA_ROLE, AssumeRolePolicyDocument=json.dumps(trust_policy))
     except iam.exceptions.EntityAlreadyExistsException:
-        print(f"   ⚠️  Lambda role already exists")
-        role = iam.get_role(RoleName='assignment2-lambda-role')
-        config['lambda_role_arn'] = role['Role']['Arn']
-    
-    # Save configuration
-    config_file = 'assignment2_config.json'
+        role = iam.get_role(RoleName=LAMBDA_ROLE)
+    # Attaching an attached policy is a no-op, so newer policies reach old roles
+    for policy_arn in LAMBDA_POLICIES:
+        iam.attach_role_policy(RoleName=LAMBDA_ROLE, PolicyArn=policy_arn)
+    return role['Role']['Arn']
+
+def _load_config(config_file):
+    try:
+        with open(config_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def bucket_names(previous):
+    """Bucket names from an earlier config, new ones sharing its suffix"""
+    known = previous.get('s3_buckets', {})
+    suffixes = [name.rsplit('-', 1)[1] for name in known.values()]
+    suffix = suffixes[0] if suffixes else str(random.randint(1000, 9999))
+    return {
+        bucket_type: known.get(bucket_type) or f'{prefix}-{suffix}'
+        for bucket_type, prefix in BUCKET_PREFIXES.items()
+    }
+
+def create_assignment2_resources(s3=None, dynamodb=None, iam=None, config_file=CONFIG_FILE):
+    """
+    Create or update all AWS resources for Assignment 2: buckets, tables
+    and the Lambda role are provisioned concurrently, and the config is
+    only written once every table and index is ACTIVE. Safe to run again:
+    existing resources are diffed and updated in place. Clients can be
+    passed in (e.g. under moto); returns the config.
+    """
+    print("\n" + "="*50)
+    print("Creating Assignment 2 AWS Resources")
+    print("="*50 + "\n")
+
+    s3 = s3 or boto3.client('s3', region_name=REGION)
+    dynamodb = dynamodb or boto3.client('dynamodb', region_name=REGION)
+    iam = iam or boto3.client('iam')
+
+    previous = _load_config(config_file)
+    buckets = bucket_names(previous)
+
+    with ThreadPoolExecutor(max_workers=len(buckets) + 2) as executor:
+        bucket_jobs = {
+            name: executor.submit(ensure_bucket, s3, bucket_type, name)
+            for bucket_type, name in buckets.items()
+        }
+        tables_job = executor.submit(ensure_tables, dynamodb)
+        role_job = executor.submit(ensure_lambda_role, iam)
+
+    errors = 0
+    print("1️⃣ S3 Buckets")
+    for name, job in bucket_jobs.items():
+        try:
+            print(f"   ✅ {name}: {', '.join(job.result())}")
+        except Exception as e:
+            errors += 1
+            print(f"   ❌ {name}: {e}")
+
+    print("\n2️⃣ DynamoDB Tables")
+    streams = {}
+    for name, result in tables_job.result().items():
+        if isinstance(result, Exception):
+            errors += 1
+            print(f"   ❌ {name}: {result}")
+            continue
+        actions, table = result
+        print(f"   ✅ {name}: {', '.join(actions) or 'up to date'}")
+        if table.get('LatestStreamArn') and _stream_of(table.get('StreamSpecification')):
+            streams[name] = table['LatestStreamArn']
+
+    print("\n3️⃣ Lambda Execution Role")
+    try:
+        role_arn = role_job.result()
+        print(f"   ✅ {LAMBDA_ROLE}")
+    except Exception as e:
+        errors += 1
+        print(f"   ❌ {LAMBDA_ROLE}: {e}")
+
+    if errors:
+        raise RuntimeError(f"{errors} resources failed; {config_file} was not written")
+
+    config = {
+        'project': 'Assignment 2 - PixTag',
+        'created': previous.get('created') or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'region': dynamodb.meta.region_name,
+        's3_buckets': buckets,
+        'dynamodb_tables': [table['TableName'] for table in TABLES],
+        'dynamodb_streams': streams,
+        'lambda_role_arn': role_arn
+    }
     with open(config_file, 'w') as f:
         json.dump(config, f, indent=2)
-    
+
     print("\n" + "="*50)
     print("✅ Assignment 2 Infrastructure Complete!")
     print("="*50)
@@ -251,7 +488,7 @@ def create_assignment2_resources():
     print("   Matthew: Create query Lambda functions")
     print("   Omar: Set up Cognito and API Gateway")
     print("\n⚠️  Share assignment2_config.json with your team!")
-    
+
     return config
 
 def test_assignment2_setup():
@@ -0,0 +1,11 @@
+"""
+Shared code for the Assignment 2 - PixTag Lambdas.
+
+Zip this folder as a Lambda layer (python/pixtag/...) and attach it to
+each function so the handlers can `import pixtag`.
+"""
+
+IMAGES_TABLE = 'assignment2-images'
+TAG_INDEX_TABLE = 'assignment2-tag-index'
+TAG_STATS_TABLE = 'assignment2-tag-stats'
+DETECTION_CACHE_TABLE = 'assignment2-detection-cache'
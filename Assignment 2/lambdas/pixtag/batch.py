@@ -0,0 +1,156 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+# DynamoDB limit for a single BatchGetItem request
+BATCH_GET_LIMIT = 100
+MAX_RETRIES = 8
+MAX_WORKERS = 8
+
+
+def chunked(items, size):
+    """Yield successive lists of at most `size` items, consuming lazily"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def backoff_delay(attempt, base=0.05, cap=2.0):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _projection(keys, attributes):
+    # Always project the key attributes so results can be matched back
+    names = list(keys[0].keys())
+    for attribute in attributes:
+        if attribute not in names:
+            names.append(attribute)
+    placeholders = {f'#p{i}': name for i, name in enumerate(names)}
+    return ', '.join(placeholders), placeholders
+
+
+def _get_chunk(client, table_name, keys, attributes):
+    request = {'Keys': keys}
+    if attributes:
+        expression, names = _projection(keys, attributes)
+        request['ProjectionExpression'] = expression
+        request['ExpressionAttributeNames'] = names
+
+    items = []
+    pending = {table_name: request}
+    for attempt in range(MAX_RETRIES + 1):
+        response = client.batch_get_item(RequestItems=pending)
+        items.extend(response['Responses'].get(table_name, []))
+
+        # Throttled keys come back in UnprocessedKeys and must be resent
+        pending = response.get('UnprocessedKeys') or {}
+        if not pending:
+            return items
+        if attempt < MAX_RETRIES:
+            time.sleep(backoff_delay(attempt))
+
+    raise RuntimeError(
+        f"{len(pending[table_name]['Keys'])} keys still unprocessed "
+        f"in {table_name} after {MAX_RETRIES} retries"
+    )
+
+
+def batch_get(client, table_name, keys, attributes=None, max_workers=MAX_WORKERS):
+    """
+    Fetch many items with BatchGetItem.
+    Keys are sent in chunks of 100, chunks run concurrently and
+    UnprocessedKeys are retried with backoff.
+    `client` must be a DynamoDB client that takes plain Python values,
+    e.g. boto3.resource('dynamodb').meta.client
+    """
+    # BatchGetItem rejects requests containing the same key twice
+    unique = {}
+    for key in keys:
+        unique.setdefault(tuple(sorted(key.items())), key)
+    keys = list(unique.values())
+    if not keys:
+        return []
+
+    chunks = list(chunked(keys, BATCH_GET_LIMIT))
+    if len(chunks) == 1:
+        return _get_chunk(client, table_name, chunks[0], attributes)
+
+    items = []
+    workers = min(max_workers, len(chunks))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_get_chunk, client, table_name, chunk, attributes)
+            for chunk in chunks
+        ]
+        for future in futures:
+            items.extend(future.result())
+    return items
+
+
+# DynamoDB limit for a single BatchWriteItem request
+BATCH_WRITE_LIMIT = 25
+
+
+def put_request(item):
+    return {'PutRequest': {'Item': item}}
+
+
+def delete_request(key):
+    return {'DeleteRequest': {'Key': key}}
+
+
+def _write_chunk(client, table_name, requests):
+    pending = {table_name: requests}
+    for attempt in range(MAX_RETRIES + 1):
+        response = client.batch_write_item(RequestItems=pending)
+
+        pending = response.get('UnprocessedItems') or {}
+        if not pending:
+            return
+        if attempt < MAX_RETRIES:
+            time.sleep(backoff_delay(attempt))
+
+    raise RuntimeError(
+        f"{len(pending[table_name])} writes still unprocessed "
+        f"in {table_name} after {MAX_RETRIES} retries"
+    )
+
+
+def batch_write(client, table_name, requests, key_names, max_workers=MAX_WORKERS):
+    """
+    Apply put_request/delete_request entries with BatchWriteItem.
+    Requests are sent in chunks of 25, chunks run concurrently and
+    UnprocessedItems are retried with backoff. When the same key appears
+    more than once, the last request wins.
+    """
+    unique = {}
+    for request in requests:
+        if 'PutRequest' in request:
+            item = request['PutRequest']['Item']
+        else:
+            item = request['DeleteRequest']['Key']
+        key = tuple(item[name] for name in key_names)
+        unique.pop(key, None)
+        unique[key] = request
+    requests = list(unique.values())
+    if not requests:
+        return
+
+    chunks = list(chunked(requests, BATCH_WRITE_LIMIT))
+    if len(chunks) == 1:
+        _write_chunk(client, table_name, chunks[0])
+        return
+
+    workers = min(max_workers, len(chunks))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_write_chunk, client, table_name, chunk)
+            for chunk in chunks
+        ]
+        for future in futures:
+            future.result()
@@ -0,0 +1,457 @@
+import json
+import mmap
+import os
+import re
+import threading
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from heapq import merge
+
+from pixtag import TAG_INDEX_TABLE, TAG_STATS_TABLE, tracing
+from pixtag.cache import LRUCache
+from pixtag.journal import JOURNAL_PREFIX, JOURNAL_TTL, get_journals, get_published_since, now_ms
+from pixtag.shards import logical_tag
+from pixtag.stats import get_tag_shards
+from pixtag.tag_index import COUNT_WIDTH, count_key, encode_cursor
+from pixtag.versions import get_tag_versions
+
+# A snapshot holds the catalog's image ids, sorted, and per tag one
+# bitmap per distinct count c of the images with the tag at least c
+# times. Bit i stands for the i-th id, so set bits come out in imageId
+# order, the order the index is read in. Bitmaps are zlib-packed bit
+# strings and become Python ints in memory, whose &, | and ~ run word by
+# word in C: an AND over a million images is one pass over 125 KB.
+
+# Where query containers find the snapshot: downloaded from
+# s3://SNAPSHOT_BUCKET/SNAPSHOT_KEY when a bucket is set, else a file at
+# SNAPSHOT_PATH (e.g. on a mounted file system) only when that is set.
+# Either way it is only used once Build snapshot has marked it published.
+SNAPSHOT_BUCKET = os.environ.get('SNAPSHOT_BUCKET')
+SNAPSHOT_KEY = os.environ.get('SNAPSHOT_KEY', 'snapshots/tag-bitmaps.bin')
+SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH')
+# Where a container keeps the copy downloaded from the bucket
+DOWNLOAD_PATH = '/tmp/pixtag-tag-bitmaps.bin'
+# How often a warm container looks for a newer snapshot
+SNAPSHOT_CHECK_INTERVAL = float(os.environ.get('SNAPSHOT_CHECK_INTERVAL', '300'))
+# Journal rows this close to the start of a build may have been written
+# by a Lambda whose clock runs ahead; they are kept, not trimmed
+CLOCK_SKEW_MS = 60000
+SCAN_SEGMENTS = int(os.environ.get('SNAPSHOT_SCAN_SEGMENTS', '8'))
+
+MAGIC = b'PXTBMP1\n'
+_HEADER_SIZE = len(MAGIC) + 4
+_NONZERO = re.compile(rb'[^\x00]')
+
+# (snapshot since, tag, count) -> bitmap, sized in bytes
+BITMAP_CACHE = LRUCache(max_size=256 * 1024 * 1024, ttl=3600)
+
+_state = {'snapshot': None, 'checked': None, 'source': None, 'fixed': False}
+_lock = threading.Lock()
+
+
+class _IdTable:
+    """The sorted image ids of a snapshot as a sequence, read from the buffer"""
+
+    def __init__(self, buffer, offset, width, size):
+        self._buffer = buffer
+        self._offset = offset
+        self._width = width
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        start = self._offset + index * self._width
+        return bytes(self._buffer[start:start + self._width]).rstrip(b' ').decode()
+
+
+class Snapshot:
+    """
+    Read-only view of a snapshot in a buffer (an mmap of the file, or
+    bytes). Nothing is decoded up front: ids are looked up in place and
+    each bitmap is unpacked on first use.
+    """
+
+    def __init__(self, buffer):
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError('Not a tag bitmap snapshot')
+        header_size = int.from_bytes(buffer[len(MAGIC):_HEADER_SIZE], 'little')
+        header = json.loads(bytes(buffer[_HEADER_SIZE:_HEADER_SIZE + header_size]))
+        self._buffer = buffer
+        self._body = _HEADER_SIZE + header_size
+        self._levels = header['tags']
+        # Journal rows from `since` on are not (all) in this snapshot
+        self.since = header['since']
+        self.versions = header['versions']
+        self.size = header['images']
+        self.ids = _IdTable(buffer, self._body, header['idWidth'], self.size)
+
+    def ordinal(self, image_id):
+        index = bisect_left(self.ids, image_id)
+        if index < self.size and self.ids[index] == image_id:
+            return index
+        return None
+
+    def levels(self, tag, min_count=1):
+        """[(count, bitmap of images with the tag at least count times)] from min_count up"""
+        return [
+            (count, self._bitmap(tag, count, offset, length))
+            for count, offset, length in self._levels.get(tag, [])
+            if count >= min_count
+        ]
+
+    def at_least(self, tag, min_count):
+        for count, offset, length in self._levels.get(tag, []):
+            if count >= min_count:
+                return self._bitmap(tag, count, offset, length)
+        return 0
+
+    def _bitmap(self, tag, count, offset, length):
+        key = (self.since, tag, count)
+        bits = BITMAP_CACHE.get(key)
+        if bits is None:
+            start = self._body + offset
+            packed = zlib.decompress(self._buffer[start:start + length])
+            bits = int.from_bytes(packed, 'little')
+            BITMAP_CACHE.put(key, bits, size=max(len(packed), 1))
+            tracing.count('bitmaps.unpacked')
+        return bits
+
+
+def encode_snapshot(postings, versions, since):
+    """
+    Snapshot bytes for postings ({tag: {imageId: count}}), stamped with
+    the tag versions they were read under and the time from which
+    journal rows still have to be applied
+    """
+    ids = sorted(set(image_id for images in postings.values() for image_id in images))
+    ordinals = {image_id: ordinal for ordinal, image_id in enumerate(ids)}
+    width = max((len(image_id.encode()) for image_id in ids), default=0)
+
+    body = bytearray(b''.join(image_id.encode().ljust(width) for image_id in ids))
+    tags = {}
+    for tag, images in sorted(postings.items()):
+        by_count = {}
+        for image_id, count in images.items():
+            by_count.setdefault(count, []).append(ordinals[image_id])
+        # Built from the highest count down, each level adds to the last
+        bits = bytearray((len(ids) + 7) // 8)
+        levels = []
+        for count in sorted(by_count, reverse=True):
+            for ordinal in by_count[count]:
+                bits[ordinal >> 3] |= 1 << (ordinal & 7)
+            packed = zlib.compress(bytes(bits), 6)
+            levels.append([count, len(body), len(packed)])
+            body += packed
+        tags[tag] = levels[::-1]
+
+    header = json.dumps({
+        'since': since,
+        'versions': versions,
+        'images': len(ids),
+        'idWidth': width,
+        'tags': tags
+    }, separators=(',', ':')).encode()
+    return MAGIC + len(header).to_bytes(4, 'little') + header + bytes(body)
+
+
+def build_snapshot(client):
+    """
+    Read the whole tag index into a snapshot. Returns (snapshot bytes,
+    since, journal rows seen) for publish_snapshot and trim_journal.
+    """
+    since = now_ms() - CLOCK_SKEW_MS
+    # Versions first: a tag that moves during the scan must look changed
+    versions = _read_versions(client)
+    postings = {}
+    journal = []
+    with ThreadPoolExecutor(max_workers=SCAN_SEGMENTS) as executor:
+        for rows in executor.map(lambda segment: _scan_segment(client, segment), range(SCAN_SEGMENTS)):
+            for row in rows:
+                if row['tag'].startswith(JOURNAL_PREFIX):
+                    journal.append(row)
+                    continue
+                images = postings.setdefault(logical_tag(row['tag']), {})
+                # A row being moved between shards can be seen twice
+                images[row['imageId']] = max(images.get(row['imageId'], 0), int(row.get('count', 1)))
+    return encode_snapshot(postings, versions, since), since, journal
+
+
+def _read_versions(client):
+    versions = {}
+    kwargs = {
+        'TableName': TAG_STATS_TABLE,
+        'ProjectionExpression': '#t, version',
+        'ExpressionAttributeNames': {'#t': 'tag'},
+        'ConsistentRead': True
+    }
+    while True:
+        response = client.scan(**kwargs)
+        for item in response['Items']:
+            if not item['tag'].startswith('#'):
+                versions[item['tag']] = int(item.get('version', 0))
+        if 'LastEvaluatedKey' not in response:
+            return versions
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def _scan_segment(client, segment):
+    rows = []
+    kwargs = {
+        'TableName': TAG_INDEX_TABLE,
+        'ProjectionExpression': '#t, #i, #c, #a',
+        'ExpressionAttributeNames': {'#t': 'tag', '#i': 'imageId', '#c': 'count', '#a': 'at'},
+        'ConsistentRead': True,
+        'Segment': segment,
+        'TotalSegments': SCAN_SEGMENTS
+    }
+    while True:
+        response = client.scan(**kwargs)
+        rows.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return rows
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def publish_snapshot(data, s3_client=None):
+    """
+    Put a built snapshot where query containers load it from; returns
+    where. Raises RuntimeError when neither SNAPSHOT_BUCKET nor
+    SNAPSHOT_PATH is set, as no query container could see it.
+    """
+    if SNAPSHOT_BUCKET:
+        s3_client.put_object(Bucket=SNAPSHOT_BUCKET, Key=SNAPSHOT_KEY, Body=data)
+        return f's3://{SNAPSHOT_BUCKET}/{SNAPSHOT_KEY}'
+    if SNAPSHOT_PATH:
+        _replace_file(SNAPSHOT_PATH, [data])
+        return SNAPSHOT_PATH
+    raise RuntimeError('Set SNAPSHOT_BUCKET (or SNAPSHOT_PATH on a shared file system) to publish snapshots')
+
+
+def _replace_file(path, chunks):
+    # Containers keep reading the old file through their mmap
+    partial = f'{path}.part'
+    with open(partial, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(partial, path)
+
+
+def load_snapshot(path):
+    """Memory-map a snapshot file; pages are only read as they are used"""
+    with open(path, 'rb') as f:
+        return Snapshot(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def use_snapshot(snapshot):
+    """
+    Query with this snapshot and never look for another (benchmarks and
+    local runs); None goes back to loading from SNAPSHOT_BUCKET/PATH.
+    It is still only used while its `since` is the published one.
+    """
+    with _lock:
+        _state['snapshot'] = snapshot
+        _state['fixed'] = snapshot is not None
+        _state['checked'] = None
+        _state['source'] = None
+
+
+def current_snapshot():
+    """
+    The container's snapshot, None when there is none. Loaded on first
+    use and replaced when a newer one shows up, checked at most every
+    SNAPSHOT_CHECK_INTERVAL seconds.
+    """
+    with _lock:
+        now = time.monotonic()
+        checked = _state['checked']
+        if _state['fixed'] or (checked is not None and now - checked < SNAPSHOT_CHECK_INTERVAL):
+            return _state['snapshot']
+        _state['checked'] = now
+        try:
+            path, source = _fetch()
+            if source is not None and source != _state['source']:
+                started = time.perf_counter()
+                _state['snapshot'] = load_snapshot(path)
+                _state['source'] = source
+                tracing.annotate(snapshotLoadMs=round((time.perf_counter() - started) * 1000, 1))
+        except Exception as e:
+            # Queries still have the tag index
+            tracing.count('bitmaps.loadErrors')
+            print(f"Warning: could not load tag bitmap snapshot: {str(e)}")
+        return _state['snapshot']
+
+
+def _fetch():
+    """
+    Bring the newest snapshot to a local file; returns (path, identity),
+    identity None if there is none
+    """
+    if SNAPSHOT_BUCKET:
+        from pixtag import runtime
+        s3 = runtime.client('s3')
+        etag = s3.head_object(Bucket=SNAPSHOT_BUCKET, Key=SNAPSHOT_KEY)['ETag']
+        if etag != _state['source']:
+            body = s3.get_object(Bucket=SNAPSHOT_BUCKET, Key=SNAPSHOT_KEY)['Body']
+            _replace_file(DOWNLOAD_PATH, iter(lambda: body.read(1024 * 1024), b''))
+        return DOWNLOAD_PATH, etag
+    if not SNAPSHOT_PATH:
+        return None, None
+    try:
+        stat = os.stat(SNAPSHOT_PATH)
+    except FileNotFoundError:
+        return SNAPSHOT_PATH, None
+    return SNAPSHOT_PATH, (stat.st_ino, stat.st_mtime_ns)
+
+
+def find_images(client, tags_with_counts, driving_tag, page_size=None, start_key=None):
+    """
+    search.find_images from the bitmap snapshot plus the journal of what
+    changed since: same results, order and cursors, with the driving tag
+    deciding the order as it does there. Returns None when there is no
+    snapshot these tags can be answered from.
+    """
+    snapshot = current_snapshot()
+    if snapshot is None:
+        return None
+    published = get_published_since(client)
+    if snapshot.since < published:
+        # The journal may already be trimmed past this snapshot
+        tracing.count('bitmaps.outdated')
+        _state['checked'] = None
+        return None
+    if snapshot.since != published:
+        # Never published for this catalog (e.g. a leftover file), or
+        # not marked published yet
+        tracing.count('bitmaps.unpublished')
+        return None
+    if snapshot.since < now_ms() - JOURNAL_TTL * 1000:
+        # Journal rows written since then may have expired
+        tracing.count('bitmaps.expired')
+        _state['checked'] = None
+        return None
+
+    with tracing.phase('bitmaps'):
+        versions = get_tag_versions(client, sorted(tags_with_counts))
+        moved = {tag: version for tag, version in versions.items() if version != snapshot.versions.get(tag, 0)}
+        changes = {tag: {} for tag in tags_with_counts}
+        if moved:
+            shards = {tag: layout[0] for tag, layout in get_tag_shards(client, list(moved)).items()}
+            changes.update(get_journals(client, moved, shards))
+        tracing.count('bitmaps.journalRows', sum(len(images) for images in changes.values()))
+
+        matches, extras = None, None
+        for tag, min_count in tags_with_counts.items():
+            bits, tag_extras = _current_bits(snapshot, tag, min_count, changes[tag])
+            matches = bits if matches is None else matches & bits
+            extras = tag_extras if extras is None else extras & tag_extras
+
+        groups = _driving_groups(snapshot, driving_tag, tags_with_counts[driving_tag],
+                                 changes[driving_tag], matches, extras)
+        return _page(snapshot, driving_tag, groups, page_size, start_key)
+
+
+def _bits_of(ordinals, size):
+    bits = bytearray((size + 7) // 8)
+    for ordinal in ordinals:
+        bits[ordinal >> 3] |= 1 << (ordinal & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _current_bits(snapshot, tag, min_count, changes):
+    """
+    (bitmap, extra ids) of the images having tag at least min_count times
+    with the journal applied; extras are images newer than the snapshot
+    """
+    bits = snapshot.at_least(tag, min_count)
+    if not changes:
+        return bits, set()
+    changed, qualifying, extras = [], [], set()
+    for image_id, count in changes.items():
+        ordinal = snapshot.ordinal(image_id)
+        if ordinal is None:
+            if count >= min_count:
+                extras.add(image_id)
+            continue
+        changed.append(ordinal)
+        if count >= min_count:
+            qualifying.append(ordinal)
+    bits &= ~_bits_of(changed, snapshot.size)
+    return bits | _bits_of(qualifying, snapshot.size), extras
+
+
+def _driving_groups(snapshot, tag, min_count, changes, matches, extras):
+    """
+    The matches as [(driving count, bitmap, extra ids)] in the order the
+    index reads the driving tag: one group in imageId order, or with a
+    count threshold one group per count, lowest first
+    """
+    if min_count <= 1:
+        return [(None, matches, extras)]
+
+    moved = {}
+    for image_id, count in changes.items():
+        ordinal = snapshot.ordinal(image_id)
+        if ordinal is not None:
+            moved[ordinal] = count
+    unchanged = matches & ~_bits_of(moved, snapshot.size)
+
+    groups = {}
+    levels = snapshot.levels(tag, min_count)
+    for (count, bits), (_, above) in zip(levels, levels[1:] + [(None, 0)]):
+        groups[count] = [unchanged & bits & ~above, set()]
+    by_count = {}
+    for ordinal, count in moved.items():
+        if count >= min_count:
+            by_count.setdefault(count, []).append(ordinal)
+    for count, ordinals in by_count.items():
+        group = groups.setdefault(count, [0, set()])
+        group[0] |= matches & _bits_of(ordinals, snapshot.size)
+    for image_id in extras:
+        groups.setdefault(changes[image_id], [0, set()])[1].add(image_id)
+    return [(count, bits, ids) for count, (bits, ids) in sorted(groups.items())]
+
+
+def _ordinals(bits):
+    """Set bit positions, lowest first; runs of zero bytes are skipped in C"""
+    packed = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for found in _NONZERO.finditer(packed):
+        index = found.start()
+        byte = packed[index]
+        while byte:
+            low = byte & -byte
+            yield index * 8 + low.bit_length() - 1
+            byte ^= low
+
+
+def _page(snapshot, driving_tag, groups, page_size, start_key):
+    start_count = None
+    if start_key and 'countKey' in start_key:
+        start_count = int(start_key['countKey'][:COUNT_WIDTH])
+
+    matches = []
+    for count, bits, extras in groups:
+        after = None
+        if start_key and count == start_count:
+            after = start_key['imageId']
+        elif start_key and count < start_count:
+            continue
+        if after is not None:
+            cut = bisect_right(snapshot.ids, after)
+            bits = bits >> cut << cut
+            extras = [image_id for image_id in extras if image_id > after]
+
+        known = (snapshot.ids[ordinal] for ordinal in _ordinals(bits))
+        for image_id in merge(known, sorted(extras)):
+            matches.append(image_id)
+            if page_size and len(matches) >= page_size:
+                tracing.count('bitmaps.matched', len(matches))
+                key = {'tag': driving_tag, 'imageId': image_id}
+                if count is not None:
+                    key['countKey'] = count_key(count, image_id)
+                return matches, encode_cursor(key)
+    tracing.count('bitmaps.matched', len(matches))
+    return matches, None
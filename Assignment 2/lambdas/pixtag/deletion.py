@@ -0,0 +1,132 @@
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from pixtag import IMAGES_TABLE, TAG_INDEX_TABLE
+from pixtag.batch import MAX_WORKERS, batch_get, batch_write, chunked, delete_request
+from pixtag.journal import record_changes
+from pixtag.metadata import forget_images
+from pixtag.shards import index_keys
+from pixtag.stats import add_to_tag_counts, get_tag_shards
+from pixtag.urls import parse_s3_url
+from pixtag.versions import CATALOG_KEY, bump_catalog_version
+
+# S3 limit for a single DeleteObjects request
+S3_DELETE_LIMIT = 1000
+
+
+def _delete_objects(s3_client, bucket, keys):
+    """Delete up to 1000 keys, returning {key: error code} for the keys S3 couldn't delete"""
+    try:
+        response = s3_client.delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+        )
+    except ClientError as e:
+        code = e.response['Error'].get('Code', 'Unknown')
+        # Nothing can be left behind in a bucket that doesn't exist
+        if code == 'NoSuchBucket':
+            return {}
+        # e.g. AccessDenied: none of this request's keys were deleted
+        return {key: code for key in keys}
+    return {error['Key']: error.get('Code', 'Unknown') for error in response.get('Errors', [])}
+
+
+def delete_images(client, s3_client, targets, max_workers=MAX_WORKERS):
+    """
+    Delete many images: both S3 objects, every tag-index row and the
+    metadata row. targets is a list of (label, image_id) pairs where
+    image_id is None if it couldn't be worked out.
+
+    Work goes in order S3 -> tag index -> metadata, each step in bulk and
+    concurrently. The metadata row is removed last, so an image that fails
+    part-way can simply be deleted again; an S3 failure only holds back
+    the images in the failed request. Returns one status per target,
+    'duplicate' for repeats of an image already listed.
+    """
+    image_ids = list(dict.fromkeys(image_id for _, image_id in targets if image_id is not None))
+
+    keys = [{'imageId': image_id} for image_id in image_ids]
+    images = {
+        item['imageId']: item
+        for item in batch_get(client, IMAGES_TABLE, keys, ['thumbnailUrl', 'fullImageUrl', 'tags'])
+    }
+
+    # 1. S3 objects, grouped per bucket in DeleteObjects batches of 1000
+    objects = defaultdict(dict)
+    for image_id, item in images.items():
+        for url in (item.get('fullImageUrl'), item.get('thumbnailUrl')):
+            try:
+                location = parse_s3_url(url)
+            except ValueError:
+                continue
+            if location.bucket:
+                objects[location.bucket][location.key] = image_id
+
+    jobs = [
+        (bucket, chunk)
+        for bucket, owners in objects.items()
+        for chunk in chunked(list(owners), S3_DELETE_LIMIT)
+    ]
+    failed = {}
+    if jobs:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+            results = executor.map(lambda job: (job[0], _delete_objects(s3_client, *job)), jobs)
+            for bucket, failed_keys in results:
+                for key, code in failed_keys.items():
+                    failed[objects[bucket][key]] = f's3://{bucket}/{key} could not be deleted ({code})'
+
+    deleted = [image_id for image_id in images if image_id not in failed]
+
+    # 2. Tag-index rows, in every shard they may be in
+    tags = set(tag for image_id in deleted for tag in images[image_id].get('tags', []))
+    shards = get_tag_shards(client, tags)
+    batch_write(
+        client,
+        TAG_INDEX_TABLE,
+        [
+            delete_request(key)
+            for image_id in deleted
+            for tag in images[image_id].get('tags', [])
+            for key in index_keys(tag, image_id, shards[tag][0])
+        ],
+        ('tag', 'imageId')
+    )
+
+    # 3. Metadata rows last
+    batch_write(
+        client,
+        IMAGES_TABLE,
+        [delete_request({'imageId': image_id}) for image_id in deleted],
+        ('imageId',)
+    )
+    forget_images(deleted)
+
+    if deleted:
+        changes = defaultdict(dict)
+        for image_id in deleted:
+            for tag in images[image_id].get('tags', []):
+                changes[tag][image_id] = 0
+        record_changes(client, changes, {tag: layout[0] for tag, layout in shards.items()})
+        deltas = Counter(tag for image_id in deleted for tag in images[image_id].get('tags', []))
+        deltas = {tag: -count for tag, count in deltas.items()}
+        deltas[CATALOG_KEY] = -len(deleted)
+        add_to_tag_counts(client, deltas)
+        bump_catalog_version(client)
+
+    results = []
+    seen = set()
+    for label, image_id in targets:
+        if image_id is None:
+            results.append({'url': label, 'status': 'error', 'error': 'Invalid thumbnail URL format'})
+        elif image_id in seen:
+            results.append({'url': label, 'status': 'duplicate'})
+        elif image_id not in images:
+            results.append({'url': label, 'status': 'not_found'})
+        elif image_id in failed:
+            results.append({'url': label, 'status': 'error', 'error': failed[image_id]})
+        else:
+            results.append({'url': label, 'status': 'deleted'})
+        seen.add(image_id)
+    return results
@@ -0,0 +1,246 @@
+import abc
+import base64
+import hashlib
+import json
+import os
+import uuid
+from collections import Counter
+from io import BytesIO
+
+from pixtag import DETECTION_CACHE_TABLE
+from pixtag.batch import batch_get, batch_write, put_request
+from pixtag.cache import LRUCache
+from pixtag.payload import ViewReader
+
+YOLO_FUNCTION = os.environ.get('YOLO_FUNCTION', 'assignment2-yolo-detection')
+YOLO_MODEL = os.environ.get('YOLO_MODEL', 'yolov8n.pt')
+YOLO_CONFIDENCE = float(os.environ.get('YOLO_CONFIDENCE', '0.25'))
+
+# Images bigger than this are staged in S3 and passed to the YOLO Lambda
+# as {"bucket", "key"}: base64 in the JSON invoke payload adds a third and
+# the payload is capped at 6 MB
+INLINE_LIMIT = int(os.environ.get('INLINE_LIMIT', str(3 * 1024 * 1024)))
+QUERY_BUCKET = os.environ.get('QUERY_BUCKET', os.environ.get('FULL_IMAGES_BUCKET', 'assignment2-images-1812'))
+# Staged objects are deleted after the call; the bucket's lifecycle rule
+# on this prefix catches any a crashed container leaves behind
+QUERY_PREFIX = 'query-images/'
+
+
+class Detector(abc.ABC):
+    """
+    Object detector interface: image bytes in, {tag: count} out.
+    Subclasses implement detect_batch so callers can send several images
+    in one inference call.
+    """
+
+    def detect(self, image_bytes):
+        return self.detect_batch([image_bytes])[0]
+
+    @abc.abstractmethod
+    def detect_batch(self, images):
+        """One {tag: count} per image, in order"""
+
+
+class LambdaDetector(Detector):
+    """Runs YOLO through the assignment2-yolo-detection Lambda"""
+
+    def __init__(self, function_name=YOLO_FUNCTION, lambda_client=None, s3_client=None):
+        self.function_name = function_name
+        self._lambda_client = lambda_client
+        self._s3_client = s3_client
+
+    @property
+    def lambda_client(self):
+        if self._lambda_client is None:
+            from pixtag import runtime
+            self._lambda_client = runtime.client('lambda')
+        return self._lambda_client
+
+    @property
+    def s3_client(self):
+        if self._s3_client is None:
+            from pixtag import runtime
+            self._s3_client = runtime.client('s3')
+        return self._s3_client
+
+    def detect_batch(self, images):
+        staged = []
+        try:
+            payload = []
+            for image in images:
+                if memoryview(image).nbytes <= INLINE_LIMIT:
+                    payload.append(base64.b64encode(image).decode())
+                    continue
+                # Streamed from the view (a spooled upload stays mapped)
+                key = f'{QUERY_PREFIX}{uuid.uuid4()}'
+                self.s3_client.put_object(Bucket=QUERY_BUCKET, Key=key, Body=ViewReader(image))
+                staged.append(key)
+                payload.append({'bucket': QUERY_BUCKET, 'key': key})
+
+            response = self.lambda_client.invoke(
+                FunctionName=self.function_name,
+                InvocationType='RequestResponse',
+                Payload=json.dumps({'images': payload})
+            )
+        finally:
+            if staged:
+                self.s3_client.delete_objects(
+                    Bucket=QUERY_BUCKET,
+                    Delete={'Objects': [{'Key': key} for key in staged], 'Quiet': True}
+                )
+        result = json.loads(response['Payload'].read())
+        if 'FunctionError' in response:
+            raise RuntimeError(f"YOLO detection failed: {result}")
+        return [_tag_counts(detection) for detection in result['detections']]
+
+
+class YoloDetector(Detector):
+    """
+    Runs a YOLO model in-process (the detection worker). The model loads
+    once per container; a batch of images is one forward pass.
+    """
+
+    def __init__(self, model_path=YOLO_MODEL, confidence=YOLO_CONFIDENCE):
+        # Only the detection worker's image ships ultralytics and torch
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.confidence = confidence
+
+    def detect_batch(self, images):
+        from PIL import Image
+        frames = [Image.open(BytesIO(image)).convert('RGB') for image in images]
+        results = self.model(frames, conf=self.confidence, verbose=False)
+        detections = []
+        for result in results:
+            labels = [result.names[int(cls)] for cls in result.boxes.cls.tolist()]
+            detections.append(dict(Counter(label.lower() for label in labels)))
+        return detections
+
+
+class StubDetector(Detector):
+    """
+    CPU-only stand-in for local runs and benchmarks. Returns fixed tags
+    if given, otherwise picks a stable pseudo-random set from the bytes.
+    """
+
+    LABELS = ['person', 'car', 'dog', 'cat', 'bicycle', 'bus', 'truck', 'bird', 'horse', 'giraffe']
+
+    def __init__(self, tags=None, call_overhead=0.0, per_image=0.0):
+        self.tags = tags
+        # Optional simulated inference time (seconds) for benchmarks
+        self.call_overhead = call_overhead
+        self.per_image = per_image
+        self.calls = 0
+        self.images = 0
+
+    def detect_batch(self, images):
+        self.calls += 1
+        self.images += len(images)
+        if self.call_overhead or self.per_image:
+            import time
+            time.sleep(self.call_overhead + self.per_image * len(images))
+        results = []
+        for image in images:
+            if self.tags is not None:
+                results.append(_tag_counts(self.tags))
+                continue
+            digest = hashlib.sha256(image).digest()
+            labels = [self.LABELS[b % len(self.LABELS)] for b in digest[:1 + digest[0] % 4]]
+            results.append(dict(Counter(labels)))
+        return results
+
+
+class CachedDetector(Detector):
+    """
+    Content-addressed cache in front of another detector. Results are
+    keyed by the SHA-256 of the decoded image bytes, kept in memory and in
+    assignment2-detection-cache, so duplicate uploads never reach YOLO.
+    """
+
+    def __init__(self, detector, client=None, max_size=10000):
+        self.detector = detector
+        self.client = client
+        self.memory = LRUCache(max_size=max_size, ttl=24 * 3600)
+        self.memory_hits = 0
+        self.table_hits = 0
+        self.misses = 0
+
+    def detect_batch(self, images):
+        hashes = [hashlib.sha256(image).hexdigest() for image in images]
+        results = {}
+
+        for content_hash in set(hashes):
+            cached = self.memory.get(content_hash)
+            if cached is not None:
+                results[content_hash] = cached
+
+        pending = [content_hash for content_hash in set(hashes) if content_hash not in results]
+        if pending and self.client is not None:
+            keys = [{'contentHash': content_hash} for content_hash in pending]
+            for item in batch_get(self.client, DETECTION_CACHE_TABLE, keys, ['tagCounts']):
+                tag_counts = {tag: int(count) for tag, count in item.get('tagCounts', {}).items()}
+                results[item['contentHash']] = tag_counts
+                self.memory.put(item['contentHash'], tag_counts)
+
+        # Each distinct image that is left goes through inference once
+        misses = {}
+        for image, content_hash in zip(images, hashes):
+            if content_hash not in results:
+                misses.setdefault(content_hash, image)
+        if misses:
+            detections = self.detector.detect_batch(list(misses.values()))
+            for content_hash, tag_counts in zip(misses, detections):
+                results[content_hash] = tag_counts
+                self.memory.put(content_hash, tag_counts)
+            if self.client is not None:
+                batch_write(
+                    self.client,
+                    DETECTION_CACHE_TABLE,
+                    [put_request({'contentHash': h, 'tagCounts': results[h]}) for h in misses],
+                    ('contentHash',)
+                )
+
+        for content_hash in hashes:
+            if content_hash in misses:
+                self.misses += 1
+            elif content_hash in pending:
+                self.table_hits += 1
+            else:
+                self.memory_hits += 1
+        return [results[content_hash] for content_hash in hashes]
+
+    def stats(self):
+        lookups = self.memory_hits + self.table_hits + self.misses
+        return {
+            'memoryHits': self.memory_hits,
+            'tableHits': self.table_hits,
+            'misses': self.misses,
+            'hitRate': round((lookups - self.misses) / lookups, 3) if lookups else 0.0
+        }
+
+
+def _tag_counts(detection):
+    """Accept {'tagCounts': {...}}, {'tags': [...]}, a list of tags or a map"""
+    if isinstance(detection, dict) and 'tagCounts' in detection:
+        return {tag.lower(): int(count) for tag, count in detection['tagCounts'].items()}
+    if isinstance(detection, dict) and 'tags' in detection:
+        detection = detection['tags']
+    if isinstance(detection, dict):
+        return {tag.lower(): int(count) for tag, count in detection.items()}
+    return dict(Counter(tag.lower() for tag in detection))
+
+
+def get_detector(client=None, default='lambda'):
+    """
+    The detector for this container, behind the detection cache.
+    DETECTOR=stub|lambda|yolo overrides the default: query handlers call
+    the YOLO Lambda, the detection worker runs the model itself.
+    """
+    backend = os.environ.get('DETECTOR', default)
+    if backend == 'stub':
+        detector = StubDetector()
+    elif backend == 'yolo':
+        detector = YoloDetector()
+    else:
+        detector = LambdaDetector()
+    return CachedDetector(detector, client)
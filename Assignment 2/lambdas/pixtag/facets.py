@@ -0,0 +1,104 @@
+from bisect import bisect_left
+from collections import Counter
+
+from pixtag import TAG_STATS_TABLE
+from pixtag.cache import LRUCache
+from pixtag.metadata import get_images
+from pixtag.search import find_images
+from pixtag.versions import get_catalog_version
+
+# Images looked at when counting co-occurring tags
+CO_OCCURRENCE_SAMPLE = 1000
+
+# Whole tag list plus per-query answers, all stamped with the catalog
+# version so a warm container answers keystrokes without DynamoDB calls
+FACETS_CACHE = LRUCache(max_size=20000)
+
+
+def list_tags(client):
+    """
+    Every tag with a positive counter as (names, counts, by_popularity):
+    names sorted alphabetically with counts in the same order, and
+    by_popularity as (tag, count) pairs, most images first.
+    """
+    version = get_catalog_version(client)
+    cached = FACETS_CACHE.get('#tags', version)
+    if cached is not None:
+        return cached
+
+    counts = {}
+    kwargs = {
+        'TableName': TAG_STATS_TABLE,
+        'ProjectionExpression': '#tag, imageCount',
+        'ExpressionAttributeNames': {'#tag': 'tag'}
+    }
+    while True:
+        response = client.scan(**kwargs)
+        for item in response['Items']:
+            count = int(item.get('imageCount', 0))
+            # '#'-prefixed keys are bookkeeping items, not tags
+            if not item['tag'].startswith('#') and count > 0:
+                counts[item['tag']] = count
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    names = sorted(counts)
+    by_popularity = sorted(counts.items(), key=lambda pair: (-pair[1], pair[0]))
+    tags = (names, [counts[name] for name in names], by_popularity)
+    FACETS_CACHE.put('#tags', tags, version, size=len(names) or 1)
+    return tags
+
+
+def top_tags(client, limit=20):
+    """The limit most used tags as [(tag, imageCount)]"""
+    return list_tags(client)[2][:limit]
+
+
+def search_tags(client, prefix, limit=10):
+    """Tags starting with prefix, most used first, as [(tag, imageCount)]"""
+    prefix = prefix.strip().lower()
+    if not prefix:
+        return top_tags(client, limit)
+
+    version = get_catalog_version(client)
+    key = ('prefix', prefix, limit)
+    cached = FACETS_CACHE.get(key, version)
+    if cached is not None:
+        return cached
+
+    names, counts, _ = list_tags(client)
+    # Tags with the prefix are one contiguous run of the sorted names
+    start = bisect_left(names, prefix)
+    end = bisect_left(names, prefix + '\uffff', start)
+    matches = sorted(zip(names[start:end], counts[start:end]), key=lambda pair: (-pair[1], pair[0]))
+    result = matches[:limit]
+    FACETS_CACHE.put(key, result, version)
+    return result
+
+
+def co_occurring_tags(client, tags, limit=20, sample=CO_OCCURRENCE_SAMPLE):
+    """
+    Tags found together with all of the given tags, as
+    ([(tag, images in sample)], sample size, complete). Counted over the
+    first `sample` matching images; complete is False when there were more.
+    """
+    selection = sorted(set(tag.strip().lower() for tag in tags if tag.strip()))
+    version = get_catalog_version(client)
+    key = ('co', tuple(selection), limit, sample)
+    cached = FACETS_CACHE.get(key, version)
+    if cached is not None:
+        return cached
+
+    # One extra id tells whether the sample covers every match
+    image_ids, _ = find_images(client, {tag: 1 for tag in selection}, page_size=sample + 1)
+    complete = len(image_ids) <= sample
+    image_ids = image_ids[:sample]
+    images = get_images(client, image_ids, ('tags',))
+    counter = Counter()
+    for image in images.values():
+        counter.update(tag for tag in image.get('tags', ()) if tag not in selection)
+    ranked = sorted(counter.items(), key=lambda pair: (-pair[1], pair[0]))
+    result = (ranked[:limit], len(image_ids), complete)
+    FACETS_CACHE.put(key, result, version)
+    return result
@@ -0,0 +1,92 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# DynamoDB requests a container keeps in flight for one query's tags.
+# Stays below the client's connection pool (runtime.MAX_POOL_CONNECTIONS)
+# so fan-out never waits for a connection.
+FANOUT_WORKERS = int(os.environ.get('FANOUT_WORKERS', '16'))
+
+_executor = None
+_lock = threading.Lock()
+_worker = threading.local()
+_DONE = object()
+
+
+def _mark_worker():
+    _worker.active = True
+
+
+def executor():
+    """The container's shared pool for per-tag requests, created on first use"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=FANOUT_WORKERS, thread_name_prefix='fanout', initializer=_mark_worker
+                )
+    return _executor
+
+
+def configure(max_workers):
+    """Resize the pool (benchmarks compare 1 worker, i.e. sequential, with N)"""
+    global _executor, FANOUT_WORKERS
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor = None
+        FANOUT_WORKERS = max_workers
+
+
+def submit(func, *args, **kwargs):
+    """
+    Run func on the shared pool and return its Future. Called from a task
+    already on the pool, func runs right away in that thread instead: a
+    task waiting on the pool could otherwise deadlock a full pool.
+    """
+    if not getattr(_worker, 'active', False):
+        return executor().submit(func, *args, **kwargs)
+    future = Future()
+    try:
+        future.set_result(func(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+class ReadAhead:
+    """
+    Iterates over a page iterator (e.g. iter_tag_pages) with the pages
+    fetched on the shared pool. The first page is requested as soon as
+    this is created, so several tags' streams started one after another
+    run their first queries concurrently. With ahead set, page N+1 is
+    requested while page N is being consumed; without it later pages are
+    only read when asked for, for streams that are often abandoned early.
+    """
+
+    def __init__(self, pages, ahead=True):
+        self._pages = iter(pages)
+        self._ahead = ahead
+        self._pending = submit(self._fetch)
+        self._done = False
+
+    def _fetch(self):
+        return next(self._pages, _DONE)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        if self._pending is not None:
+            page, self._pending = self._pending.result(), None
+        else:
+            page = self._fetch()
+        if page is _DONE:
+            self._done = True
+            raise StopIteration
+        if self._ahead:
+            self._pending = submit(self._fetch)
+        return page
@@ -0,0 +1,147 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pixtag import TAG_INDEX_TABLE, TAG_STATS_TABLE
+from pixtag.batch import MAX_WORKERS, batch_write, put_request
+from pixtag.cache import LRUCache
+from pixtag.shards import partition, partitions, shard_of
+from pixtag.versions import VERSION_CHECK_INTERVAL
+
+# Tag-index changes since the last bitmap snapshot, kept in the tag index
+# itself under '#journal#<tag>' partition keys, sharded like the tag. A
+# journal row holds the latest count of its (tag, imageId) row, 0 once it
+# was removed, and when it was written; applying a row the snapshot
+# already has is harmless.
+JOURNAL_PREFIX = '#journal#'
+# Journal rows carry an `expires` epoch-seconds attribute, DynamoDB's TTL
+# on the tag index, so they go away even where no snapshot job runs to
+# trim them. A snapshot older than this can't be patched up to date.
+JOURNAL_TTL = int(os.environ.get('JOURNAL_TTL', str(7 * 24 * 3600)))
+# assignment2-tag-stats item holding `since` of the newest published
+# snapshot; journal rows written before it may be gone
+SNAPSHOT_ITEM = '#snapshot'
+
+# tag -> {imageId: count}, stamped with the tag version it was read under
+JOURNAL_CACHE = LRUCache(max_size=500000)
+
+_published = {'since': None, 'checked': 0.0}
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def journal_partition(tag, image_id, shards=1):
+    return JOURNAL_PREFIX + partition(tag, shard_of(image_id, shards))
+
+
+def record_changes(client, changes, shards):
+    """
+    Journal {tag: {imageId: count}} (count 0 for removed rows); shards is
+    {tag: shard count} as used for the index rows. Must run after the
+    tag-index write and before the tag versions are bumped, so a reader
+    that sees a new version also sees the change. Rows expire after
+    JOURNAL_TTL if Build snapshot hasn't trimmed them by then.
+    """
+    written = now_ms()
+    expires = written // 1000 + JOURNAL_TTL
+    requests = [
+        put_request({
+            'tag': journal_partition(tag, image_id, shards[tag]),
+            'imageId': image_id,
+            'count': count,
+            'at': written,
+            'expires': expires
+        })
+        for tag, images in changes.items()
+        for image_id, count in images.items()
+    ]
+    if requests:
+        batch_write(client, TAG_INDEX_TABLE, requests, ('tag', 'imageId'))
+
+
+def get_journals(client, versions, shards):
+    """
+    {tag: {imageId: count}} for the tags in versions ({tag: current tag
+    version}); shards is {tag: shard count}
+    """
+    journals = {}
+    for tag, version in versions.items():
+        journal = JOURNAL_CACHE.get(tag, version)
+        if journal is None:
+            journal = _read_journal(client, tag, shards[tag])
+            JOURNAL_CACHE.put(tag, journal, version, size=max(len(journal), 1))
+        journals[tag] = journal
+    return journals
+
+
+def _read_journal(client, tag, shards):
+    # A row can sit in two shards if a writer had an older shard count;
+    # the later write is the current one
+    latest = {}
+    for shard_key in partitions(tag, shards):
+        kwargs = {
+            'TableName': TAG_INDEX_TABLE,
+            'KeyConditionExpression': '#t = :tag',
+            'ProjectionExpression': '#i, #c, #a',
+            'ExpressionAttributeNames': {'#t': 'tag', '#i': 'imageId', '#c': 'count', '#a': 'at'},
+            'ExpressionAttributeValues': {':tag': JOURNAL_PREFIX + shard_key}
+        }
+        while True:
+            response = client.query(**kwargs)
+            for item in response['Items']:
+                known = latest.get(item['imageId'])
+                if known is None or item['at'] > known[1]:
+                    latest[item['imageId']] = (int(item['count']), item['at'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return {image_id: count for image_id, (count, _) in latest.items()}
+
+
+def get_published_since(client):
+    """`since` of the newest published snapshot (0 if none), re-read at most every VERSION_CHECK_INTERVAL"""
+    now = time.monotonic()
+    if _published['since'] is None or now - _published['checked'] >= VERSION_CHECK_INTERVAL:
+        response = client.get_item(TableName=TAG_STATS_TABLE, Key={'tag': SNAPSHOT_ITEM}, ProjectionExpression='since')
+        _published['since'] = int(response.get('Item', {}).get('since', 0))
+        _published['checked'] = now
+    return _published['since']
+
+
+def mark_published(client, since):
+    client.update_item(
+        TableName=TAG_STATS_TABLE,
+        Key={'tag': SNAPSHOT_ITEM},
+        UpdateExpression='SET since = :since',
+        ExpressionAttributeValues={':since': since}
+    )
+
+
+def trim_journal(client, rows, before, max_workers=MAX_WORKERS):
+    """
+    Delete journal rows ({'tag', 'imageId', 'at'} as scanned) written
+    before `before`, which a snapshot from then on already contains. Call
+    at least VERSION_CHECK_INTERVAL after mark_published, once no
+    container can still be using an older snapshot with them. A row
+    rewritten meanwhile is left alone. Returns the number deleted.
+    """
+    def delete(row):
+        try:
+            client.delete_item(
+                TableName=TAG_INDEX_TABLE,
+                Key={'tag': row['tag'], 'imageId': row['imageId']},
+                ConditionExpression='#a < :before',
+                ExpressionAttributeNames={'#a': 'at'},
+                ExpressionAttributeValues={':before': before}
+            )
+        except client.exceptions.ConditionalCheckFailedException:
+            return 0
+        return 1
+
+    old = [row for row in rows if row['at'] < before]
+    if not old:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(old))) as executor:
+        return sum(executor.map(delete, old))
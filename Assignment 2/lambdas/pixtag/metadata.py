@@ -0,0 +1,63 @@
+import os
+
+from pixtag import IMAGES_TABLE, tracing
+from pixtag.batch import batch_get
+from pixtag.cache import LRUCache
+
+# Seconds another container may go on serving an image's tags after they
+# were edited. URLs never change once set, so they keep the cache's TTL.
+TAGS_CACHE_TTL = int(os.environ.get('TAGS_CACHE_TTL', '30'))
+MUTABLE_ATTRIBUTES = {'tags', 'tagCounts'}
+
+# (imageId, attributes) -> item for warm containers. Entries belong to
+# one image each: no write elsewhere in the catalog invalidates them.
+METADATA_CACHE = LRUCache(max_size=50000)
+
+_attribute_sets = set()
+
+
+def get_images(client, image_ids, attributes=('thumbnailUrl',)):
+    """Return {imageId: item} for the images that exist"""
+    attributes = tuple(attributes)
+    _attribute_sets.add(attributes)
+    ttl = TAGS_CACHE_TTL if MUTABLE_ATTRIBUTES.intersection(attributes) else None
+
+    images = {}
+    missing = []
+    for image_id in image_ids:
+        item = METADATA_CACHE.get((image_id, attributes))
+        if item is None:
+            missing.append(image_id)
+        else:
+            images[image_id] = item
+
+    tracing.count('metadata.cacheHits', len(images))
+    tracing.count('metadata.fetched', len(missing))
+    if missing:
+        keys = [{'imageId': image_id} for image_id in missing]
+        for item in batch_get(client, IMAGES_TABLE, keys, attributes):
+            # An image still waiting for its thumbnail gets it soon
+            if all(attribute in item for attribute in attributes):
+                METADATA_CACHE.put((item['imageId'], attributes), item, ttl=ttl)
+            images[item['imageId']] = item
+    return images
+
+
+def forget_images(image_ids):
+    """Drop this container's cached rows of images it just changed"""
+    for image_id in image_ids:
+        for attributes in list(_attribute_sets):
+            METADATA_CACHE.discard((image_id, attributes))
+
+
+def get_thumbnail_urls(client, image_ids):
+    """Thumbnail URLs for the given images, in the same order as image_ids"""
+    image_ids = list(image_ids)
+    images = get_images(client, image_ids)
+
+    thumbnail_urls = []
+    for image_id in image_ids:
+        thumbnail_url = images.get(image_id, {}).get('thumbnailUrl')
+        if thumbnail_url:
+            thumbnail_urls.append(thumbnail_url)
+    return thumbnail_urls
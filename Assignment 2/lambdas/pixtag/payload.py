@@ -0,0 +1,210 @@
+import binascii
+import io
+import json
+import mmap
+import os
+import re
+import tempfile
+
+# Decoded images bigger than this go to a /tmp file and are mapped back
+# in, instead of living on the heap next to the event body
+SPOOL_LIMIT = int(os.environ.get('SPOOL_LIMIT', str(4 * 1024 * 1024)))
+# base64 characters decoded per step when spooling (a multiple of 4)
+DECODE_CHUNK = 1024 * 1024
+
+BOUNDARY = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+PART_NAME = re.compile(r'\bname="([^"]*)"', re.IGNORECASE)
+IMAGE_FIELDS = ('image', 'imageData', 'file')
+
+
+class ImagePayload:
+    """
+    An uploaded image as a read-only memoryview plus any other form fields.
+    The view points straight into the decoded body (or the mapped spool
+    file), so no further copies of the image are made. Use it as a
+    context manager; the view is invalid after close().
+    """
+
+    def __init__(self, buffer, start=0, end=None, fields=None, spool=None):
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        self.data = self._view[start:end].toreadonly()
+        self.fields = fields or {}
+        self._spool = spool
+
+    @property
+    def size(self):
+        return self.data.nbytes
+
+    @property
+    def spooled(self):
+        return self._spool is not None
+
+    def close(self):
+        self.data.release()
+        self._view.release()
+        if self._spool is not None:
+            self._buffer.close()
+            self._spool.close()
+            self._spool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_image(event):
+    """
+    The image in an API Gateway / function URL event, as an ImagePayload.
+    Accepts application/octet-stream or image/* bodies, multipart/form-data
+    with an image (or imageData/file) part, and the original JSON
+    {"imageData": "<base64>"}. Other JSON or form fields end up in
+    payload.fields. Raises ValueError for anything it can't read.
+    """
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    content_type = headers.get('content-type', 'application/json').lower()
+    body = event.get('body') or ''
+
+    if content_type.startswith('application/json'):
+        if event.get('isBase64Encoded'):
+            body = binascii.a2b_base64(body)
+        try:
+            fields = json.loads(body or '{}')
+        except ValueError:
+            raise ValueError('Invalid JSON body')
+        image_data = fields.pop('imageData', None) if isinstance(fields, dict) else None
+        if not image_data:
+            raise ValueError('imageData required')
+        buffer, spool = _decode(image_data)
+        return ImagePayload(buffer, fields=fields, spool=spool)
+
+    if not event.get('isBase64Encoded'):
+        # API Gateway only passes binary bodies intact when it base64
+        # encodes them (binaryMediaTypes)
+        raise ValueError(f'{content_type} bodies must be base64 encoded')
+    buffer, spool = _decode(body)
+
+    if content_type.startswith('multipart/form-data'):
+        match = BOUNDARY.search(headers['content-type'])
+        if not match:
+            _close(buffer, spool)
+            raise ValueError('multipart boundary missing')
+        try:
+            start, end, fields = _parse_multipart(buffer, match.group(1).encode('latin-1'))
+        except ValueError:
+            _close(buffer, spool)
+            raise
+        return ImagePayload(buffer, start, end, fields=fields, spool=spool)
+
+    if len(buffer) == 0:
+        _close(buffer, spool)
+        raise ValueError('Empty image body')
+    return ImagePayload(buffer, spool=spool)
+
+
+def _decode(text):
+    """
+    base64 to bytes, or for big inputs to a mapped /tmp file that is
+    written a chunk at a time. Returns (buffer, spool file or None).
+    Line breaks and other whitespace (MIME wraps at 76 columns) are
+    dropped before each chunk is decoded, and characters past the last
+    whole 4-character group carry over to the next chunk.
+    """
+    if len(text) // 4 * 3 <= SPOOL_LIMIT:
+        try:
+            return binascii.a2b_base64(text), None
+        except (binascii.Error, ValueError):
+            raise ValueError('Invalid base64 image data')
+    spool = tempfile.TemporaryFile(dir=tempfile.gettempdir())
+    empty = carry = text[:0]
+    try:
+        for offset in range(0, len(text), DECODE_CHUNK):
+            chunk = carry + empty.join(text[offset:offset + DECODE_CHUNK].split())
+            whole = len(chunk) - len(chunk) % 4
+            spool.write(binascii.a2b_base64(chunk[:whole]))
+            carry = chunk[whole:]
+        if carry:
+            # Fewer than 4 characters left over: a truncated final group
+            spool.write(binascii.a2b_base64(carry))
+    except (binascii.Error, ValueError):
+        spool.close()
+        raise ValueError('Invalid base64 image data')
+    spool.flush()
+    if spool.tell() == 0:
+        spool.close()
+        return b'', None
+    return mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ), spool
+
+
+class ViewReader(io.RawIOBase):
+    """
+    A seekable file object over a memoryview, for APIs such as
+    s3.put_object that take bytes or files but not views. Reads copy
+    only the requested slice.
+    """
+
+    def __init__(self, view):
+        self._view = memoryview(view).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, target):
+        chunk = self._view[self._position:self._position + len(target)]
+        target[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._view.nbytes
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def _close(buffer, spool):
+    if spool is not None:
+        buffer.close()
+        spool.close()
+
+
+def _parse_multipart(buffer, boundary):
+    """
+    Offsets of the image part in a multipart body and the other fields.
+    Only the small part headers and text fields are copied out; buffer is
+    searched in place (bytes and mmap both support find).
+    """
+    delimiter = b'--' + boundary
+    image = None
+    fields = {}
+    position = buffer.find(delimiter)
+    while position != -1:
+        start = position + len(delimiter)
+        if buffer[start:start + 2] == b'--':
+            break
+        header_end = buffer.find(b'\r\n\r\n', start)
+        end = buffer.find(b'\r\n' + delimiter, header_end + 4)
+        if header_end == -1 or end == -1:
+            raise ValueError('Malformed multipart body')
+        part_headers = buffer[start:header_end].decode('latin-1')
+        match = PART_NAME.search(part_headers)
+        name = match.group(1) if match else ''
+        if image is None and (name in IMAGE_FIELDS or 'filename=' in part_headers.lower()):
+            image = (header_end + 4, end)
+        else:
+            fields[name] = buffer[header_end + 4:end].decode('utf-8', 'replace')
+        position = end + 2
+    if image is None or image[0] == image[1]:
+        raise ValueError('No image part in multipart body')
+    return image[0], image[1], fields
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+
+from pixtag import tracing
+from pixtag.cache import LRUCache
+from pixtag.metadata import get_thumbnail_urls
+from pixtag.search import find_images
+from pixtag.versions import get_tag_versions
+
+# Seconds a cached page may be served even if no write touched its tags
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', '60'))
+# Shared tier for every container, e.g. redis://cache.internal:6379/0.
+# Anything speaking the Redis protocol works (ElastiCache, a local
+# redis-server or KeyDB); without it only the in-process tier is used.
+REDIS_URL = os.environ.get('REDIS_URL')
+REDIS_TIMEOUT = float(os.environ.get('REDIS_TIMEOUT', '0.05'))
+KEY_PREFIX = 'pixtag:results:'
+
+# query key -> (thumbnail_urls, next_cursor), sized by link count and
+# stamped with the versions of the query's tags
+RESULTS_CACHE = LRUCache(max_size=200000, ttl=RESULT_CACHE_TTL)
+
+_shared = {'client': None, 'connected': False}
+
+
+def query_key(tags_with_counts, page_size=None, cursor=None):
+    """Same key for the same query however its tags were ordered"""
+    normalized = json.dumps([sorted(tags_with_counts.items()), page_size, cursor], separators=(',', ':'))
+    return KEY_PREFIX + hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def page_tag(client, tags_with_counts, page_size=None, cursor=None):
+    """
+    Tag of the page find_page would return now, for conditional requests.
+    Costs the tag version read find_page starts with (usually cached) and
+    none of the index or metadata reads.
+    """
+    return _page_tag(query_key(tags_with_counts, page_size, cursor), _stamp(client, tags_with_counts))
+
+
+def find_page(client, tags_with_counts, page_size=None, cursor=None):
+    """
+    One page of find_images as thumbnail URLs, through the result cache.
+    A cached page is only used while every tag in the query still has the
+    version it was computed under, so a write to any of them invalidates
+    it; with fresh versions a hit makes no DynamoDB calls at all.
+    Returns (thumbnail_urls, next_cursor, tag), tag being what page_tag
+    returns for the same versions, or None while the page may still
+    change without a write to its tags (thumbnails pending).
+    """
+    key = query_key(tags_with_counts, page_size, cursor)
+    # Read before computing, so a write racing the query leaves the
+    # entry with an old stamp rather than a new stamp on old results
+    stamp = _stamp(client, tags_with_counts)
+
+    page = RESULTS_CACHE.get(key, stamp)
+    if page is not None:
+        tracing.count('results.localHits')
+        return page + (_page_tag(key, stamp),)
+
+    page = _shared_get(key, stamp)
+    if page is not None:
+        tracing.count('results.sharedHits')
+        RESULTS_CACHE.put(key, page, stamp, size=max(len(page[0]), 1))
+        return page + (_page_tag(key, stamp),)
+
+    tracing.count('results.misses')
+    image_ids, next_cursor = find_images(client, tags_with_counts, page_size=page_size, cursor=cursor)
+    thumbnail_urls = get_thumbnail_urls(client, image_ids)
+    page = (thumbnail_urls, next_cursor)
+    # Images still waiting for their thumbnail would stay hidden until
+    # the next write to these tags; leave such pages uncached
+    if len(thumbnail_urls) < len(image_ids):
+        return page + (None,)
+    RESULTS_CACHE.put(key, page, stamp, size=max(len(thumbnail_urls), 1))
+    _shared_put(key, stamp, page)
+    return page + (_page_tag(key, stamp),)
+
+
+def _stamp(client, tags_with_counts):
+    versions = get_tag_versions(client, sorted(tags_with_counts))
+    return tuple(sorted(versions.items()))
+
+
+def _page_tag(key, stamp):
+    return hashlib.sha256(json.dumps([key, stamp], separators=(',', ':')).encode()).hexdigest()
+
+
+def set_shared_tier(shared_client):
+    """
+    Use shared_client (anything with Redis get/setex, e.g. a redis.Redis
+    or a local stand-in) as the shared tier instead of REDIS_URL; None
+    turns the shared tier off
+    """
+    _shared['client'] = shared_client
+    _shared['connected'] = True
+
+
+def _shared_tier():
+    if not _shared['connected']:
+        _shared['connected'] = True
+        if REDIS_URL:
+            try:
+                import redis
+                _shared['client'] = redis.Redis.from_url(
+                    REDIS_URL, socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT
+                )
+            except ImportError:
+                print("Warning: REDIS_URL is set but the redis package is not installed")
+    return _shared['client']
+
+
+def _shared_get(key, stamp):
+    shared = _shared_tier()
+    if shared is None:
+        return None
+    try:
+        raw = shared.get(key)
+    except Exception as e:
+        # The shared tier only saves work; DynamoDB is still the source of truth
+        tracing.count('results.sharedErrors')
+        print(f"Warning: result cache get failed: {str(e)}")
+        return None
+    if raw is None:
+        return None
+    entry = json.loads(raw)
+    if [tuple(version) for version in entry['versions']] != list(stamp):
+        return None
+    return entry['links'], entry['nextCursor']
+
+
+def _shared_put(key, stamp, page):
+    shared = _shared_tier()
+    if shared is None:
+        return
+    entry = {'versions': stamp, 'links': page[0], 'nextCursor': page[1]}
+    try:
+        shared.setex(key, RESULT_CACHE_TTL, json.dumps(entry, separators=(',', ':')))
+    except Exception as e:
+        tracing.count('results.sharedErrors')
+        print(f"Warning: result cache put failed: {str(e)}")
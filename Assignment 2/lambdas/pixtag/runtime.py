@@ -0,0 +1,365 @@
+import base64
+import builtins
+import functools
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from pixtag import tracing
+
+MAX_POOL_CONNECTIONS = int(os.environ.get('MAX_POOL_CONNECTIONS', '50'))
+MAX_ATTEMPTS = int(os.environ.get('MAX_ATTEMPTS', '5'))
+CONNECT_TIMEOUT = float(os.environ.get('CONNECT_TIMEOUT', '2'))
+READ_TIMEOUT = float(os.environ.get('READ_TIMEOUT', '10'))
+# PROFILE_IMPORTS=1 adds per-package import times to the cold-start report
+PROFILE_IMPORTS = os.environ.get('PROFILE_IMPORTS') == '1'
+# Bodies smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+# Fast settings: link lists compress well even at low levels
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+# Seconds a browser or CDN may reuse a response that carries an ETag
+# before revalidating it; the versions behind the ETag are only re-read
+# that often anyway (VERSION_CHECK_INTERVAL)
+CACHE_MAX_AGE = int(os.environ.get('CACHE_MAX_AGE', '5'))
+
+CORS_HEADERS = {'Access-Control-Allow-Origin': '*'}
+JSON_HEADERS = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}
+
+# Built once instead of on every json.dumps call with custom options
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+_started = time.perf_counter()
+_last_mark = _started
+_phases = {}
+_clients = {}
+_session = None
+_lock = threading.RLock()
+_reported = False
+_import_times = defaultdict(float)
+_optional = {}
+
+
+def respond(payload, status_code=200, event=None, etag=None):
+    """
+    API Gateway proxy response with a JSON body. Given the request event,
+    bodies over COMPRESS_MIN_BYTES are brotli or gzip compressed according
+    to its Accept-Encoding header (base64 encoded, as API Gateway expects
+    for binary bodies). Given an etag (see etag()), the response carries
+    it, with the coding appended when compressed, and may be cached for
+    CACHE_MAX_AGE seconds.
+    """
+    body = dumps(payload)
+    headers = dict(JSON_HEADERS)
+    if etag is not None:
+        headers.update(_cache_headers(etag))
+    if event is None or len(body) < COMPRESS_MIN_BYTES:
+        return {'statusCode': status_code, 'headers': headers, 'body': body}
+
+    headers['Vary'] = 'Accept-Encoding'
+    accepted = accepted_encodings(event)
+    if '*' in accepted:
+        accepted.update(('br', 'gzip'))
+    brotli = _optional_module('brotli')
+    if 'br' in accepted and brotli is not None:
+        compressed = brotli.compress(body.encode(), quality=BROTLI_QUALITY)
+        headers['Content-Encoding'] = 'br'
+    elif 'gzip' in accepted:
+        compressed = gzip.compress(body.encode(), compresslevel=GZIP_LEVEL, mtime=0)
+        headers['Content-Encoding'] = 'gzip'
+    else:
+        return {'statusCode': status_code, 'headers': headers, 'body': body}
+    if etag is not None:
+        # A strong ETag names one exact byte sequence
+        headers['ETag'] = _variant(etag, headers['Content-Encoding'])
+    return {
+        'statusCode': status_code,
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode(),
+        'isBase64Encoded': True
+    }
+
+
+def etag(*parts):
+    """
+    Strong entity tag for a response body fully determined by parts
+    (JSON-serializable, e.g. the query and the versions it was answered
+    under)
+    """
+    return '"' + hashlib.sha256(_encode(parts).encode()).hexdigest()[:32] + '"'
+
+
+def not_modified(event, etag):
+    """
+    304 response when the request's If-None-Match names etag or one of
+    its compressed variants, else None
+    """
+    value = header(event, 'if-none-match')
+    if not value:
+        return None
+    for candidate in value.split(','):
+        candidate = candidate.strip()
+        # If-None-Match compares weakly
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*':
+            candidate = etag
+        coding = next((c for c in ('br', 'gzip') if candidate == _variant(etag, c)), None)
+        if candidate == etag or coding is not None:
+            headers = dict(CORS_HEADERS)
+            headers.update(_cache_headers(candidate))
+            if coding is not None:
+                headers['Vary'] = 'Accept-Encoding'
+            return {'statusCode': 304, 'headers': headers, 'body': ''}
+    return None
+
+
+def _variant(etag, coding):
+    return etag[:-1] + '-' + coding + '"'
+
+
+def _cache_headers(etag):
+    return {
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={CACHE_MAX_AGE}',
+        # Lets a polling page read the ETag to send back itself
+        'Access-Control-Expose-Headers': 'ETag'
+    }
+
+
+def error(status_code, message):
+    return {'statusCode': status_code, 'headers': dict(CORS_HEADERS), 'body': _encode({'error': message})}
+
+
+def dumps(payload):
+    """Compact JSON text, through orjson when the layer ships it"""
+    orjson = _optional_module('orjson')
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:
+            # e.g. Decimal, which orjson doesn't know; the stdlib path
+            # raises the same way for truly unserializable values
+            pass
+    return _encode(payload)
+
+
+def header(event, name):
+    """A request header's value (name in lower case), '' when absent"""
+    headers = event.get('headers') or {}
+    return next((v for k, v in headers.items() if k.lower() == name), '') or ''
+
+
+def accepted_encodings(event):
+    """Content codings the client accepts (q > 0), from the request headers"""
+    value = header(event, 'accept-encoding')
+    accepted = set()
+    for entry in value.split(','):
+        coding, _, params = entry.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _optional_module(name):
+    """Import an optional C extension once; None when it isn't installed"""
+    if name not in _optional:
+        try:
+            _optional[name] = __import__(name)
+        except ImportError:
+            _optional[name] = None
+    return _optional[name]
+
+
+def client(service, **config):
+    """
+    The container's shared low-level client for service, created on first
+    use. Extra botocore Config options (e.g. signature_version) get their
+    own client.
+    """
+    key = (service, tuple(sorted(config.items())))
+    found = _clients.get(key)
+    if found is None:
+        with _lock:
+            found = _clients.get(key)
+            if found is None:
+                found = _clients[key] = new_client(service, **config)
+    return found
+
+
+def dynamodb():
+    """DynamoDB client that takes and returns plain Python values"""
+    return client('dynamodb')
+
+
+class LazyClient:
+    """
+    Module-level stand-in for a shared client, so handlers can keep
+    `dynamodb = ...` at the top without paying for boto3 during init.
+    The real client is built on first attribute access.
+    """
+
+    __slots__ = ('_service', '_config', '_client')
+
+    def __init__(self, service, **config):
+        self._service = service
+        self._config = config
+        self._client = None
+
+    def __getattr__(self, name):
+        if self._client is None:
+            self._client = client(self._service, **self._config)
+        return getattr(self._client, name)
+
+
+def lazy_client(service, **config):
+    return LazyClient(service, **config)
+
+
+def new_client(service, **config):
+    """A new client with the tuned defaults; prefer client() in handlers"""
+    global _session
+    with _lock:
+        started = time.perf_counter()
+        from botocore.config import Config
+        if _session is None:
+            import botocore.session
+            _session = botocore.session.get_session()
+        options = {
+            'tcp_keepalive': True,
+            'max_pool_connections': MAX_POOL_CONNECTIONS,
+            'connect_timeout': CONNECT_TIMEOUT,
+            'read_timeout': READ_TIMEOUT,
+            'retries': {'mode': 'adaptive', 'max_attempts': MAX_ATTEMPTS}
+        }
+        options.update(config)
+        created = _session.create_client(service, config=Config(**options))
+        if service == 'dynamodb':
+            _add_python_types(created)
+            tracing.instrument(created)
+        _phases.setdefault(f'client:{service}', round((time.perf_counter() - started) * 1000, 1))
+        return created
+
+
+def _add_python_types(dynamodb_client):
+    """The handlers boto3.resource('dynamodb') registers on its client"""
+    from boto3.dynamodb.transform import TransformationInjector, copy_dynamodb_params
+    injector = TransformationInjector()
+    events = dynamodb_client.meta.events
+    events.register('provide-client-params.dynamodb', copy_dynamodb_params,
+                    unique_id='dynamodb-create-params-copy')
+    events.register('before-parameter-build.dynamodb', injector.inject_condition_expressions,
+                    unique_id='dynamodb-condition-expression')
+    events.register('before-parameter-build.dynamodb', injector.inject_attribute_value_input,
+                    unique_id='dynamodb-attr-value-input')
+    events.register('after-call.dynamodb', injector.inject_attribute_value_output,
+                    unique_id='dynamodb-attr-value-output')
+
+
+def mark(phase):
+    """Record how long init spent since the previous mark"""
+    global _last_mark
+    now = time.perf_counter()
+    _phases[phase] = round((now - _last_mark) * 1000, 1)
+    _last_mark = now
+
+
+def cold_start_report():
+    report = {
+        'phases': dict(_phases),
+        'peakRssMb': _peak_rss_mb()
+    }
+    if _import_times:
+        slowest = sorted(_import_times.items(), key=lambda pair: -pair[1])[:15]
+        report['imports'] = {name: round(ms, 1) for name, ms in slowest}
+    return report
+
+
+def handler(func):
+    """
+    Decorate a lambda_handler to log one structured trace per request:
+    status, duration, phases, counters and per-operation DynamoDB calls
+    (see tracing). The container's first trace also carries the cold-start
+    report: init time and phases, the clients that first request had to
+    build, and peak RSS
+    """
+    name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME') or func.__module__
+
+    @functools.wraps(func)
+    def wrapper(event, context):
+        global _reported
+        cold_start = not _reported
+        if cold_start:
+            _reported = True
+            _stop_import_profile()
+            mark('handler-import')
+            init_ms = round((_last_mark - _started) * 1000, 1)
+
+        tracing.begin(name)
+        tracing.annotate(requestId=getattr(context, 'aws_request_id', None))
+        response = None
+        try:
+            with tracing.maybe_profile():
+                response = func(event, context)
+            return response
+        except Exception as e:
+            tracing.fail(e)
+            raise
+        finally:
+            if isinstance(response, dict) and 'statusCode' in response:
+                tracing.annotate(statusCode=response['statusCode'])
+            trace = tracing.end()
+            if cold_start:
+                report = cold_start_report()
+                report['initMs'] = init_ms
+                report['firstInvokeMs'] = round((time.perf_counter() - _last_mark) * 1000, 1)
+                trace['coldStart'] = report
+            print(dumps({'trace': trace}))
+    return wrapper
+
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+_original_import = builtins.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    package = name.partition('.')[0]
+    if level or package in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    started = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        # Inclusive: boto3's time includes the botocore it pulls in
+        _import_times[package] += (time.perf_counter() - started) * 1000
+
+
+def _stop_import_profile():
+    if builtins.__import__ is _timed_import:
+        builtins.__import__ = _original_import
+
+
+if PROFILE_IMPORTS:
+    builtins.__import__ = _timed_import
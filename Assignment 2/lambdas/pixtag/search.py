@@ -0,0 +1,256 @@
+from pixtag import TAG_INDEX_TABLE, bitmaps, tracing
+from pixtag.batch import BATCH_GET_LIMIT, batch_get, chunked
+from pixtag.cache import LRUCache
+from pixtag.shards import partition, shard_of
+from pixtag.stats import get_tag_counts, get_tag_shards
+from pixtag.tag_index import (
+    decode_cursor, encode_cursor, get_postings, iter_and_cache, iter_cached_items, iter_tag_items
+)
+from pixtag.versions import get_tag_versions
+
+# A tag this many times larger than the driving tag is checked with key
+# lookups; anything closer in size is cheaper to stream and merge.
+# (BatchGetItem costs per item, Query costs per 4 KB of small index rows.)
+PROBE_RATIO = 64
+
+# (tag, imageId) -> count (0 when absent) from key lookups
+PROBE_CACHE = LRUCache(max_size=200000)
+
+
+_UNREAD = object()
+
+
+class MergeFilter:
+    """
+    Keeps candidates present in a tag's posting list by walking it in order.
+    The list is read ahead on the fan-out pool from the moment the filter
+    is created, and cached if it gets read from start to end.
+    """
+
+    def __init__(self, client, tag, start_after=None):
+        if start_after:
+            items = iter_tag_items(client, tag, start_key={'tag': tag, 'imageId': start_after}, prefetch='ahead')
+        else:
+            items = iter_and_cache(client, tag, prefetch='ahead')
+        self.stream = (item['imageId'] for item in items)
+        self.current = _UNREAD
+
+    @property
+    def exhausted(self):
+        if self.current is _UNREAD:
+            self.current = next(self.stream, None)
+        # Nothing later in this tag can match any more candidates
+        return self.current is None
+
+    def filter(self, candidates):
+        kept = []
+        if self.exhausted:
+            return kept
+        for image_id in candidates:
+            while self.current is not None and self.current < image_id:
+                self.current = next(self.stream, None)
+            if self.current is None:
+                break
+            if self.current == image_id:
+                kept.append(image_id)
+        tracing.count('filter.merge.dropped', len(candidates) - len(kept))
+        return kept
+
+
+class ProbeFilter:
+    """
+    Keeps candidates by looking up (tag, imageId) keys directly, in the
+    shard each image hashes to (and its old shard while the tag is being
+    resharded)
+    """
+
+    exhausted = False
+
+    def __init__(self, client, tag, min_count):
+        self.client = client
+        self.tag = tag
+        self.min_count = min_count
+        self.version = get_tag_versions(client, [tag])[tag]
+        self.shards = [count for count in get_tag_shards(client, [tag])[tag] if count]
+
+    def counts(self, candidates):
+        """{imageId: count of the tag on it, 0 if none} for candidates"""
+        counts = {}
+        missing = []
+        for image_id in candidates:
+            count = PROBE_CACHE.get((self.tag, image_id), self.version)
+            if count is None:
+                missing.append(image_id)
+            else:
+                counts[image_id] = count
+        tracing.count('probe.cacheHits', len(counts))
+        tracing.count('probe.fetched', len(missing))
+
+        if missing:
+            keys = [
+                {'tag': partition(self.tag, shard_of(image_id, shards)), 'imageId': image_id}
+                for image_id in missing for shards in self.shards
+            ]
+            fetched = {image_id: 0 for image_id in missing}
+            for item in batch_get(self.client, TAG_INDEX_TABLE, keys, ['count']):
+                fetched[item['imageId']] = max(fetched[item['imageId']], int(item.get('count', 1)))
+            for image_id, count in fetched.items():
+                PROBE_CACHE.put((self.tag, image_id), count, self.version)
+            counts.update(fetched)
+        return counts
+
+    def filter(self, candidates):
+        counts = self.counts(candidates)
+        kept = [image_id for image_id in candidates if counts[image_id] >= self.min_count]
+        tracing.count('filter.probe.dropped', len(candidates) - len(kept))
+        return kept
+
+
+class MemoryFilter:
+    """Keeps candidates using a posting list held in the warm cache"""
+
+    exhausted = False
+
+    def __init__(self, postings, min_count):
+        self.counts = dict(postings)
+        self.min_count = min_count
+
+    def filter(self, candidates):
+        kept = [
+            image_id for image_id in candidates
+            if self.counts.get(image_id, 0) >= self.min_count
+        ]
+        tracing.count('filter.memory.dropped', len(candidates) - len(kept))
+        return kept
+
+
+def plan_query(client, tags_with_counts, driving_tag=None):
+    """
+    Order the tags rarest first using the per-tag counters.
+    Tags without a counter go last, in request order.
+    Returns (ordered_tags, estimates).
+    """
+    estimates = get_tag_counts(client, list(tags_with_counts))
+    order = sorted(
+        tags_with_counts,
+        key=lambda tag: (estimates[tag] is None, estimates[tag] or 0)
+    )
+    if driving_tag is not None:
+        order.remove(driving_tag)
+        order.insert(0, driving_tag)
+    return order, estimates
+
+
+def find_images(client, tags_with_counts, page_size=None, cursor=None):
+    """
+    Image ids that have every tag with at least its minimum count.
+    The rarest tag drives the query: it is streamed in imageId order and
+    every other tag only filters its candidates, so the cost follows the
+    smallest posting list. With a bitmap snapshot the same page comes
+    from in-memory bitmaps instead. Returns (image_ids, next_cursor).
+    """
+    driving_tag = None
+    start_key = None
+    if cursor:
+        start_key = decode_cursor(cursor)
+        tag = start_key.get('tag')
+        if (tag not in tags_with_counts or 'imageId' not in start_key
+                or ('countKey' in start_key) != (tags_with_counts[tag] > 1)):
+            raise ValueError('Cursor does not belong to this query')
+        # Keep the same driving tag across pages even if the counters moved
+        driving_tag = start_key['tag']
+
+    with tracing.phase('plan'):
+        order, estimates = plan_query(client, tags_with_counts, driving_tag)
+    tracing.annotate(query=tags_with_counts, drivingTag=order[0], estimates=estimates)
+    if any(estimates[tag] == 0 for tag in order):
+        return [], None
+
+    # Answered from the bitmap snapshot when the container has one
+    page = bitmaps.find_images(client, tags_with_counts, order[0], page_size, start_key)
+    if page is not None:
+        return page
+
+    with tracing.phase('open'):
+        stream, filters = _open_tags(client, tags_with_counts, order, estimates, start_key, page_size)
+    if any(tag_filter.exhausted for tag_filter in filters):
+        return [], None
+
+    with tracing.phase('scan'):
+        return _scan(stream, filters, page_size)
+
+
+def _open_tags(client, tags_with_counts, order, estimates, start_key, page_size=None):
+    """
+    The driving tag's item stream and one filter per other tag.
+    Cached posting lists are used as they are; every other tag is
+    streamed, never loaded whole first, so the first page costs a page of
+    reads however big the tags are. The driving tag's first request asks
+    for just page_size rows, later ones for full index pages. The first
+    index page of every streamed tag is requested together on the fan-out
+    pool, so opening N tags costs about as long as the slowest one rather
+    than N round trips.
+    """
+    driving_tag = order[0]
+    driving_estimate = estimates[driving_tag]
+    # A count threshold on the driving tag is read from the count index,
+    # which is not in imageId order, so the other tags can't be merged
+    sorted_stream = tags_with_counts[driving_tag] <= 1
+    start_after = start_key['imageId'] if start_key else None
+
+    merge = {
+        tag: (
+            sorted_stream and tags_with_counts[tag] <= 1
+            and estimates[tag] is not None and driving_estimate is not None
+            and estimates[tag] <= PROBE_RATIO * max(driving_estimate, 1)
+        )
+        for tag in order[1:]
+    }
+
+    postings = {tag: get_postings(client, tag) for tag in order}
+    filters = []
+    for tag in order[1:]:
+        if postings[tag] is not None:
+            filters.append(MemoryFilter(postings[tag], tags_with_counts[tag]))
+        elif merge[tag]:
+            filters.append(MergeFilter(client, tag, start_after))
+        else:
+            filters.append(ProbeFilter(client, tag, tags_with_counts[tag]))
+
+    min_count = tags_with_counts[driving_tag]
+    if postings[driving_tag] is not None:
+        stream = iter_cached_items(postings[driving_tag], driving_tag, min_count, start_key)
+    elif min_count <= 1 and not start_key:
+        # Later pages only on demand: a full result page often ends mid-stream
+        stream = iter_and_cache(client, driving_tag, prefetch='first', first_limit=page_size)
+    else:
+        stream = iter_tag_items(client, driving_tag, min_count, start_key, prefetch='first', first_limit=page_size)
+
+    tracing.annotate(filters=[type(tag_filter).__name__ for tag_filter in filters])
+    return stream, filters
+
+
+def _scan(stream, filters, page_size):
+    """Stream the driving tag through the filters until a page is full"""
+    matches = []
+    for chunk in chunked(stream, BATCH_GET_LIMIT):
+        positions = {item['imageId']: item['key'] for item in chunk}
+        candidates = list(positions)
+        tracing.count('candidates.read', len(candidates))
+        for tag_filter in filters:
+            candidates = tag_filter.filter(candidates)
+            if not candidates:
+                break
+
+        for image_id in candidates:
+            matches.append(image_id)
+            if page_size and len(matches) >= page_size:
+                tracing.count('candidates.matched', len(matches))
+                return matches, encode_cursor(positions[image_id])
+
+        # Once any merged tag runs out, no later candidate can match
+        if any(tag_filter.exhausted for tag_filter in filters):
+            break
+
+    tracing.count('candidates.matched', len(matches))
+    return matches, None
@@ -0,0 +1,76 @@
+import os
+import zlib
+
+# A tag's index rows are spread over a power-of-two number of partitions:
+# shard 0 keeps the plain tag as its key (so unsharded tags and rows
+# written before sharding stay where they are), shard N uses "tag#shardN".
+# An image's shard is a stable hash of its id, so with doubling shard
+# counts a row only ever moves from shard s to s + k * old_shards.
+
+# Images per shard before a tag is split further. One DynamoDB partition
+# takes about 1000 writes per second, and ingest writes a popular tag's
+# rows in bursts.
+SHARD_SIZE = int(os.environ.get('SHARD_SIZE', '20000'))
+MAX_SHARDS = int(os.environ.get('MAX_SHARDS', '64'))
+
+# '#' separates a tag from its shard number and starts the bookkeeping
+# keys kept next to real tags ('#catalog', '#snapshot', '#journal#...'),
+# so no tag may contain it
+RESERVED_CHARACTER = '#'
+MAX_TAG_LENGTH = 100
+
+
+def normalize_tag(tag):
+    """A tag as stored: trimmed and lower case. ValueError when it can't be one."""
+    if not isinstance(tag, str) or not tag.strip():
+        raise ValueError('Tags must be non-empty strings')
+    tag = tag.strip().lower()
+    if RESERVED_CHARACTER in tag:
+        raise ValueError(f"Tags can't contain '{RESERVED_CHARACTER}': {tag}")
+    if len(tag) > MAX_TAG_LENGTH:
+        raise ValueError(f'Tags must be at most {MAX_TAG_LENGTH} characters')
+    return tag
+
+
+def shard_of(image_id, shards):
+    if shards <= 1:
+        return 0
+    return zlib.crc32(image_id.encode()) & (shards - 1)
+
+
+def partition(tag, shard):
+    """The tag-index partition key of one shard of a tag"""
+    return tag if shard == 0 else f'{tag}#shard{shard}'
+
+
+def logical_tag(partition_key):
+    """The tag a tag-index partition key belongs to"""
+    return partition_key.partition('#shard')[0]
+
+
+def partitions(tag, shards):
+    return [partition(tag, shard) for shard in range(shards)]
+
+
+def target_shards(image_count):
+    """Shards a tag with image_count images should have"""
+    shards = 1
+    while shards < MAX_SHARDS and image_count > shards * SHARD_SIZE:
+        shards *= 2
+    return shards
+
+
+def index_keys(tag, image_id, shards):
+    """
+    Every key the (tag, imageId) row can have had under shard counts up to
+    shards. Deletes go to all of them, so a row written by a container
+    that still had an older shard count can't be left behind.
+    """
+    keys = []
+    count = 1
+    while count <= shards:
+        key = {'tag': partition(tag, shard_of(image_id, count)), 'imageId': image_id}
+        if key not in keys:
+            keys.append(key)
+        count *= 2
+    return keys
@@ -0,0 +1,191 @@
+import heapq
+import math
+
+from pixtag import tracing
+from pixtag.batch import BATCH_GET_LIMIT
+from pixtag.search import PROBE_RATIO, ProbeFilter
+from pixtag.stats import get_tag_counts
+from pixtag.tag_index import get_postings, iter_and_cache
+from pixtag.versions import CATALOG_KEY
+
+# BM25 term-frequency saturation: the 5th person in a photo adds less
+# than the 2nd
+K1 = 1.2
+# Scores within this fraction of the K-th best count as ties, which the
+# earlier image wins; keeps float rounding from defeating the bounds
+TOLERANCE = 1e-9
+
+
+def _posting_stream(tag, postings=None, items=None):
+    """(imageId, tag, count) triples for a tag in imageId order"""
+    if postings is not None:
+        for image_id, count in postings:
+            yield image_id, tag, count
+    else:
+        for item in items:
+            yield item['imageId'], tag, int(item.get('count', 1))
+
+
+def _open_streams(client, tags):
+    """
+    ({tag: posting stream}, {tag: cached posting list or None}). The
+    index pages of uncached tags are all requested at once on the fan-out
+    pool, so the tags are read concurrently instead of one after another.
+    """
+    postings = {tag: get_postings(client, tag) for tag in tags}
+    # Keep a page ahead; small tags are cached if read to the end
+    items = {
+        tag: iter_and_cache(client, tag, prefetch='ahead')
+        for tag in tags if postings[tag] is None
+    }
+    streams = {tag: _posting_stream(tag, postings[tag], items.get(tag)) for tag in tags}
+    return streams, postings
+
+
+def _saturated(count):
+    return count * (K1 + 1) / (count + K1)
+
+
+def tag_weights(client, tags):
+    """BM25 inverse document frequency of each tag from the tag counters"""
+    counts = get_tag_counts(client, list(tags) + [CATALOG_KEY])
+    known = [count for count in counts.values() if count]
+    total = max(known) if known else 1
+    total = max(total, counts.get(CATALOG_KEY) or 0)
+
+    weights = {}
+    for tag in tags:
+        df = counts[tag] if counts[tag] is not None else total
+        weights[tag] = math.log(1 + (total - df + 0.5) / (df + 0.5))
+    return weights, counts
+
+
+def rank_similar(client, query_counts, top_k=50):
+    """
+    Top-K images by BM25-style weighted tag overlap with query_counts
+    ({tag: count} from detection). Each image is a sparse vector of its
+    tag counts; a shared tag contributes idf * saturated min(count, query),
+    at most its bound idf * saturated query count.
+
+    The posting lists of the query tags are merged in imageId order, so
+    an image's score is complete as soon as its id has been passed, and
+    only a K-sized min-heap is kept. Once the heap is full, the tags with
+    the lowest bounds whose bounds add up to no more than the K-th score
+    can't put an image in the top K on their own (max-score pruning):
+    such a tag stops streaming and is looked up for the images the other
+    tags bring up, and only for those that could still make it. Common
+    tags have the lowest bounds and the longest lists; one is dropped
+    only when it is PROBE_RATIO times bigger than what is left streaming,
+    as key lookups cost more per row than index pages. Once the bounds of
+    all tags add up to no more than the K-th score, nothing unread can
+    make the top K and reading stops. Ties go to the earlier imageId.
+    Returns [(imageId, score)] best first.
+    """
+    weights, counts = tag_weights(client, query_counts)
+    tags = [tag for tag in query_counts if counts[tag] != 0]
+    bounds = {tag: weights[tag] * _saturated(query_counts[tag]) for tag in tags}
+
+    streams, postings = _open_streams(client, tags)
+    heads = []
+    for tag, stream in streams.items():
+        _advance(heads, tag, stream)
+
+    # Dropped tags: cached posting lists are looked up in memory, the
+    # others probed by key (see search.ProbeFilter)
+    lookups = {}
+    dropped_bound = 0.0
+    # Lowest bound first: the order tags become droppable in
+    droppable = sorted(tags, key=lambda tag: bounds[tag])
+    pending = []
+
+    heap = []
+    position = scored = read = pruned = 0
+
+    def threshold():
+        return heap[0][0] * (1 + TOLERANCE) if len(heap) == top_k else -1.0
+
+    def offer(score, order, image_id):
+        entry = (score, -order, image_id)
+        if len(heap) < top_k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    def flush():
+        parts = {image_id: image_parts for _, image_id, image_parts in pending}
+        for tag, lookup in lookups.items():
+            for image_id, count in lookup(list(parts)).items():
+                if count:
+                    overlap = min(count, query_counts[tag])
+                    parts[image_id].append(weights[tag] * _saturated(overlap))
+        for order, image_id, image_parts in pending:
+            offer(math.fsum(image_parts), order, image_id)
+        pending.clear()
+
+    while heads:
+        image_id = heads[0][0]
+        # Exactly rounded sums, so an image scores the same whichever
+        # tags were streamed or looked up when it came along
+        parts = []
+        while heads and heads[0][0] == image_id:
+            _, tag, count = heapq.heappop(heads)
+            read += 1
+            overlap = min(count, query_counts[tag])
+            parts.append(weights[tag] * _saturated(overlap))
+            _advance(heads, tag, streams[tag])
+        position += 1
+
+        if not lookups:
+            scored += 1
+            offer(math.fsum(parts), position, image_id)
+        elif math.fsum(parts) + dropped_bound <= threshold():
+            pruned += 1
+        else:
+            scored += 1
+            pending.append((position, image_id, parts))
+            if len(pending) >= BATCH_GET_LIMIT:
+                flush()
+        if pending:
+            continue
+
+        if dropped_bound + sum(bounds[tag] for tag in droppable) <= threshold():
+            # No image still unread can beat the K-th score
+            tracing.count('similarity.stopped')
+            break
+        # With the heap full, see if the next lowest-bound tag can go
+        while droppable and dropped_bound + bounds[droppable[0]] <= threshold():
+            tag = droppable[0]
+            rest = sum(counts[other] or 0 for other in droppable[1:] if postings[other] is None)
+            if postings[tag] is None and (counts[tag] or 0) <= PROBE_RATIO * rest:
+                break
+            droppable.pop(0)
+            dropped_bound += bounds[tag]
+            streams.pop(tag).close()
+            heads = [head for head in heads if head[1] != tag]
+            heapq.heapify(heads)
+            if postings[tag] is not None:
+                lookups[tag] = _memory_lookup(postings[tag])
+            else:
+                lookups[tag] = ProbeFilter(client, tag, 1).counts
+            tracing.count('similarity.dropped')
+
+    for stream in streams.values():
+        stream.close()
+    if pending:
+        flush()
+
+    tracing.count('similarity.postings', read)
+    tracing.count('similarity.scored', scored)
+    tracing.count('similarity.pruned', pruned)
+    return [(image_id, score) for score, _, image_id in sorted(heap, reverse=True)]
+
+
+def _advance(heads, tag, stream):
+    entry = next(stream, None)
+    if entry is not None:
+        heapq.heappush(heads, entry)
+
+
+def _memory_lookup(postings):
+    counts = dict(postings)
+    return lambda image_ids: {image_id: counts.get(image_id, 0) for image_id in image_ids}
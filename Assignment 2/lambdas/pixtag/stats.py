@@ -0,0 +1,108 @@
+from pixtag import TAG_STATS_TABLE
+from pixtag.batch import batch_get
+from pixtag.cache import LRUCache
+from pixtag.versions import get_tag_versions, note_tag_version
+
+# tag -> (imageCount, shards, previousShards) for warm containers, stamped
+# with the tag's own version, so writes to other tags leave it alone
+COUNTS_CACHE = LRUCache(max_size=10000)
+
+
+def _get_stats(client, tags):
+    versions = get_tag_versions(client, tags)
+    stats = {}
+    missing = []
+    for tag in tags:
+        cached = COUNTS_CACHE.get(tag, versions[tag])
+        if cached is None:
+            missing.append(tag)
+        else:
+            stats[tag] = cached
+
+    if missing:
+        keys = [{'tag': tag} for tag in missing]
+        items = batch_get(client, TAG_STATS_TABLE, keys, ['imageCount', 'shards', 'previousShards', 'version'])
+        fetched = {tag: (None, 1, None) for tag in missing}
+        for item in items:
+            previous = item.get('previousShards')
+            fetched[item['tag']] = (
+                int(item.get('imageCount', 0)),
+                int(item.get('shards', 1)),
+                int(previous) if previous else None
+            )
+            # The item may be newer than the version read above
+            versions[item['tag']] = int(item.get('version', 0))
+            note_tag_version(item['tag'], versions[item['tag']])
+        for tag, entry in fetched.items():
+            COUNTS_CACHE.put(tag, entry, versions[tag])
+        stats.update(fetched)
+    return stats
+
+
+def get_tag_counts(client, tags):
+    """
+    Number of images per tag from the assignment2-tag-stats counters.
+    Tags without a counter map to None (unknown), not 0.
+    """
+    return {tag: entry[0] for tag, entry in _get_stats(client, tags).items()}
+
+
+def get_tag_shards(client, tags):
+    """
+    {tag: (shards, previous_shards)} for the tag-index layout; previous
+    is None unless the tag's rows are being moved to more shards
+    """
+    return {tag: entry[1:] for tag, entry in _get_stats(client, tags).items()}
+
+
+def add_to_tag_counts(client, deltas):
+    """
+    Atomically add {tag: delta} to the per-tag image counters and bump
+    each tag's version. Returns {tag: counter item after the update}.
+    """
+    updated = {}
+    for tag, delta in deltas.items():
+        if not delta:
+            continue
+        response = client.update_item(
+            TableName=TAG_STATS_TABLE,
+            Key={'tag': tag},
+            UpdateExpression='ADD imageCount :delta, version :one',
+            ExpressionAttributeValues={':delta': delta, ':one': 1},
+            ReturnValues='ALL_NEW'
+        )
+        updated[tag] = response['Attributes']
+        note_tag_version(tag, updated[tag]['version'])
+    return updated
+
+
+def set_tag_shards(client, shards):
+    """Record {tag: shard count} for tags whose rows were written that way"""
+    for tag, count in shards.items():
+        client.update_item(
+            TableName=TAG_STATS_TABLE,
+            Key={'tag': tag},
+            UpdateExpression='SET shards = :shards',
+            ExpressionAttributeValues={':shards': count}
+        )
+
+
+def touch_tags(client, tags):
+    """
+    Bump the version of tags whose posting lists changed without changing
+    how many images they have (e.g. a new count for an existing tag).
+    Tags without a counter are left alone.
+    """
+    for tag in tags:
+        try:
+            response = client.update_item(
+                TableName=TAG_STATS_TABLE,
+                Key={'tag': tag},
+                UpdateExpression='ADD version :one',
+                ConditionExpression='attribute_exists(imageCount)',
+                ExpressionAttributeValues={':one': 1},
+                ReturnValues='UPDATED_NEW'
+            )
+        except client.exceptions.ConditionalCheckFailedException:
+            continue
+        note_tag_version(tag, response['Attributes']['version'])
@@ -0,0 +1,353 @@
+import base64
+import heapq
+import json
+import time
+from bisect import bisect_right
+from itertools import chain
+from operator import itemgetter
+
+from pixtag import TAG_INDEX_TABLE, TAG_STATS_TABLE, tracing
+from pixtag.batch import batch_write, delete_request, put_request
+from pixtag.cache import LRUCache
+from pixtag.fanout import ReadAhead
+from pixtag.shards import partition, partitions, shard_of, target_shards
+from pixtag.stats import get_tag_shards, touch_tags
+from pixtag.versions import get_tag_versions
+
+# Items per DynamoDB page. Smaller than the 1 MB default so the first
+# page of a huge tag comes back quickly.
+QUERY_PAGE_LIMIT = 1000
+
+# GSI on (tag, countKey) where countKey is the zero-padded count plus the
+# imageId, so "count >= N" becomes a key range instead of a Python filter
+COUNT_INDEX = 'tag-count-index'
+COUNT_WIDTH = 5
+
+# tag -> [(imageId, count), ...] in imageId order for warm containers,
+# stamped with the tag's version. Filled by streams that happened to read
+# a tag to its end, never by reading a list just to cache it; only tags
+# up to MAX_CACHED_POSTINGS images are kept whole.
+POSTINGS_CACHE = LRUCache(max_size=500000)
+MAX_CACHED_POSTINGS = 50000
+
+
+def count_key(count, image_id):
+    return f'{int(count):0{COUNT_WIDTH}d}#{image_id}'
+
+
+def index_item(tag, image_id, count=1, shards=1):
+    """A complete assignment2-tag-index row, keyed to its shard of the tag"""
+    return {
+        'tag': partition(tag, shard_of(image_id, shards)),
+        'imageId': image_id,
+        'count': count,
+        'countKey': count_key(count, image_id)
+    }
+
+
+def iter_tag_pages(client, tag, min_count=1, start_key=None, limit=QUERY_PAGE_LIMIT, shard_key=None,
+                   first_limit=None):
+    """
+    Yield the tag-index items for a tag one page at a time, following
+    LastEvaluatedKey until the partition is exhausted.
+    With min_count <= 1 items come back in imageId order from the table.
+    With a higher min_count only qualifying rows are read, from the count
+    index, in (count, imageId) order.
+    Every item has 'imageId', 'count' and 'key' (its position, for resuming
+    with start_key). shard_key selects one shard's partition of a sharded
+    tag; keys and start_key always use the plain tag. first_limit caps
+    the first request only, for callers that may need just a few items.
+    """
+    shard_key = shard_key or tag
+    if min_count > 1:
+        kwargs = {
+            'TableName': TAG_INDEX_TABLE,
+            'IndexName': COUNT_INDEX,
+            'KeyConditionExpression': '#t = :tag AND #k >= :from',
+            'ProjectionExpression': '#i, #k',
+            'ExpressionAttributeNames': {'#t': 'tag', '#i': 'imageId', '#k': 'countKey'},
+            'ExpressionAttributeValues': {':tag': shard_key, ':from': count_key(min_count, '')},
+            'Limit': limit
+        }
+    else:
+        kwargs = {
+            'TableName': TAG_INDEX_TABLE,
+            'KeyConditionExpression': '#t = :tag',
+            'ProjectionExpression': '#i, #c',
+            'ExpressionAttributeNames': {'#t': 'tag', '#i': 'imageId', '#c': 'count'},
+            'ExpressionAttributeValues': {':tag': shard_key},
+            'Limit': limit
+        }
+    if start_key:
+        kwargs['ExclusiveStartKey'] = {**start_key, 'tag': shard_key}
+    if first_limit:
+        kwargs['Limit'] = min(first_limit, limit)
+
+    while True:
+        response = client.query(**kwargs)
+        items = response['Items']
+        tracing.count('index.rowsRead', len(items))
+        for item in items:
+            item['key'] = {'tag': tag, 'imageId': item['imageId']}
+            if 'countKey' in item:
+                item['key']['countKey'] = item['countKey']
+                item['count'] = int(item.pop('countKey')[:COUNT_WIDTH])
+        yield items
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        kwargs['ExclusiveStartKey'] = last_key
+        kwargs['Limit'] = limit
+
+
+def iter_tag_items(client, tag, min_count=1, start_key=None, prefetch=None, first_limit=None):
+    """
+    The items of iter_tag_pages one by one, across all shards of the tag.
+    prefetch='first' requests the first page right away on the fan-out
+    pool, so streams opened one after another query concurrently;
+    prefetch='ahead' also reads each next page while the current one is
+    consumed. Shards of a sharded tag are always read concurrently and
+    merged back into one stream in the same order as an unsharded tag.
+    first_limit is passed on to iter_tag_pages.
+    """
+    shards = get_tag_shards(client, [tag])[tag][0]
+    if shards == 1:
+        pages = iter_tag_pages(client, tag, min_count, start_key, first_limit=first_limit)
+        if prefetch:
+            pages = ReadAhead(pages, ahead=prefetch == 'ahead')
+        return chain.from_iterable(pages)
+
+    streams = [
+        chain.from_iterable(ReadAhead(
+            iter_tag_pages(client, tag, min_count, start_key, shard_key=shard_key, first_limit=first_limit),
+            ahead=prefetch == 'ahead'
+        ))
+        for shard_key in partitions(tag, shards)
+    ]
+    if min_count > 1:
+        return _unique(heapq.merge(*streams, key=itemgetter('count', 'imageId')), ordered=False)
+    return _unique(heapq.merge(*streams, key=itemgetter('imageId')), ordered=True)
+
+
+def _unique(items, ordered):
+    """
+    Drops repeats of an image, which a row being moved between shards can
+    briefly produce. In imageId order repeats are adjacent.
+    """
+    if ordered:
+        last = None
+        for item in items:
+            if item['imageId'] != last:
+                last = item['imageId']
+                yield item
+    else:
+        seen = set()
+        for item in items:
+            if item['imageId'] not in seen:
+                seen.add(item['imageId'])
+                yield item
+
+
+def iter_image_ids(client, tag, min_count=1, start_key=None, prefetch=None):
+    """Stream the imageIds tagged with `tag` at least min_count times"""
+    items = iter_tag_items(client, tag, min_count, start_key, prefetch)
+    return (item['imageId'] for item in items if item.get('count', 1) >= min_count)
+
+
+def get_postings(client, tag):
+    """
+    The whole posting list of a tag from the warm cache, or None when it
+    isn't cached (see iter_and_cache)
+    """
+    version = get_tag_versions(client, [tag])[tag]
+    postings = POSTINGS_CACHE.get(tag, version)
+    if postings is not None:
+        tracing.count('postings.cacheHits')
+    return postings
+
+
+def iter_and_cache(client, tag, prefetch=None, first_limit=None):
+    """
+    iter_tag_items over a whole tag that also caches its posting list if
+    the caller reads it to the end. A caller that stops after one page
+    pays nothing for it.
+    """
+    # Read before streaming, so a write racing the stream leaves the
+    # entry with an old stamp rather than a new stamp on old rows
+    version = get_tag_versions(client, [tag])[tag]
+    return _cache_when_read(tag, version, iter_tag_items(client, tag, prefetch=prefetch, first_limit=first_limit))
+
+
+def _cache_when_read(tag, version, items):
+    postings = []
+    for item in items:
+        if postings is not None:
+            postings.append((item['imageId'], int(item.get('count', 1))))
+            if len(postings) > MAX_CACHED_POSTINGS:
+                postings = None
+        yield item
+    if postings is not None:
+        POSTINGS_CACHE.put(tag, postings, version, size=max(len(postings), 1))
+        tracing.count('postings.cached')
+
+
+def iter_cached_items(postings, tag, min_count=1, start_key=None):
+    """
+    Same items, order and keys as iter_tag_items, served from a cached
+    posting list, so cursors work across cached and uncached pages
+    """
+    if min_count > 1:
+        rows = sorted((count, image_id) for image_id, count in postings if count >= min_count)
+        tracing.count('index.countFiltered', len(postings) - len(rows))
+        start = 0
+        if start_key:
+            position = (int(start_key['countKey'][:COUNT_WIDTH]), start_key['imageId'])
+            start = bisect_right(rows, position)
+        for count, image_id in rows[start:]:
+            yield {
+                'imageId': image_id,
+                'count': count,
+                'key': {'tag': tag, 'imageId': image_id, 'countKey': count_key(count, image_id)}
+            }
+    else:
+        start = 0
+        if start_key:
+            start = bisect_right(postings, (start_key['imageId'], float('inf')))
+        for image_id, count in postings[start:]:
+            yield {'imageId': image_id, 'count': count, 'key': {'tag': tag, 'imageId': image_id}}
+
+
+def encode_cursor(position):
+    """Opaque, URL-safe token for a position in a result stream"""
+    raw = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor, raises ValueError for a bad token"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(position, dict):
+        raise ValueError('Invalid cursor')
+    return position
+
+
+def promote_hot_tags(client, counters):
+    """
+    Spread tags over more shards once their image count outgrows them.
+    counters is {tag: counter item}, as returned by add_to_tag_counts.
+    Only the new layout is published here, which is one conditional
+    update; the rows are moved later by finish_reshard in the Reshard tags
+    job, so the write that crossed the threshold doesn't wait for it.
+    Returns the tags whose move was started.
+    """
+    promoted = []
+    for tag, counter in counters.items():
+        # A move still in progress is finished by the job first
+        if tag.startswith('#') or counter.get('previousShards'):
+            continue
+        shards = int(counter.get('shards', 1))
+        target = target_shards(int(counter.get('imageCount', 0)))
+        if target > shards and start_reshard(client, tag, shards, target):
+            promoted.append(tag)
+    if promoted:
+        tracing.annotate(resharding=promoted)
+    return promoted
+
+
+def start_reshard(client, tag, old_shards, new_shards):
+    """
+    Publish new_shards as the tag's layout, remembering old_shards until
+    the rows are moved. Writers use the new count from then on, and
+    readers read every new shard (which include the old ones), so every
+    row stays findable. Returns False when another writer got there first.
+    """
+    try:
+        client.update_item(
+            TableName=TAG_STATS_TABLE,
+            Key={'tag': tag},
+            UpdateExpression='SET shards = :new, previousShards = :old, reshardStarted = :now',
+            ConditionExpression=(
+                'attribute_not_exists(previousShards) AND '
+                '(attribute_not_exists(shards) OR shards = :old)'
+            ),
+            ExpressionAttributeValues={':new': new_shards, ':old': old_shards, ':now': int(time.time())}
+        )
+    except client.exceptions.ConditionalCheckFailedException:
+        return False
+    # Cached shard layouts of this tag are stale now
+    touch_tags(client, [tag])
+    return True
+
+
+def pending_reshards(client):
+    """
+    [(tag, old_shards, new_shards, started)] for every move started and
+    not finished; started is in epoch seconds
+    """
+    pending = []
+    kwargs = {
+        'TableName': TAG_STATS_TABLE,
+        'ProjectionExpression': '#t, shards, previousShards, reshardStarted',
+        'FilterExpression': 'attribute_exists(previousShards)',
+        'ExpressionAttributeNames': {'#t': 'tag'}
+    }
+    while True:
+        response = client.scan(**kwargs)
+        for item in response['Items']:
+            started = int(item.get('reshardStarted', 0))
+            pending.append((item['tag'], int(item['previousShards']), int(item['shards']), started))
+        if 'LastEvaluatedKey' not in response:
+            return pending
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def finish_reshard(client, tag, old_shards, new_shards):
+    """
+    Move a tag's index rows from its old_shards partitions to the
+    new_shards layout published by start_reshard. Each row is put at its
+    new key before it is deleted from the old one, so readers always find
+    it, and a run that dies part-way is simply run again: moved rows are
+    gone from the old partitions and the rest are moved then. Start it
+    VERSION_CHECK_INTERVAL after start_reshard at the earliest: until then
+    a writer may still put rows at their old keys. Returns the number of
+    rows moved.
+    """
+    moved_rows = 0
+    for shard, shard_key in enumerate(partitions(tag, old_shards)):
+        for page in iter_tag_pages(client, tag, shard_key=shard_key):
+            moved = [item for item in page if shard_of(item['imageId'], new_shards) != shard]
+            if not moved:
+                continue
+            batch_write(
+                client,
+                TAG_INDEX_TABLE,
+                [put_request(index_item(tag, item['imageId'], item['count'], new_shards)) for item in moved],
+                ('tag', 'imageId')
+            )
+            batch_write(
+                client,
+                TAG_INDEX_TABLE,
+                [delete_request({'tag': shard_key, 'imageId': item['imageId']}) for item in moved],
+                ('tag', 'imageId')
+            )
+            moved_rows += len(moved)
+    tracing.count('reshard.rowsMoved', moved_rows)
+
+    try:
+        client.update_item(
+            TableName=TAG_STATS_TABLE,
+            Key={'tag': tag},
+            UpdateExpression='REMOVE previousShards, reshardStarted',
+            ConditionExpression='previousShards = :old AND shards = :new',
+            ExpressionAttributeValues={':old': old_shards, ':new': new_shards}
+        )
+    except client.exceptions.ConditionalCheckFailedException:
+        # Finished by an overlapping run
+        return moved_rows
+    touch_tags(client, [tag])
+    return moved_rows
@@ -0,0 +1,255 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from pixtag import IMAGES_TABLE, TAG_INDEX_TABLE
+from pixtag.batch import batch_write, delete_request, put_request
+from pixtag.journal import record_changes
+from pixtag.metadata import forget_images
+from pixtag.shards import index_keys, normalize_tag
+from pixtag.stats import add_to_tag_counts, get_tag_shards, touch_tags
+from pixtag.tag_index import index_item, promote_hot_tags
+from pixtag.versions import bump_catalog_version
+
+# Bounded by the default botocore connection pool (10)
+MAX_WORKERS = 10
+
+
+def _update_image(client, image_id, tags, add, tag_counts=None):
+    """
+    One atomic update of an image's tag set and tagCounts map.
+    Added tags keep an existing count unless tag_counts gives new ones.
+    Returns the tags the image had before the update, or None when the
+    image doesn't exist.
+    """
+    names = {f'#t{i}': tag for i, tag in enumerate(tags)}
+    if add and tag_counts:
+        counts = ', '.join(f'tagCounts.#t{i} = :c{i}' for i in range(len(tags)))
+        update = f'ADD tags :tags SET {counts}'
+        values = {':tags': set(tags)}
+        values.update({f':c{i}': tag_counts[tag] for i, tag in enumerate(tags)})
+    elif add:
+        counts = ', '.join(f'tagCounts.#t{i} = if_not_exists(tagCounts.#t{i}, :one)' for i in range(len(tags)))
+        update = f'ADD tags :tags SET {counts}'
+        values = {':tags': set(tags), ':one': 1}
+    else:
+        counts = ', '.join(f'tagCounts.#t{i}' for i in range(len(tags)))
+        update = f'DELETE tags :tags REMOVE {counts}'
+        values = {':tags': set(tags)}
+
+    try:
+        response = client.update_item(
+            TableName=IMAGES_TABLE,
+            Key={'imageId': image_id},
+            UpdateExpression=update,
+            ConditionExpression='attribute_exists(imageId)',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+            ReturnValues='ALL_OLD'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+    return set(response.get('Attributes', {}).get('tags', set()))
+
+
+def _convert_legacy_image(client, image_id):
+    """
+    Older rows store tags as a list and may lack tagCounts, which ADD,
+    DELETE and nested SET can't work with. Rewrite them once as a string
+    set plus a map. Returns False when the image doesn't exist.
+    """
+    response = client.get_item(TableName=IMAGES_TABLE, Key={'imageId': image_id})
+    if 'Item' not in response:
+        return False
+
+    item = response['Item']
+    tags = set(item.get('tags', []))
+    values = {':counts': item.get('tagCounts', {})}
+    if tags:
+        update = 'SET tags = :tags, tagCounts = :counts'
+        values[':tags'] = tags
+    else:
+        update = 'SET tagCounts = :counts REMOVE tags'
+
+    # Only convert the version we read; a concurrent edit wins the race
+    try:
+        if 'tags' in item:
+            values[':old'] = item['tags']
+            condition = 'tags = :old'
+        else:
+            condition = 'attribute_exists(imageId) AND attribute_not_exists(tags)'
+        client.update_item(
+            TableName=IMAGES_TABLE,
+            Key={'imageId': image_id},
+            UpdateExpression=update,
+            ConditionExpression=condition,
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    return True
+
+
+def _mutate_image(client, image_id, tags, add, tag_counts=None):
+    try:
+        return _update_image(client, image_id, tags, add, tag_counts)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ValidationException':
+            raise
+    if not _convert_legacy_image(client, image_id):
+        return None
+    return _update_image(client, image_id, tags, add, tag_counts)
+
+
+def _roll_back(client, changes, add, shards):
+    """
+    Best-effort undo of mutate_tags for {image_id: changed tags} after
+    the tag-index write failed, so a retry of the same edit changes them
+    again. Index rows from chunks that did get written are reverted too.
+    """
+    requests = []
+    for image_id, changed in changes.items():
+        try:
+            _mutate_image(client, image_id, sorted(changed), not add)
+        except Exception as e:
+            print(f"Error: rolling back tags on {image_id}: {str(e)}")
+        for tag in changed:
+            if add:
+                requests.extend(delete_request(key) for key in index_keys(tag, image_id, shards[tag]))
+            else:
+                requests.append(put_request(index_item(tag, image_id, 1, shards[tag])))
+    try:
+        batch_write(client, TAG_INDEX_TABLE, requests, ('tag', 'imageId'))
+    except Exception as e:
+        print(f"Error: rolling back {len(requests)} tag-index writes: {str(e)}")
+
+
+def mutate_tags(client, targets, tags, add=True, max_workers=MAX_WORKERS):
+    """
+    Add or remove `tags` on many images at once.
+    targets is a list of (label, image_id) pairs where image_id is None if
+    it couldn't be worked out; label is echoed back (e.g. the URL).
+    Images are updated concurrently with atomic set updates, then the
+    tag-index rows, counters and catalog version are written in bulk.
+    Returns one status dict per target, in order. If the tag-index write
+    fails, the images it covered are rolled back and reported as errors.
+    Raises ValueError for a tag that can't be stored (see normalize_tag)
+    before changing anything.
+    """
+    tags = sorted(set(normalize_tag(tag) for tag in tags))
+
+    def work(target):
+        label, image_id = target
+        if image_id is None:
+            return {'url': label, 'status': 'error', 'error': 'Invalid thumbnail URL format'}, None, set()
+        try:
+            old_tags = _mutate_image(client, image_id, tags, add)
+        except Exception as e:
+            return {'url': label, 'status': 'error', 'error': str(e)}, None, set()
+        if old_tags is None:
+            return {'url': label, 'status': 'not_found'}, None, set()
+
+        if add:
+            changed = set(tags) - old_tags
+            new_tags = old_tags | set(tags)
+        else:
+            changed = set(tags) & old_tags
+            new_tags = old_tags - set(tags)
+        status = {'url': label, 'status': 'success', 'updatedTags': sorted(new_tags)}
+        return status, image_id, changed
+
+    workers = max(1, min(max_workers, len(targets)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(work, targets))
+    forget_images(image_id for _, image_id, _ in outcomes if image_id)
+
+    # Only tags that really changed touch the index and the counters
+    shards = {tag: layout[0] for tag, layout in get_tag_shards(client, tags).items()}
+    requests = []
+    deltas = Counter()
+    changes = {}
+    for _, image_id, changed in outcomes:
+        for tag in changed:
+            if add:
+                requests.append(put_request(index_item(tag, image_id, 1, shards[tag])))
+            else:
+                requests.extend(delete_request(key) for key in index_keys(tag, image_id, shards[tag]))
+            deltas[tag] += 1 if add else -1
+            changes.setdefault(tag, {})[image_id] = 1 if add else 0
+
+    if requests:
+        try:
+            batch_write(client, TAG_INDEX_TABLE, requests, ('tag', 'imageId'))
+        except Exception as e:
+            print(f"Error: tag-index write failed: {str(e)}")
+            rolled_back = {image_id: changed for _, image_id, changed in outcomes if changed}
+            _roll_back(client, rolled_back, add, shards)
+            forget_images(rolled_back)
+            return [
+                {'url': status['url'], 'status': 'error', 'error': str(e)} if changed else status
+                for status, _, changed in outcomes
+            ]
+        record_changes(client, changes, shards)
+        counters = add_to_tag_counts(client, deltas)
+        bump_catalog_version(client)
+        if add:
+            promote_hot_tags(client, counters)
+
+    return [status for status, _, _ in outcomes]
+
+
+def apply_detections(client, detections, max_workers=MAX_WORKERS):
+    """
+    Merge detected {tag: count} maps into many images at once; this is the
+    ingest write path. detections is {imageId: {tag: count}}.
+    Images are updated concurrently, every detected tag-index row is
+    written in one bulk pass with its count, and counters move only for
+    tags that are new to an image. Returns {imageId: status dict}.
+    """
+    def work(item):
+        image_id, tag_counts = item
+        if not tag_counts:
+            return image_id, {'status': 'success', 'tags': []}, set()
+        try:
+            old_tags = _mutate_image(client, image_id, sorted(tag_counts), True, tag_counts)
+        except Exception as e:
+            return image_id, {'status': 'error', 'error': str(e)}, set()
+        if old_tags is None:
+            return image_id, {'status': 'not_found'}, set()
+        return image_id, {'status': 'success', 'tags': sorted(tag_counts)}, old_tags
+
+    items = list(detections.items())
+    workers = max(1, min(max_workers, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(work, items))
+    forget_images(detections)
+
+    detected = set(tag for tag_counts in detections.values() for tag in tag_counts)
+    shards = {tag: layout[0] for tag, layout in get_tag_shards(client, detected).items()}
+    requests = []
+    deltas = Counter()
+    recounted = set()
+    changes = {}
+    for image_id, status, old_tags in outcomes:
+        if status['status'] != 'success':
+            continue
+        for tag, count in detections[image_id].items():
+            requests.append(put_request(index_item(tag, image_id, count, shards[tag])))
+            changes.setdefault(tag, {})[image_id] = count
+        deltas.update(set(detections[image_id]) - old_tags)
+        recounted.update(set(detections[image_id]) & old_tags)
+
+    if requests:
+        batch_write(client, TAG_INDEX_TABLE, requests, ('tag', 'imageId'))
+        record_changes(client, changes, shards)
+        counters = add_to_tag_counts(client, deltas)
+        # Tags that only got new counts still invalidate cached results
+        touch_tags(client, recounted - set(deltas))
+        bump_catalog_version(client)
+        promote_hot_tags(client, counters)
+
+    return {image_id: status for image_id, status, _ in outcomes}
@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# Fraction of requests run under cProfile (0 disables). Only the handler
+# thread is profiled; pool threads show up as time spent waiting.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_TOP = 20
+
+# DynamoDB operations that can report ConsumedCapacity
+CAPACITY_OPERATIONS = {
+    'GetItem', 'PutItem', 'UpdateItem', 'DeleteItem', 'Query', 'Scan',
+    'BatchGetItem', 'BatchWriteItem', 'TransactGetItems', 'TransactWriteItems'
+}
+
+
+class Trace:
+    """
+    Timings and counters for one request. It belongs to the thread that
+    began it; other threads (the pools pixtag uses for batched calls)
+    record into the latest trace. A Lambda container serves one request
+    at a time, so that is the right one.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.phases = defaultdict(float)
+        self.counters = Counter()
+        self.calls = defaultdict(lambda: {'calls': 0, 'ms': 0.0, 'items': 0, 'scanned': 0, 'capacity': 0.0})
+        self.slowest = None
+        self.fields = {}
+        self.error = None
+        self.profile = None
+        self.lock = threading.Lock()
+
+    def record_call(self, operation, table, ms, items, scanned, capacity):
+        with self.lock:
+            stats = self.calls[operation]
+            stats['calls'] += 1
+            stats['ms'] += ms
+            stats['items'] += items
+            stats['scanned'] += scanned
+            stats['capacity'] += capacity
+            if self.slowest is None or ms > self.slowest['ms']:
+                self.slowest = {'operation': operation, 'table': table, 'ms': round(ms, 2)}
+
+    def summary(self):
+        return {
+            'handler': self.name,
+            'ms': round((time.perf_counter() - self.started) * 1000, 2),
+            **self.fields,
+            'phases': {name: round(ms, 2) for name, ms in self.phases.items()},
+            'counters': dict(self.counters),
+            'dynamodb': {
+                operation: {**stats, 'ms': round(stats['ms'], 2), 'capacity': round(stats['capacity'], 1)}
+                for operation, stats in self.calls.items()
+            },
+            'slowestCall': self.slowest,
+            'error': self.error,
+            'profile': self.profile
+        }
+
+
+_latest = None
+_local = threading.local()
+
+
+def begin(name):
+    """Start the trace for a new request on this thread; returns it"""
+    global _latest
+    trace = _local.trace = _latest = Trace(name)
+    return trace
+
+
+def end():
+    """Finish this thread's trace and return its summary"""
+    global _latest
+    trace = active()
+    _local.trace = None
+    if _latest is trace:
+        _latest = None
+    return trace.summary() if trace is not None else None
+
+
+def active():
+    return getattr(_local, 'trace', None) or _latest
+
+
+@contextmanager
+def phase(name):
+    """Time a block of work; repeated phases add up"""
+    trace = active()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        with trace.lock:
+            trace.phases[name] += elapsed
+
+
+def count(name, n=1):
+    trace = active()
+    if trace is not None and n:
+        with trace.lock:
+            trace.counters[name] += n
+
+
+def annotate(**fields):
+    """Attach request details (tags, sizes, plan choices) to the log line"""
+    trace = active()
+    if trace is not None:
+        trace.fields.update(fields)
+
+
+def fail(exception):
+    """Record the exception a handler turned into a 500"""
+    trace = active()
+    frames = traceback.extract_tb(exception.__traceback__)
+    # The deepest frame in our own code says more than one inside botocore
+    own = [frame for frame in frames if 'site-packages' not in frame.filename] or frames
+    where = f'{os.path.basename(own[-1].filename)}:{own[-1].lineno}' if own else None
+    error = {'type': type(exception).__name__, 'message': str(exception), 'at': where}
+    if trace is None:
+        print(f"Error: {error}")
+    else:
+        trace.error = error
+
+
+@contextmanager
+def maybe_profile():
+    """Run the block under cProfile for a PROFILE_SAMPLE_RATE share of requests"""
+    trace = active()
+    if trace is None or not PROFILE_SAMPLE_RATE:
+        yield
+        return
+    # Imported here so unsampled containers don't pay for them at init
+    import cProfile
+    import pstats
+    import random
+    if random.random() >= PROFILE_SAMPLE_RATE:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        stats = pstats.Stats(profiler)
+        rows = sorted(stats.stats.items(), key=lambda row: -row[1][3])[:PROFILE_TOP]
+        trace.profile = [
+            {
+                'function': f'{os.path.basename(filename)}:{line}({function})',
+                'calls': calls,
+                'cumMs': round(cumulative * 1000, 2)
+            }
+            for (filename, line, function), (_, calls, _, cumulative, _) in rows
+        ]
+
+
+def instrument(client):
+    """
+    Time every DynamoDB call made through client and count the items it
+    read, via botocore's event hooks. Costs nothing when no trace is active.
+    """
+    events = client.meta.events
+    events.register('before-parameter-build.dynamodb', _request_capacity)
+    events.register('before-call.dynamodb', _before_call)
+    events.register('after-call.dynamodb', _after_call)
+
+
+def _request_capacity(params, model, **kwargs):
+    if active() is not None and model.name in CAPACITY_OPERATIONS:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+
+def _before_call(context, **kwargs):
+    if active() is not None:
+        context['trace_started'] = time.perf_counter()
+
+
+def _after_call(parsed, model, context, **kwargs):
+    trace = active()
+    started = context.get('trace_started')
+    if trace is None or started is None:
+        return
+    ms = (time.perf_counter() - started) * 1000
+
+    if 'Items' in parsed:
+        items = len(parsed['Items'])
+    elif 'Responses' in parsed:
+        items = sum(len(rows) for rows in parsed['Responses'].values())
+    else:
+        items = 1 if parsed.get('Item') or parsed.get('Attributes') else 0
+    scanned = parsed.get('ScannedCount', items)
+
+    consumed = parsed.get('ConsumedCapacity') or []
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    capacity = sum(entry.get('CapacityUnits', 0) for entry in consumed)
+    table = consumed[0].get('TableName') if consumed else None
+    trace.record_call(model.name, table, ms, items, scanned, capacity)
@@ -0,0 +1,112 @@
+import os
+import posixpath
+import re
+from collections import namedtuple
+from urllib.parse import unquote, urlsplit
+
+from pixtag import IMAGES_TABLE
+
+THUMBNAIL_KEY_INDEX = 'thumbnailKey-index'
+
+# bucket.s3.amazonaws.com, bucket.s3.us-east-1.amazonaws.com, bucket.s3-us-west-2.amazonaws.com
+VIRTUAL_HOST = re.compile(r'^(?P<bucket>[a-z0-9][a-z0-9.-]{1,61}[a-z0-9])\.s3(?:[.-][a-z0-9-]+)?\.amazonaws\.com$')
+# s3.amazonaws.com/bucket/key, s3.us-east-1.amazonaws.com/bucket/key
+PATH_STYLE = re.compile(r'^s3(?:[.-][a-z0-9-]+)?\.amazonaws\.com$')
+CLOUDFRONT = re.compile(r'^[a-z0-9]+\.cloudfront\.net$')
+# thumb/<imageId>.<ext>; the id may itself contain dots
+THUMBNAIL_KEY = re.compile(r'^thumb/(?P<image_id>[^/]+)\.[A-Za-z0-9]+$')
+
+# Extra CDN hostnames (comma separated) that serve the thumbnails bucket
+CDN_HOSTS = set(host.strip().lower() for host in os.environ.get('CDN_HOSTS', '').split(',') if host.strip())
+THUMBNAILS_BUCKET = os.environ.get('THUMBNAILS_BUCKET')
+
+S3Location = namedtuple('S3Location', ['bucket', 'key'])
+
+
+def parse_s3_url(url):
+    """
+    Bucket and key of an S3 virtual-host, path-style or CloudFront/CDN
+    URL. Query strings (presigned URLs) are ignored. Raises ValueError
+    for anything else. CDN URLs have bucket None unless THUMBNAILS_BUCKET
+    is set.
+    """
+    if not isinstance(url, str):
+        raise ValueError('URL must be a string')
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    path = unquote(parts.path).lstrip('/')
+    if parts.scheme not in ('http', 'https') or not path:
+        raise ValueError(f'Not an S3 object URL: {url}')
+
+    match = VIRTUAL_HOST.match(host)
+    if match:
+        return S3Location(match.group('bucket'), path)
+
+    if PATH_STYLE.match(host):
+        bucket, _, key = path.partition('/')
+        if key:
+            return S3Location(bucket, key)
+        raise ValueError(f'Not an S3 object URL: {url}')
+
+    if CLOUDFRONT.match(host) or host in CDN_HOSTS:
+        return S3Location(THUMBNAILS_BUCKET, path)
+
+    raise ValueError(f'Not an S3 object URL: {url}')
+
+
+def thumbnail_image_id(key):
+    """imageId for a standard thumbnail key, or None"""
+    match = THUMBNAIL_KEY.match(key)
+    return match.group('image_id') if match else None
+
+
+def lookup_thumbnail_key(client, key):
+    """imageId for a non-standard thumbnail key via the thumbnailKey GSI"""
+    response = client.query(
+        TableName=IMAGES_TABLE,
+        IndexName=THUMBNAIL_KEY_INDEX,
+        KeyConditionExpression='thumbnailKey = :key',
+        ExpressionAttributeValues={':key': key},
+        ProjectionExpression='imageId',
+        Limit=1
+    )
+    items = response['Items']
+    return items[0]['imageId'] if items else None
+
+
+def resolve_image_id(client, url):
+    """
+    imageId of a thumbnail URL, or None when the URL isn't a thumbnail.
+    The regex fast path needs no DynamoDB call; other keys fall back to
+    the thumbnailKey index.
+    """
+    try:
+        location = parse_s3_url(url)
+    except ValueError:
+        return None
+    image_id = thumbnail_image_id(location.key)
+    if image_id is None and client is not None:
+        image_id = lookup_thumbnail_key(client, location.key)
+    return image_id
+
+
+def resolve_targets(client, urls):
+    """[(url, imageId or None)] for a list of thumbnail URLs"""
+    return [(url, resolve_image_id(client, url)) for url in urls]
+
+
+def compact_links(urls):
+    """
+    Split URLs into (base, suffix, ids) with url == base + id + suffix.
+    base ends at a '/', suffix is a shared extension such as '.jpg'; for
+    standard thumbnails the ids are just the imageIds.
+    """
+    if not urls:
+        return '', '', []
+    base = posixpath.commonprefix(urls)
+    base = base[:base.rfind('/') + 1]
+    suffix = posixpath.commonprefix([url[len(base):][::-1] for url in urls])[::-1]
+    dot = suffix.rfind('.')
+    suffix = suffix[dot:] if dot != -1 and '/' not in suffix[dot:] else ''
+    ids = [url[len(base):len(url) - len(suffix)] for url in urls]
+    return base, suffix, ids
@@ -0,0 +1,79 @@
+import os
+import time
+
+from pixtag import TAG_STATS_TABLE
+from pixtag.batch import batch_get
+
+# Catalog-wide version stamp, kept next to the tag counters. Tags are
+# lower-case words, so the '#' prefix can't clash with a real tag.
+CATALOG_KEY = '#catalog'
+
+# How long a warm container trusts the version it last read
+VERSION_CHECK_INTERVAL = float(os.environ.get('VERSION_CHECK_INTERVAL', '5'))
+
+_catalog = {'version': None, 'checked': 0.0}
+
+# tag -> (version, checked). Each tag's counter item carries a version
+# that moves whenever the tag's posting list changes.
+_tag_versions = {}
+
+
+def get_catalog_version(client):
+    """
+    Current catalog version. Read from DynamoDB at most once every
+    VERSION_CHECK_INTERVAL seconds per container.
+    """
+    now = time.monotonic()
+    if _catalog['version'] is None or now - _catalog['checked'] >= VERSION_CHECK_INTERVAL:
+        response = client.get_item(
+            TableName=TAG_STATS_TABLE,
+            Key={'tag': CATALOG_KEY},
+            ProjectionExpression='version'
+        )
+        _catalog['version'] = int(response.get('Item', {}).get('version', 0))
+        _catalog['checked'] = now
+    return _catalog['version']
+
+
+def bump_catalog_version(client):
+    """Invalidate catalog-wide answers (tag lists, facets) after a write"""
+    response = client.update_item(
+        TableName=TAG_STATS_TABLE,
+        Key={'tag': CATALOG_KEY},
+        UpdateExpression='ADD version :one',
+        ExpressionAttributeValues={':one': 1},
+        ReturnValues='UPDATED_NEW'
+    )
+    _catalog['version'] = int(response['Attributes']['version'])
+    _catalog['checked'] = time.monotonic()
+    return _catalog['version']
+
+
+def get_tag_versions(client, tags):
+    """
+    Current version of each tag's posting list, 0 for tags never written.
+    Re-read at most once every VERSION_CHECK_INTERVAL seconds per tag.
+    """
+    now = time.monotonic()
+    versions = {}
+    stale = []
+    for tag in tags:
+        known = _tag_versions.get(tag)
+        if known is None or now - known[1] >= VERSION_CHECK_INTERVAL:
+            stale.append(tag)
+        else:
+            versions[tag] = known[0]
+
+    if stale:
+        fetched = {tag: 0 for tag in stale}
+        for item in batch_get(client, TAG_STATS_TABLE, [{'tag': tag} for tag in stale], ['version']):
+            fetched[item['tag']] = int(item.get('version', 0))
+        for tag, version in fetched.items():
+            _tag_versions[tag] = (version, now)
+        versions.update(fetched)
+    return versions
+
+
+def note_tag_version(tag, version):
+    """Remember a tag version this container just wrote"""
+    _tag_versions[tag] = (int(version), time.monotonic())
@@ -1,23 +1,33 @@
-import json
-import boto3
-from boto3.dynamodb.conditions import Key
+from pixtag import runtime, tracing
+from pixtag.results import find_page, page_tag
+from pixtag.shards import normalize_tag
+from pixtag.urls import compact_links
 
-dynamodb = boto3.resource('dynamodb')
+dynamodb = runtime.lazy_client('dynamodb')
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+@runtime.handler
 def lambda_handler(event, context):
     """
     Find images by tags with minimum repetition counts
-    Query format: ?tags=person,car&counts=2,1
+    Query format: ?tags=person,car&counts=2,1&pageSize=100&cursor=...
+    Pass the returned nextCursor back as `cursor` to get the next page
+    Repeated queries are answered from the result cache until one of
+    their tags is written to (or RESULT_CACHE_TTL passes)
+    &format=compact returns {"baseUrl", "suffix", "ids"} instead of full
+    links (link = baseUrl + id + suffix); responses are gzip/brotli
+    compressed when the client sends Accept-Encoding
+    Responses carry an ETag; a client sending it back in If-None-Match
+    gets a 304 while none of the query's tags changed, answered from the
+    tag versions alone
     """
     try:
         # Parse query parameters
         params = event.get('queryStringParameters', {})
         if not params:
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'No query parameters provided'})
-            }
+            return runtime.error(400, 'No query parameters provided')
         
         tags_param = params.get('tags', '').split(',')
         counts_param = params.get('counts', '').split(',')
@@ -25,71 +35,75 @@ def lambda_handler(event, context):
         # Clean and validate input
         tags_with_counts = {}
         for i, tag in enumerate(tags_param):
-            tag = tag.strip().lower()
-            if tag:
-                count = int(counts_param[i]) if i < len(counts_param) else 1
+            if tag.strip():
+                try:
+                    tag = normalize_tag(tag)
+                except ValueError as e:
+                    return runtime.error(400, str(e))
+                # A missing or empty count means "at least once"
+                count = counts_param[i].strip() if i < len(counts_param) else ''
+                try:
+                    count = int(count or 1)
+                except ValueError:
+                    count = -1
+                if count < 0:
+                    return runtime.error(400, f'counts must be non-negative integers (tag {tag})')
+                count = max(count, 1)
                 tags_with_counts[tag] = max(tags_with_counts.get(tag, 0), count)
         
         if not tags_with_counts:
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'No valid tags provided'})
-            }
+            return runtime.error(400, 'No valid tags provided')
+        
+        try:
+            page_size = int(params.get('pageSize') or DEFAULT_PAGE_SIZE)
+        except ValueError:
+            page_size = 0
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            return runtime.error(400, f'pageSize must be between 1 and {MAX_PAGE_SIZE}')
+        
+        response_format = params.get('format', 'links')
+        if response_format not in ('links', 'compact'):
+            return runtime.error(400, 'format must be links or compact')
         
-        # Query the tag index table
-        tag_index_table = dynamodb.Table('assignment2-tag-index')
-        images_table = dynamodb.Table('assignment2-images')
+        cursor = params.get('cursor')
+        unchanged = runtime.not_modified(
+            event,
+            runtime.etag(page_tag(dynamodb, tags_with_counts, page_size, cursor), response_format)
+        )
+        if unchanged:
+            return unchanged
         
-        # Get all images containing each tag
-        image_sets = []
-        for tag, min_count in tags_with_counts.items():
-            response = tag_index_table.query(
-                KeyConditionExpression=Key('tag').eq(tag)
+        # Stream the tag index page by page (images with ALL tags) and
+        # look up their thumbnail URLs, unless the page is cached
+        try:
+            thumbnail_urls, next_cursor, tag = find_page(
+                dynamodb,
+                tags_with_counts,
+                page_size=page_size,
+                cursor=cursor
             )
-            
-            # Filter by minimum count
-            valid_images = set()
-            for item in response['Items']:
-                # Note: You'll need to ensure 'count' is stored in the tag-index table
-                if item.get('count', 1) >= min_count:
-                    valid_images.add(item['imageId'])
-            
-            image_sets.append(valid_images)
+        except ValueError as e:
+            return runtime.error(400, str(e))
         
-        # Find intersection (images with ALL tags)
-        if not image_sets:
-            matching_images = set()
-        else:
-            matching_images = image_sets[0]
-            for image_set in image_sets[1:]:
-                matching_images = matching_images.intersection(image_set)
+        # No ETag while thumbnails are pending: the page will still change
+        etag = runtime.etag(tag, response_format) if tag else None
         
-        # Get thumbnail URLs for matching images
-        thumbnail_urls = []
-        for image_id in matching_images:
-            response = images_table.get_item(Key={'imageId': image_id})
-            if 'Item' in response:
-                thumbnail_url = response['Item'].get('thumbnailUrl')
-                if thumbnail_url:
-                    thumbnail_urls.append(thumbnail_url)
+        if response_format == 'compact':
+            base_url, suffix, ids = compact_links(thumbnail_urls)
+            return runtime.respond({
+                'baseUrl': base_url,
+                'suffix': suffix,
+                'ids': ids,
+                'count': len(ids),
+                'nextCursor': next_cursor
+            }, event=event, etag=etag)
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({
-                'links': thumbnail_urls,
-                'count': len(thumbnail_urls)
-            })
-        }
+        return runtime.respond({
+            'links': thumbnail_urls,
+            'count': len(thumbnail_urls),
+            'nextCursor': next_cursor
+        }, event=event, etag=etag)
         
     except Exception as e:
-        print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)})
-        }
\ No newline at end of file
+        tracing.fail(e)
+        return runtime.error(500, str(e))
\ No newline at end of file
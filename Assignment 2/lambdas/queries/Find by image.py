@@ -1,8 +1,90 @@
-import json
+from pixtag import runtime, tracing
+from pixtag.detection import get_detector
+from pixtag.metadata import get_images
+from pixtag.payload import read_image
+from pixtag.similarity import rank_similar
+from pixtag.urls import compact_links
 
+dynamodb = runtime.lazy_client('dynamodb')
+
+# Created once per container so the detection cache stays warm
+detector = get_detector(dynamodb)
+
+DEFAULT_TOP_K = 50
+MAX_TOP_K = 500
+
+@runtime.handler
 def lambda_handler(event, context):
-    # TODO implement
-    return {
-        'statusCode': 200,
-        'body': json.dumps('Hello from Lambda!')
-    }
+    """
+    Find images with similar tags to uploaded image, best match first
+    Input: raw image bytes (application/octet-stream or image/*, topK in
+    the query string), multipart/form-data with an "image" part and an
+    optional "topK" field, or JSON {"imageData": "<base64>", "topK": 50}
+    Objects are detected by the YOLO Lambda unless the same image bytes
+    were seen before (detection cache)
+    A "format": "compact" field (or ?format=compact) returns baseUrl,
+    suffix and ids instead of full links
+    """
+    try:
+        # Decode the image once, straight into a memoryview
+        try:
+            payload = read_image(event)
+        except ValueError as e:
+            return runtime.error(400, str(e))
+        
+        with payload:
+            query = event.get('queryStringParameters') or {}
+            top_k = payload.fields.get('topK', query.get('topK', DEFAULT_TOP_K))
+            if isinstance(top_k, str) and top_k.isdigit():
+                top_k = int(top_k)
+            
+            if not isinstance(top_k, int) or not 1 <= top_k <= MAX_TOP_K:
+                return runtime.error(400, f'topK must be between 1 and {MAX_TOP_K}')
+            
+            response_format = payload.fields.get('format', query.get('format', 'links'))
+            if response_format not in ('links', 'compact'):
+                return runtime.error(400, 'format must be links or compact')
+            
+            # Detect objects (cached by SHA-256 of the image bytes)
+            tag_counts = detector.detect(payload.data)
+        
+        detected_tags = sorted(tag_counts)
+        tracing.annotate(detectionCache=detector.stats())
+        
+        if not detected_tags:
+            return runtime.respond({'links': [], 'scores': [], 'detectedTags': []})
+        
+        # Rank images by weighted overlap of their tag counts
+        ranked = rank_similar(dynamodb, tag_counts, top_k)
+        
+        # Get thumbnail URLs, keeping the ranking
+        images = get_images(dynamodb, [image_id for image_id, _ in ranked])
+        thumbnail_urls = []
+        scores = []
+        for image_id, score in ranked:
+            thumbnail_url = images.get(image_id, {}).get('thumbnailUrl')
+            if thumbnail_url:
+                thumbnail_urls.append(thumbnail_url)
+                scores.append(round(score, 4))
+        
+        if response_format == 'compact':
+            base_url, suffix, ids = compact_links(thumbnail_urls)
+            return runtime.respond({
+                'baseUrl': base_url,
+                'suffix': suffix,
+                'ids': ids,
+                'scores': scores,
+                'detectedTags': detected_tags,
+                'count': len(ids)
+            }, event=event)
+        
+        return runtime.respond({
+            'links': thumbnail_urls,
+            'scores': scores,
+            'detectedTags': detected_tags,
+            'count': len(thumbnail_urls)
+        }, event=event)
+        
+    except Exception as e:
+        tracing.fail(e)
+        return runtime.error(500, str(e))
\ No newline at end of file
@@ -1,64 +1,76 @@
 import json
-import boto3
+from pixtag import runtime, tracing
+from pixtag.metadata import get_images
+from pixtag.urls import resolve_image_id
 
-dynamodb = boto3.resource('dynamodb')
+dynamodb = runtime.lazy_client('dynamodb')
 
+MAX_BATCH_URLS = 100
+
+@runtime.handler
 def lambda_handler(event, context):
     """
     Find full-size image URL from thumbnail URL
     Input: {"thumbnailUrl": "https://assignment2-thumbnails-xxxx.s3.amazonaws.com/thumb/UUID.jpg"}
+    Batch input: {"thumbnailUrls": ["...", "..."]} (up to 100, one BatchGetItem)
     """
     try:
         # Parse input
         body = json.loads(event.get('body', '{}'))
+        if 'thumbnailUrls' in body:
+            return resolve_batch(body['thumbnailUrls'])
+        
         thumbnail_url = body.get('thumbnailUrl')
         
         if not thumbnail_url:
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'thumbnailUrl required'})
-            }
+            return runtime.error(400, 'thumbnailUrl required')
         
-        # Extract imageId from thumbnail URL
-        # Format: https://assignment2-thumbnails-xxxx.s3.amazonaws.com/thumb/UUID.jpg
-        try:
-            image_id = thumbnail_url.split('/thumb/')[1].split('.')[0]
-        except:
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid thumbnail URL format'})
-            }
+        # Resolve imageId from the thumbnail URL (S3 virtual-host,
+        # path-style or CloudFront; presigned query strings are ignored)
+        image_id = resolve_image_id(dynamodb, thumbnail_url)
+        if image_id is None:
+            return runtime.error(400, 'Invalid thumbnail URL format')
         
-        # Query DynamoDB
-        table = dynamodb.Table('assignment2-images')
-        response = table.get_item(Key={'imageId': image_id})
+        # Query DynamoDB (served from the warm cache when possible)
+        images = get_images(dynamodb, [image_id], ('fullImageUrl', 'tags'))
         
-        if 'Item' not in response:
-            return {
-                'statusCode': 404,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Image not found'})
-            }
+        if image_id not in images:
+            return runtime.error(404, 'Image not found')
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({
-                'fullImageUrl': response['Item'].get('fullImageUrl', ''),
-                'imageId': image_id,
-                'tags': response['Item'].get('tags', [])
-            })
-        }
+        return runtime.respond({
+            'fullImageUrl': images[image_id].get('fullImageUrl', ''),
+            'imageId': image_id,
+            'tags': sorted(images[image_id].get('tags', []))
+        })
         
     except Exception as e:
-        print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)})
-        }
\ No newline at end of file
+        tracing.fail(e)
+        return runtime.error(500, str(e))
+
+def resolve_batch(thumbnail_urls):
+    """Resolve many thumbnails at once for the gallery view"""
+    if not isinstance(thumbnail_urls, list) or not 1 <= len(thumbnail_urls) <= MAX_BATCH_URLS:
+        return runtime.error(400, f'thumbnailUrls must be a list of 1 to {MAX_BATCH_URLS} URLs')
+    
+    image_ids = [resolve_image_id(dynamodb, url) for url in thumbnail_urls]
+    images = get_images(
+        dynamodb,
+        [image_id for image_id in image_ids if image_id is not None],
+        ('fullImageUrl', 'tags')
+    )
+    
+    results = []
+    for url, image_id in zip(thumbnail_urls, image_ids):
+        if image_id is None:
+            results.append({'thumbnailUrl': url, 'error': 'Invalid thumbnail URL format'})
+        elif image_id not in images:
+            results.append({'thumbnailUrl': url, 'imageId': image_id, 'error': 'Image not found'})
+        else:
+            results.append({
+                'thumbnailUrl': url,
+                'imageId': image_id,
+                'fullImageUrl': images[image_id].get('fullImageUrl', ''),
+                'tags': sorted(images[image_id].get('tags', []))
+            })
+    
+    return runtime.respond({'results': results})
@@ -0,0 +1,60 @@
+from pixtag import runtime, tracing
+from pixtag.facets import co_occurring_tags, search_tags, top_tags
+from pixtag.shards import normalize_tag
+from pixtag.versions import get_catalog_version
+
+dynamodb = runtime.lazy_client('dynamodb')
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+@runtime.handler
+def lambda_handler(event, context):
+    """
+    Tag autocomplete and facet counts from assignment2-tag-stats
+    Query format:
+      ?prefix=ca&limit=10    tags starting with "ca", most used first
+      ?limit=20              most used tags
+      ?tags=person,car       tags that appear together with person and car
+    Answers come from the warm container's cache until the catalog changes;
+    until then a client sending back the ETag in If-None-Match gets a 304
+    """
+    try:
+        params = event.get('queryStringParameters') or {}
+
+        try:
+            limit = int(params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= MAX_LIMIT:
+            return runtime.error(400, f'limit must be between 1 and {MAX_LIMIT}')
+
+        try:
+            selection = [normalize_tag(tag) for tag in params.get('tags', '').split(',') if tag.strip()]
+        except ValueError as e:
+            return runtime.error(400, str(e))
+
+        etag = runtime.etag(get_catalog_version(dynamodb), sorted(params.items()))
+        unchanged = runtime.not_modified(event, etag)
+        if unchanged:
+            return unchanged
+
+        body = {}
+        if selection:
+            tags, sample_size, complete = co_occurring_tags(dynamodb, selection, limit)
+            body['selection'] = sorted(set(selection))
+            body['sampleSize'] = sample_size
+            body['complete'] = complete
+        elif 'prefix' in params:
+            tags = search_tags(dynamodb, params['prefix'], limit)
+            body['prefix'] = params['prefix'].strip().lower()
+        else:
+            tags = top_tags(dynamodb, limit)
+
+        body['tags'] = [{'tag': tag, 'count': count} for tag, count in tags]
+
+        return runtime.respond(body, etag=etag)
+
+    except Exception as e:
+        tracing.fail(e)
+        return runtime.error(500, str(e))
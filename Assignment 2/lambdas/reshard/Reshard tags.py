@@ -0,0 +1,44 @@
+import json
+import time
+from pixtag import runtime
+from pixtag.tag_index import finish_reshard, pending_reshards
+from pixtag.versions import VERSION_CHECK_INTERVAL
+
+dynamodb = runtime.lazy_client('dynamodb')
+
+# Left for the tag in progress when the next one would be started
+MIN_REMAINING_MS = 60 * 1000
+
+@runtime.handler
+def lambda_handler(event, context):
+    """
+    Finish moving hot tags to more tag-index shards
+    Input: a scheduled EventBridge event (e.g. rate(5 minutes))
+    Output: every tag-stats counter with previousShards (a move Manage
+    tags or ingest started) has its rows in the new shards and
+    previousShards removed. A run that stops part-way is picked up by
+    the next one.
+    """
+    started = time.perf_counter()
+    moved = {}
+    waiting = []
+    for tag, old_shards, new_shards, since in pending_reshards(dynamodb):
+        # Writers may use the old layout until they re-read the tag version
+        if time.time() - since < VERSION_CHECK_INTERVAL:
+            waiting.append(tag)
+            continue
+        if context is not None and context.get_remaining_time_in_millis() < MIN_REMAINING_MS:
+            waiting.append(tag)
+            continue
+        moved[tag] = {
+            'shards': [old_shards, new_shards],
+            'rowsMoved': finish_reshard(dynamodb, tag, old_shards, new_shards)
+        }
+
+    summary = {
+        'resharded': moved,
+        'waiting': waiting,
+        'seconds': round(time.perf_counter() - started, 1)
+    }
+    print(json.dumps({'reshard': summary}))
+    return summary
@@ -0,0 +1,37 @@
+import json
+import time
+from pixtag import bitmaps, runtime
+from pixtag.journal import mark_published, trim_journal
+from pixtag.versions import VERSION_CHECK_INTERVAL
+
+dynamodb = runtime.lazy_client('dynamodb')
+s3 = runtime.lazy_client('s3')
+
+@runtime.handler
+def lambda_handler(event, context):
+    """
+    Rebuild the tag bitmap snapshot that Find by Tags answers from
+    Input: a scheduled EventBridge event (e.g. rate(15 minutes))
+    Output: the snapshot in s3://SNAPSHOT_BUCKET/SNAPSHOT_KEY, and the
+    change-journal rows it made redundant deleted
+    """
+    started = time.perf_counter()
+    data, since, journal = bitmaps.build_snapshot(dynamodb)
+    location = bitmaps.publish_snapshot(data, s3)
+    mark_published(dynamodb, since)
+
+    # Containers notice the new snapshot within VERSION_CHECK_INTERVAL;
+    # until then some may still need the rows about to be trimmed
+    time.sleep(VERSION_CHECK_INTERVAL)
+    trimmed = trim_journal(dynamodb, journal, since)
+
+    summary = {
+        'location': location,
+        'bytes': len(data),
+        'since': since,
+        'journalRows': len(journal),
+        'trimmed': trimmed,
+        'seconds': round(time.perf_counter() - started, 1)
+    }
+    print(json.dumps({'snapshot': summary}))
+    return summary
@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from urllib.parse import unquote_plus
+from PIL import Image, ImageOps
+from pixtag import IMAGES_TABLE, runtime
+
+s3 = runtime.lazy_client('s3')
+dynamodb = runtime.lazy_client('dynamodb')
+
+THUMBNAILS_BUCKET = os.environ.get('THUMBNAILS_BUCKET', 'assignment2-thumbnails-1812')
+THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', '256'))
+THUMBNAIL_FORMAT = os.environ.get('THUMBNAIL_FORMAT', 'JPEG').upper()  # JPEG or WEBP
+THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY', '80'))
+
+# Uploads bigger than this are spooled to /tmp instead of memory
+SPOOL_LIMIT = 8 * 1024 * 1024
+READ_CHUNK = 1024 * 1024
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '4'))
+
+@runtime.handler
+def lambda_handler(event, context):
+    """
+    Create thumbnails for new uploads in the full_images bucket
+    Input: S3 ObjectCreated event (one or more records)
+    Output: thumb/<imageId>.jpg (or .webp) in the thumbnails bucket, and
+    thumbnailUrl/thumbnailKey on the image's row in assignment2-images
+    """
+    records = [record for record in event.get('Records', []) if 's3' in record]
+    
+    # Records are independent, so process them in parallel; PIL releases
+    # the GIL while decoding and resizing
+    workers = max(1, min(MAX_WORKERS, len(records)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(process_record, records))
+    
+    print(json.dumps({'thumbnails': results}))
+    failed = [result for result in results if result['status'] != 'success']
+    if failed:
+        # Let Lambda retry the event; finished images are simply redone
+        raise RuntimeError(f"{len(failed)} of {len(results)} thumbnails failed")
+    return {'processed': len(results)}
+
+def process_record(record):
+    bucket = record['s3']['bucket']['name']
+    key = unquote_plus(record['s3']['object']['key'])
+    image_id = os.path.splitext(os.path.basename(key))[0]
+    
+    try:
+        with SpooledTemporaryFile(max_size=SPOOL_LIMIT) as source:
+            # Stream the upload instead of reading it into one bytes object
+            body = s3.get_object(Bucket=bucket, Key=key)['Body']
+            shutil.copyfileobj(body, source, READ_CHUNK)
+            source.seek(0)
+            thumbnail, content_type, extension = make_thumbnail(source)
+        
+        thumbnail_key = f'thumb/{image_id}.{extension}'
+        s3.put_object(
+            Bucket=THUMBNAILS_BUCKET,
+            Key=thumbnail_key,
+            Body=thumbnail,
+            ContentType=content_type,
+            CacheControl='public, max-age=31536000, immutable'
+        )
+        thumbnail_url = f'https://{THUMBNAILS_BUCKET}.s3.amazonaws.com/{thumbnail_key}'
+        
+        dynamodb.update_item(
+            TableName=IMAGES_TABLE,
+            Key={'imageId': image_id},
+            UpdateExpression='SET thumbnailUrl = :url, thumbnailKey = :key',
+            ExpressionAttributeValues={':url': thumbnail_url, ':key': thumbnail_key}
+        )
+        return {'imageId': image_id, 'status': 'success', 'thumbnailUrl': thumbnail_url}
+    
+    except Exception as e:
+        print(f"Error: {key}: {str(e)}")
+        return {'imageId': image_id, 'status': 'error', 'error': str(e)}
+
+def make_thumbnail(source, size=THUMBNAIL_SIZE, image_format=THUMBNAIL_FORMAT):
+    """
+    Downscale an image file object to fit in size x size.
+    For JPEGs draft() makes libjpeg decode at 1/2, 1/4 or 1/8 scale, so a
+    24 MP photo is never decoded at full resolution.
+    Returns (bytes, content_type, extension).
+    """
+    with Image.open(source) as image:
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size), Image.LANCZOS)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        
+        output = BytesIO()
+        if image_format == 'WEBP':
+            image.save(output, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+            content_type, extension = 'image/webp', 'webp'
+        else:
+            image.save(output, 'JPEG', quality=THUMBNAIL_QUALITY, progressive=True, optimize=True)
+            content_type, extension = 'image/jpeg', 'jpg'
+    
+    return output.getvalue(), content_type, extension
@@ -0,0 +1,235 @@
+import json
+import math
+import os
+import uuid
+from botocore.exceptions import ClientError
+from datetime import datetime, timezone
+from pixtag import IMAGES_TABLE, runtime, tracing
+from pixtag.stats import add_to_tag_counts
+from pixtag.versions import CATALOG_KEY
+
+# SigV4 is required for presigned multipart URLs
+s3 = runtime.lazy_client('s3', signature_version='s3v4')
+dynamodb = runtime.lazy_client('dynamodb')
+lambda_client = runtime.lazy_client('lambda')
+sqs = runtime.lazy_client('sqs')
+
+FULL_IMAGES_BUCKET = os.environ.get('FULL_IMAGES_BUCKET', 'assignment2-images-1812')
+THUMBNAIL_FUNCTION = os.environ.get('THUMBNAIL_FUNCTION', 'assignment2-thumbnail')
+DETECTION_QUEUE_URL = os.environ.get('DETECTION_QUEUE_URL')
+
+PART_SIZE = 8 * 1024 * 1024      # S3 minimum is 5 MB (except the last part)
+MAX_PARTS = 10000
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(200 * 1024 * 1024)))
+URL_EXPIRY = 3600
+CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/gif': 'gif'
+}
+
+@runtime.handler
+def lambda_handler(event, context):
+    """
+    Multipart upload straight from the browser to the full_images bucket
+    Input: {"action": "start", "contentType": "image/jpeg", "size": 12345678}
+           {"action": "status", "imageId": "...", "uploadId": "...", "partNumbers": [3, 4]}
+           {"action": "complete", "imageId": "...", "uploadId": "...", "parts": [{"partNumber": 1, "etag": "..."}]}
+           {"action": "abort", "imageId": "...", "uploadId": "..."}
+    The browser PUTs each part to its presigned URL (in parallel) and keeps
+    the ETag response header. After a failure, "status" lists the parts
+    S3 already has and re-signs the missing ones.
+    """
+    try:
+        body = json.loads(event.get('body') or '{}')
+        action = body.get('action')
+        
+        if action == 'start':
+            return start_upload(body)
+        if action not in ('status', 'complete', 'abort'):
+            return runtime.error(400, 'action must be start, status, complete or abort')
+        
+        image_id = body.get('imageId')
+        upload_id = body.get('uploadId')
+        extension = body.get('extension', 'jpg')
+        if not image_id or not upload_id or extension not in CONTENT_TYPES.values():
+            return runtime.error(400, 'imageId, uploadId and a valid extension required')
+        # imageId goes into the S3 key and the table key; only accept the
+        # form "start" hands out
+        if not is_image_id(image_id):
+            return runtime.error(400, 'imageId must be the UUID returned by start')
+        key = f'{image_id}.{extension}'
+        
+        if action == 'status':
+            return upload_status(key, upload_id, body.get('partNumbers', []))
+        if action == 'complete':
+            parts = body.get('parts')
+            if parts and not are_parts(parts):
+                return runtime.error(400, 'parts must be a list of {"partNumber": int, "etag": str}')
+            return complete_upload(image_id, key, upload_id, parts)
+        
+        s3.abort_multipart_upload(Bucket=FULL_IMAGES_BUCKET, Key=key, UploadId=upload_id)
+        return runtime.respond({'imageId': image_id, 'status': 'aborted'})
+        
+    except Exception as e:
+        tracing.fail(e)
+        return runtime.error(500, str(e))
+
+def start_upload(body):
+    content_type = body.get('contentType')
+    size = body.get('size')
+    if content_type not in CONTENT_TYPES:
+        return runtime.error(400, f'contentType must be one of {sorted(CONTENT_TYPES)}')
+    if not isinstance(size, int) or not 0 < size <= MAX_UPLOAD_BYTES:
+        return runtime.error(400, f'size must be between 1 and {MAX_UPLOAD_BYTES} bytes')
+    
+    # Bigger files get bigger parts so they stay under the part limit
+    part_size = max(PART_SIZE, math.ceil(size / MAX_PARTS))
+    part_count = math.ceil(size / part_size)
+    
+    image_id = str(uuid.uuid4())
+    extension = CONTENT_TYPES[content_type]
+    key = f'{image_id}.{extension}'
+    upload = s3.create_multipart_upload(
+        Bucket=FULL_IMAGES_BUCKET,
+        Key=key,
+        ContentType=content_type
+    )
+    
+    return runtime.respond({
+        'imageId': image_id,
+        'uploadId': upload['UploadId'],
+        'extension': extension,
+        'partSize': part_size,
+        'parts': presign_parts(key, upload['UploadId'], range(1, part_count + 1))
+    })
+
+def is_image_id(value):
+    try:
+        return isinstance(value, str) and str(uuid.UUID(value)) == value
+    except ValueError:
+        return False
+
+def are_parts(value):
+    """A client's part list: [{"partNumber": 1..MAX_PARTS, "etag": "..."}]"""
+    return isinstance(value, list) and all(
+        isinstance(part, dict)
+        and type(part.get('partNumber')) is int and 1 <= part['partNumber'] <= MAX_PARTS
+        and isinstance(part.get('etag'), str) and part['etag']
+        for part in value
+    )
+
+def upload_status(key, upload_id, part_numbers):
+    uploaded = list_uploaded_parts(key, upload_id)
+    done = set(part['partNumber'] for part in uploaded)
+    wanted = [n for n in part_numbers if isinstance(n, int) and 1 <= n <= MAX_PARTS and n not in done]
+    return runtime.respond({
+        'uploadedParts': uploaded,
+        'parts': presign_parts(key, upload_id, wanted)
+    })
+
+def complete_upload(image_id, key, upload_id, parts):
+    try:
+        # Without a part list (e.g. the browser lost its ETags), use S3's own
+        if not parts:
+            parts = list_uploaded_parts(key, upload_id)
+        s3.complete_multipart_upload(
+            Bucket=FULL_IMAGES_BUCKET,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': sorted(
+                ({'PartNumber': part['partNumber'], 'ETag': part['etag']} for part in parts),
+                key=lambda part: part['PartNumber']
+            )}
+        )
+    except ClientError as e:
+        # A retried "complete" finds the upload already finished
+        if e.response['Error']['Code'] != 'NoSuchUpload':
+            raise
+    
+    try:
+        head = s3.head_object(Bucket=FULL_IMAGES_BUCKET, Key=key)
+    except ClientError as e:
+        # Neither in progress nor finished: aborted, or never started
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            raise
+        return runtime.error(404, 'Upload not found')
+    full_image_url = f'https://{FULL_IMAGES_BUCKET}.s3.amazonaws.com/{key}'
+    
+    # update_item, not put_item: the thumbnail Lambda may already have
+    # written thumbnailUrl for this image
+    response = dynamodb.update_item(
+        TableName=IMAGES_TABLE,
+        Key={'imageId': image_id},
+        UpdateExpression=(
+            'SET fullImageUrl = :url, fullImageKey = :key, contentType = :type, '
+            'fileSize = :size, uploadedAt = if_not_exists(uploadedAt, :now), '
+            'tagCounts = if_not_exists(tagCounts, :empty)'
+        ),
+        ExpressionAttributeValues={
+            ':url': full_image_url,
+            ':key': key,
+            ':type': head.get('ContentType', ''),
+            ':size': head['ContentLength'],
+            ':now': datetime.now(timezone.utc).isoformat(),
+            ':empty': {}
+        },
+        ReturnValues='ALL_OLD'
+    )
+    # Count each image once, even when "complete" is retried
+    if 'uploadedAt' not in response.get('Attributes', {}):
+        add_to_tag_counts(dynamodb, {CATALOG_KEY: 1})
+    
+    queue_processing(image_id, key)
+    return runtime.respond({'imageId': image_id, 'fullImageUrl': full_image_url, 'status': 'uploaded'})
+
+def queue_processing(image_id, key):
+    """Hand the new image to the thumbnail Lambda and the detection queue"""
+    s3_event = {'Records': [{
+        's3': {'bucket': {'name': FULL_IMAGES_BUCKET}, 'object': {'key': key}}
+    }]}
+    lambda_client.invoke(
+        FunctionName=THUMBNAIL_FUNCTION,
+        InvocationType='Event',
+        Payload=json.dumps(s3_event)
+    )
+    if DETECTION_QUEUE_URL:
+        sqs.send_message(
+            QueueUrl=DETECTION_QUEUE_URL,
+            MessageBody=json.dumps({'imageId': image_id, 'bucket': FULL_IMAGES_BUCKET, 'key': key})
+        )
+    else:
+        print("Warning: DETECTION_QUEUE_URL not set, skipping detection")
+
+def list_uploaded_parts(key, upload_id):
+    parts = []
+    kwargs = {'Bucket': FULL_IMAGES_BUCKET, 'Key': key, 'UploadId': upload_id}
+    while True:
+        response = s3.list_parts(**kwargs)
+        parts.extend(
+            {'partNumber': part['PartNumber'], 'etag': part['ETag'], 'size': part['Size']}
+            for part in response.get('Parts', [])
+        )
+        if not response.get('IsTruncated'):
+            return parts
+        kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+
+def presign_parts(key, upload_id, part_numbers):
+    # Signing is local (no AWS call), so thousands of parts are cheap
+    return [
+        {
+            'partNumber': part_number,
+            'url': s3.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': FULL_IMAGES_BUCKET,
+                    'Key': key,
+                    'UploadId': upload_id,
+                    'PartNumber': part_number
+                },
+                ExpiresIn=URL_EXPIRY
+            )
+        }
+        for part_number in part_numbers
+    ]
@@ -0,0 +1,109 @@
+import base64
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pixtag import runtime
+from pixtag.batch import chunked
+from pixtag.detection import get_detector
+from pixtag.tagging import apply_detections
+
+s3 = runtime.lazy_client('s3')
+dynamodb = runtime.lazy_client('dynamodb')
+
+# Images per inference call; the SQS trigger's BatchSize (plus a short
+# MaximumBatchingWindowInSeconds) decides how many arrive per invocation
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '8'))
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '8'))
+
+# Loaded on first use and kept for the life of the container, so the
+# model load is paid once per warm container rather than once per image
+detector = None
+
+def get_worker_detector():
+    global detector
+    if detector is None:
+        detector = get_detector(dynamodb, default='yolo')
+    return detector
+
+@runtime.handler
+def lambda_handler(event, context):
+    """
+    Detect objects in new uploads and tag them
+    Input: SQS event, one message per upload: {"imageId", "bucket", "key"}
+           or a direct invoke {"images": ["<base64>" or {"bucket", "key"}, ...]}
+           (big query images come as S3 references, see LambdaDetector)
+    Output: for SQS, tags/tagCounts on assignment2-images plus rows in
+            assignment2-tag-index, and batchItemFailures so only failed
+            messages are retried (needs ReportBatchItemFailures on the
+            trigger); for a direct invoke {"detections": [{"tagCounts"}]}
+    """
+    if 'images' in event:
+        images = [
+            s3.get_object(Bucket=image['bucket'], Key=image['key'])['Body'].read()
+            if isinstance(image, dict) else base64.b64decode(image)
+            for image in event['images']
+        ]
+        detections = get_worker_detector().detect_batch(images)
+        return {'detections': [{'tagCounts': tag_counts} for tag_counts in detections]}
+
+    messages = []
+    failures = []
+    for record in event.get('Records', []):
+        try:
+            body = json.loads(record['body'])
+            messages.append((record['messageId'], body['imageId'], body['bucket'], body['key']))
+        except (KeyError, ValueError) as e:
+            # A malformed message will never succeed; don't retry it
+            print(f"Skipping message {record.get('messageId')}: {str(e)}")
+
+    # Downloads are I/O bound, so fetch the whole batch concurrently
+    workers = max(1, min(MAX_WORKERS, len(messages)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        downloads = list(executor.map(download, messages))
+
+    ready = []
+    for message, image in zip(messages, downloads):
+        if image is None:
+            failures.append(message[0])
+        else:
+            ready.append((message, image))
+
+    # Several images per model call instead of one call per image
+    detections = {}
+    for batch in chunked(ready, BATCH_SIZE):
+        try:
+            results = get_worker_detector().detect_batch([image for _, image in batch])
+        except Exception as e:
+            print(f"Error: detection failed for {len(batch)} images: {str(e)}")
+            failures.extend(message[0] for message, _ in batch)
+            continue
+        for (message, _), tag_counts in zip(batch, results):
+            detections[message] = tag_counts
+
+    statuses = apply_detections(
+        dynamodb,
+        {message[1]: tag_counts for message, tag_counts in detections.items()}
+    )
+    for message in detections:
+        status = statuses.get(message[1], {}).get('status')
+        if status == 'error':
+            failures.append(message[0])
+        elif status == 'not_found':
+            # Deleted before detection ran; nothing left to tag
+            print(f"Skipping {message[1]}: image not found")
+
+    print(json.dumps({
+        'messages': len(event.get('Records', [])),
+        'detected': len(detections),
+        'failed': len(failures),
+        'detectionCache': get_worker_detector().stats()
+    }))
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failures]}
+
+def download(message):
+    _, image_id, bucket, key = message
+    try:
+        return s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    except Exception as e:
+        print(f"Error: {image_id}: {str(e)}")
+        return None
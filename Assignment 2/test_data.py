@@ -0,0 +1,135 @@
+# test_data.py
+# Synthetic PixTag catalogs for benchmarks and local testing.
+# Tag frequencies follow a Zipf distribution over the COCO labels YOLO
+# detects, so a few tags (person, car) are on most images and the long
+# tail is rare, as in a real photo collection.
+# Usage: python test_data.py --images 10000 [--endpoint-url http://localhost:8000]
+import argparse
+import os
+import random
+import sys
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambdas'))
+
+from pixtag import IMAGES_TABLE, TAG_INDEX_TABLE, TAG_STATS_TABLE
+from pixtag.batch import batch_write, put_request
+from pixtag.shards import target_shards
+from pixtag.stats import add_to_tag_counts, set_tag_shards
+from pixtag.tag_index import index_item
+from pixtag.versions import CATALOG_KEY, bump_catalog_version
+
+FULL_IMAGES_BUCKET = 'assignment2-images-1812'
+THUMBNAILS_BUCKET = 'assignment2-thumbnails-1812'
+
+VOCABULARY = [
+    'person', 'car', 'chair', 'cup', 'bottle', 'dog', 'cat', 'bicycle', 'bird', 'truck',
+    'dining table', 'book', 'potted plant', 'cell phone', 'bus', 'motorcycle', 'bench',
+    'handbag', 'backpack', 'couch', 'tv', 'laptop', 'umbrella', 'traffic light', 'clock',
+    'boat', 'horse', 'bowl', 'sheep', 'cow', 'vase', 'bed', 'wine glass', 'sink', 'train',
+    'airplane', 'kite', 'skateboard', 'surfboard', 'sports ball', 'tie', 'remote', 'keyboard',
+    'suitcase', 'elephant', 'zebra', 'giraffe', 'bear', 'pizza', 'donut', 'cake', 'banana',
+    'apple', 'orange', 'broccoli', 'carrot', 'sandwich', 'hot dog', 'oven', 'refrigerator',
+    'microwave', 'toaster', 'fork', 'knife', 'spoon', 'mouse', 'teddy bear', 'scissors',
+    'toothbrush', 'hair drier', 'fire hydrant', 'stop sign', 'parking meter', 'frisbee',
+    'skis', 'snowboard', 'baseball bat', 'baseball glove', 'tennis racket', 'toilet'
+]
+
+
+def zipf_weights(size, exponent=1.1):
+    """Weight of the rank-r item is 1 / r^exponent"""
+    return [1.0 / (rank ** exponent) for rank in range(1, size + 1)]
+
+
+def generate_images(count, vocabulary=VOCABULARY, exponent=1.1, max_tags=5, seed=0):
+    """
+    Yield (imageId, {tag: count}) for count synthetic images.
+    Each image gets 1..max_tags distinct Zipf-drawn tags; repeat counts
+    are small and skewed towards 1, like YOLO detections.
+    """
+    rng = random.Random(seed)
+    weights = zipf_weights(len(vocabulary), exponent)
+    for _ in range(count):
+        wanted = rng.randint(1, max_tags)
+        tags = {}
+        while len(tags) < wanted:
+            tag = rng.choices(vocabulary, weights)[0]
+            tags[tag] = min(1 + int(rng.expovariate(1.5)), 20)
+        yield str(uuid.UUID(int=rng.getrandbits(128), version=4)), tags
+
+
+def image_item(image_id, tag_counts):
+    thumbnail_key = f'thumb/{image_id}.jpg'
+    return {
+        'imageId': image_id,
+        'fullImageUrl': f'https://{FULL_IMAGES_BUCKET}.s3.amazonaws.com/{image_id}.jpg',
+        'fullImageKey': f'{image_id}.jpg',
+        'thumbnailUrl': f'https://{THUMBNAILS_BUCKET}.s3.amazonaws.com/{thumbnail_key}',
+        'thumbnailKey': thumbnail_key,
+        'tags': set(tag_counts),
+        'tagCounts': tag_counts
+    }
+
+
+def seed_catalog(client, count, exponent=1.1, seed=0, chunk_size=10000):
+    """
+    Write a synthetic catalog of count images: metadata rows, tag-index
+    rows, per-tag counters and the catalog size. Takes a DynamoDB client
+    with plain Python values (boto3.resource('dynamodb').meta.client).
+    Hot tags are written straight into the shards their final size calls
+    for, rather than resharded as they grow.
+    Returns the image ids in generation order.
+    """
+    # A dry run of the same generator gives each tag's final size
+    sizes = Counter(tag for _, tags in generate_images(count, exponent=exponent, seed=seed) for tag in tags)
+    shards = {tag: target_shards(size) for tag, size in sizes.items()}
+
+    image_ids = []
+    tag_totals = Counter()
+    images = generate_images(count, exponent=exponent, seed=seed)
+    while True:
+        chunk = [image for _, image in zip(range(chunk_size), images)]
+        if not chunk:
+            break
+        batch_write(
+            client,
+            IMAGES_TABLE,
+            [put_request(image_item(image_id, tags)) for image_id, tags in chunk],
+            ('imageId',)
+        )
+        batch_write(
+            client,
+            TAG_INDEX_TABLE,
+            [put_request(index_item(tag, image_id, tag_count, shards[tag]))
+             for image_id, tags in chunk for tag, tag_count in tags.items()],
+            ('tag', 'imageId')
+        )
+        for image_id, tags in chunk:
+            image_ids.append(image_id)
+            tag_totals.update(tags.keys())
+
+    tag_totals[CATALOG_KEY] = len(image_ids)
+    add_to_tag_counts(client, tag_totals)
+    set_tag_shards(client, {tag: count for tag, count in shards.items() if count > 1})
+    bump_catalog_version(client)
+    return image_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a synthetic PixTag catalog')
+    parser.add_argument('--images', type=int, default=10000)
+    parser.add_argument('--exponent', type=float, default=1.1, help='Zipf exponent of tag frequencies')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--endpoint-url', help='e.g. http://localhost:8000 for DynamoDB Local')
+    parser.add_argument('--region', default='us-east-1')
+    args = parser.parse_args()
+
+    import boto3
+    dynamodb = boto3.resource('dynamodb', region_name=args.region, endpoint_url=args.endpoint_url)
+    image_ids = seed_catalog(dynamodb.meta.client, args.images, args.exponent, args.seed)
+    print(f"✅ Seeded {len(image_ids)} images into {IMAGES_TABLE}, {TAG_INDEX_TABLE} and {TAG_STATS_TABLE}")
+
+
+if __name__ == '__main__':
+    main()
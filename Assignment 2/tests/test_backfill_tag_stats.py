@@ -0,0 +1,30 @@
+import test_data
+from backfill_tag_stats import backfill_tag_stats
+from pixtag import TAG_STATS_TABLE
+from pixtag.versions import CATALOG_KEY
+
+
+def stats_items(client):
+    return {item['tag']: item for item in client.scan(TableName=TAG_STATS_TABLE)['Items']}
+
+
+def test_counters_match_the_index_and_stale_ones_are_zeroed(tables):
+    test_data.seed_catalog(tables, 200, seed=3)
+    seeded = stats_items(tables)
+    for tag, count in (('gone', 7), ('dog', 999999)):
+        tables.update_item(
+            TableName=TAG_STATS_TABLE, Key={'tag': tag},
+            UpdateExpression='SET imageCount = :count, version = :version',
+            ExpressionAttributeValues={':count': count, ':version': 4}
+        )
+    tables.put_item(TableName=TAG_STATS_TABLE, Item={'tag': '#snapshot', 'since': 123})
+
+    counts = backfill_tag_stats()
+
+    items = stats_items(tables)
+    assert items['gone']['imageCount'] == 0
+    assert items['gone']['version'] == 4
+    assert items['dog']['imageCount'] == counts['dog'] == seeded['dog']['imageCount']
+    assert {tag: items[tag]['imageCount'] for tag in counts} == dict(counts)
+    assert items[CATALOG_KEY]['imageCount'] == 200
+    assert items['#snapshot'] == {'tag': '#snapshot', 'since': 123}
@@ -0,0 +1,163 @@
+import boto3
+import pytest
+
+import test_data
+from conftest import all_pages, brute_force, image_counts
+from pixtag import IMAGES_TABLE, bitmaps, journal, search, shards
+from pixtag.deletion import delete_images
+from pixtag.journal import get_published_since, mark_published, now_ms
+from pixtag.tag_index import iter_image_ids
+from pixtag.tagging import apply_detections, mutate_tags
+
+QUERIES = [
+    {'person': 1},
+    {'person': 1, 'car': 1},
+    {'car': 1, 'person': 2},
+    {'person': 2, 'car': 2},
+    {'person': 1, 'chair': 1, 'cup': 1},
+    {'kite': 1, 'person': 1},
+    {'dog': 3},
+    {'zebra': 1},
+]
+
+
+@pytest.fixture
+def catalog(tables, monkeypatch):
+    monkeypatch.setattr(bitmaps, 'SNAPSHOT_BUCKET', None)
+    monkeypatch.setattr(bitmaps, 'SNAPSHOT_PATH', None)
+    test_data.seed_catalog(tables, 300, seed=5)
+    return tables
+
+
+def expected(client, tags):
+    return sorted(set.intersection(*(set(iter_image_ids(client, tag)) for tag in tags)))
+
+
+def publish(client):
+    data, since, _ = bitmaps.build_snapshot(client)
+    bitmaps.publish_snapshot(data)
+    mark_published(client, since)
+    # Don't wait the check intervals for the container to notice
+    bitmaps._state['checked'] = None
+    journal._published['since'] = None
+    assert bitmaps.current_snapshot().since == since
+
+
+def answered_from_bitmaps(monkeypatch):
+    """Fails any query that falls back to the tag index"""
+    def index_used(*args, **kwargs):
+        raise AssertionError('answered from the tag index')
+    monkeypatch.setattr(search, '_open_tags', index_used)
+
+
+def write_after_snapshot(client):
+    """
+    Every kind of write the journal has to carry: added and removed tags,
+    recounted detections, deleted images and images new since the snapshot
+    """
+    images = sorted(image_counts(client))
+    s3 = boto3.client('s3')
+    for bucket in (test_data.FULL_IMAGES_BUCKET, test_data.THUMBNAILS_BUCKET):
+        s3.create_bucket(Bucket=bucket)
+
+    mutate_tags(client, [(image_id, image_id) for image_id in images[:60]], ['person', 'zebra'])
+    mutate_tags(client, [(image_id, image_id) for image_id in images[40:120]], ['car'], add=False)
+    apply_detections(client, {image_id: {'person': 3, 'dog': 4} for image_id in images[100:140]})
+    delete_images(client, s3, [(image_id, image_id) for image_id in images[::9]])
+    new_images = [f'{image_id[:-1]}z' for image_id in images[::11]]
+    for image_id in new_images:
+        # As uploaded: no tags until detection has run
+        item = test_data.image_item(image_id, {})
+        del item['tags']
+        client.put_item(TableName=IMAGES_TABLE, Item=item)
+    apply_detections(client, {image_id: {'person': 2, 'car': 1, 'kite': 5} for image_id in new_images})
+
+
+def test_snapshot_with_journal_matches_brute_force(catalog, tmp_path, monkeypatch):
+    monkeypatch.setattr(bitmaps, 'SNAPSHOT_PATH', str(tmp_path / 'snapshot.bin'))
+    publish(catalog)
+    write_after_snapshot(catalog)
+    answered_from_bitmaps(monkeypatch)
+
+    for query in QUERIES:
+        expected = brute_force(catalog, query)
+        for page_size in (None, 9):
+            assert all_pages(catalog, query, page_size) == expected
+
+
+def test_sharded_snapshot_with_journal_matches_brute_force(tables, tmp_path, monkeypatch):
+    monkeypatch.setattr(bitmaps, 'SNAPSHOT_BUCKET', None)
+    monkeypatch.setattr(bitmaps, 'SNAPSHOT_PATH', str(tmp_path / 'snapshot.bin'))
+    monkeypatch.setattr(shards, 'SHARD_SIZE', 50)
+    test_data.seed_catalog(tables, 300, seed=5)
+    publish(tables)
+    write_after_snapshot(tables)
+    answered_from_bitmaps(monkeypatch)
+
+    for query in QUERIES:
+        assert all_pages(tables, query, 11) == brute_force(tables, query)
+
+
+def test_cursors_carry_over_between_bitmaps_and_the_index(catalog, tmp_path, monkeypatch):
+    monkeypatch.setattr(bitmaps, 'SNAPSHOT_PATH', str(tmp_path / 'snapshot.bin'))
+    for query in ({'person': 1, 'car': 1}, {'person': 2}):
+        expected = brute_force(catalog, query)
+        first, cursor = search.find_images(catalog, query, page_size=10)
+        assert cursor
+        publish(catalog)
+        with monkeypatch.context() as patched:
+            answered_from_bitmaps(patched)
+            second, cursor = search.find_images(catalog, query, page_size=10, cursor=cursor)
+        # Back to the index
+        tmp_path.joinpath('snapshot.bin').unlink()
+        bitmaps._state.update(snapshot=None, checked=None, source=None)
+        third, cursor = search.find_images(catalog, query, page_size=10, cursor=cursor)
+        assert first + second + third == expected[:30]
+
+
+def other_catalog_snapshot(path, since):
+    data = bitmaps.encode_snapshot({'person': {'x1': 1}, 'car': {'x1': 1}}, {}, since)
+    path.write_bytes(data)
+
+
+def test_publish_without_a_bucket_or_path_raises(monkeypatch):
+    monkeypatch.setattr(bitmaps, 'SNAPSHOT_BUCKET', None)
+    monkeypatch.setattr(bitmaps, 'SNAPSHOT_PATH', None)
+    with pytest.raises(RuntimeError):
+        bitmaps.publish_snapshot(b'')
+
+
+def test_leftover_download_is_ignored_without_a_snapshot_path(catalog, tmp_path, monkeypatch):
+    monkeypatch.setattr(bitmaps, 'DOWNLOAD_PATH', str(tmp_path / 'download.bin'))
+    other_catalog_snapshot(tmp_path / 'download.bin', 1)
+
+    assert bitmaps.current_snapshot() is None
+
+
+@pytest.mark.parametrize('marker', [None, 'older', 'newer'])
+def test_unpublished_snapshot_file_is_not_used(catalog, tmp_path, monkeypatch, marker):
+    path = tmp_path / 'snapshot.bin'
+    monkeypatch.setattr(bitmaps, 'SNAPSHOT_PATH', str(path))
+    since = now_ms()
+    other_catalog_snapshot(path, since)
+    if marker:
+        mark_published(catalog, since - 1000 if marker == 'older' else since + 1000)
+
+    assert bitmaps.current_snapshot() is not None
+    assert bitmaps.find_images(catalog, {'person': 1, 'car': 1}, 'person') is None
+    # The query falls back to the tag index
+    images, _ = search.find_images(catalog, {'person': 1, 'car': 1})
+    assert images == expected(catalog, ['person', 'car'])
+    assert images != ['x1']
+
+
+def test_published_snapshot_is_used(catalog, tmp_path, monkeypatch):
+    monkeypatch.setattr(bitmaps, 'SNAPSHOT_PATH', str(tmp_path / 'snapshot.bin'))
+    data, since, _ = bitmaps.build_snapshot(catalog)
+    assert bitmaps.publish_snapshot(data) == str(tmp_path / 'snapshot.bin')
+    mark_published(catalog, since)
+    assert get_published_since(catalog) == since
+
+    page = bitmaps.find_images(catalog, {'person': 1, 'car': 1}, 'car')
+
+    assert page == (expected(catalog, ['person', 'car']), None)
@@ -0,0 +1,128 @@
+import base64
+import json
+import os
+import uuid
+
+import pytest
+
+from conftest import load_handler
+from pixtag import TAG_INDEX_TABLE, TAG_STATS_TABLE, runtime
+from pixtag.detection import CachedDetector, StubDetector
+from pixtag.shards import partition, shard_of
+
+BUCKET = 'assignment2-images-1812'
+
+
+@pytest.fixture
+def worker(tables):
+    handler = load_handler('yolo/Detect objects.py')
+    handler.dynamodb = tables
+    handler.s3 = runtime.new_client('s3')
+    handler.s3.create_bucket(Bucket=BUCKET)
+    handler.stub = StubDetector()
+    handler.detector = CachedDetector(handler.stub, tables)
+    return handler
+
+
+def upload(worker, body=None, catalogued=True):
+    """Store an image the way Upload image does; returns its SQS record"""
+    image_id = str(uuid.uuid4())
+    key = f'{image_id}.jpg'
+    worker.s3.put_object(Bucket=BUCKET, Key=key, Body=body or os.urandom(1024))
+    if catalogued:
+        worker.dynamodb.put_item(TableName='assignment2-images', Item={'imageId': image_id, 'tagCounts': {}})
+    return record(image_id, key)
+
+
+def record(image_id, key):
+    body = {'imageId': image_id, 'bucket': BUCKET, 'key': key}
+    return {'messageId': str(uuid.uuid4()), 'body': json.dumps(body)}
+
+
+def detected(worker, message):
+    body = json.loads(message['body'])
+    image = worker.s3.get_object(Bucket=body['bucket'], Key=body['key'])['Body'].read()
+    return StubDetector().detect(image)
+
+
+def index_count(client, tag, image_id):
+    item = client.get_item(
+        TableName=TAG_INDEX_TABLE,
+        Key={'tag': partition(tag, shard_of(image_id, 1)), 'imageId': image_id}
+    ).get('Item')
+    return int(item['count']) if item else None
+
+
+def image_count(client, tag):
+    item = client.get_item(TableName=TAG_STATS_TABLE, Key={'tag': tag}).get('Item', {})
+    return int(item.get('imageCount', 0))
+
+
+def test_detections_reach_images_index_and_counters(worker):
+    records = [upload(worker) for _ in range(5)]
+
+    result = worker.lambda_handler({'Records': records}, None)
+
+    assert result == {'batchItemFailures': []}
+    expected = {json.loads(message['body'])['imageId']: detected(worker, message) for message in records}
+    images = {}
+    for image_id, tag_counts in expected.items():
+        item = worker.dynamodb.get_item(TableName='assignment2-images', Key={'imageId': image_id})['Item']
+        assert {tag: int(count) for tag, count in item['tagCounts'].items()} == tag_counts
+        assert set(item['tags']) == set(tag_counts)
+        for tag, count in tag_counts.items():
+            assert index_count(worker.dynamodb, tag, image_id) == count
+            images.setdefault(tag, set()).add(image_id)
+    for tag, tagged in images.items():
+        assert image_count(worker.dynamodb, tag) == len(tagged)
+
+
+def test_images_are_batched_per_inference_call(worker):
+    worker.BATCH_SIZE = 4
+    records = [upload(worker) for _ in range(10)]
+
+    worker.lambda_handler({'Records': records}, None)
+
+    assert worker.stub.calls == 3
+    assert worker.stub.images == 10
+
+
+def test_redelivery_does_not_count_twice(worker):
+    message = upload(worker)
+    worker.lambda_handler({'Records': [message]}, None)
+    tag_counts = detected(worker, message)
+
+    result = worker.lambda_handler({'Records': [dict(message, messageId='again')]}, None)
+
+    assert result == {'batchItemFailures': []}
+    for tag in tag_counts:
+        assert image_count(worker.dynamodb, tag) == 1
+
+
+def test_only_failed_messages_are_retried(worker):
+    good = upload(worker)
+    missing_object = record(str(uuid.uuid4()), 'gone.jpg')
+    deleted_image = upload(worker, catalogued=False)
+    malformed = {'messageId': 'bad', 'body': 'not json'}
+
+    result = worker.lambda_handler({'Records': [good, missing_object, deleted_image, malformed]}, None)
+
+    # A missing object may still be on its way; a deleted image or a bad
+    # message will never succeed
+    assert result == {'batchItemFailures': [{'itemIdentifier': missing_object['messageId']}]}
+    image_id = json.loads(good['body'])['imageId']
+    for tag, count in detected(worker, good).items():
+        assert index_count(worker.dynamodb, tag, image_id) == count
+
+
+def test_direct_invoke_returns_detections(worker):
+    inline, staged = os.urandom(512), os.urandom(512)
+    worker.s3.put_object(Bucket=BUCKET, Key='query-images/staged', Body=staged)
+    event = {'images': [base64.b64encode(inline).decode(), {'bucket': BUCKET, 'key': 'query-images/staged'}]}
+
+    result = worker.lambda_handler(event, None)
+
+    assert result == {'detections': [
+        {'tagCounts': StubDetector().detect(inline)},
+        {'tagCounts': StubDetector().detect(staged)}
+    ]}
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from pixtag.detection import CachedDetector, Detector, StubDetector
+
+
+def test_memory_hit_skips_the_detector():
+    stub = StubDetector()
+    detector = CachedDetector(stub)
+    image = os.urandom(256)
+
+    first = detector.detect(image)
+    second = detector.detect(memoryview(image))
+
+    assert first == second == StubDetector().detect(image)
+    assert stub.calls == 1
+    assert detector.stats() == {'memoryHits': 1, 'tableHits': 0, 'misses': 1, 'hitRate': 0.5}
+
+
+def test_duplicates_in_a_batch_are_detected_once():
+    stub = StubDetector()
+    detector = CachedDetector(stub)
+    a, b = os.urandom(256), os.urandom(256)
+
+    results = detector.detect_batch([a, b, a])
+
+    assert results == StubDetector().detect_batch([a, b, a])
+    assert (stub.calls, stub.images) == (1, 2)
+
+
+def test_table_hit_skips_the_detector_in_another_container(tables):
+    image = os.urandom(256)
+    warm = CachedDetector(StubDetector(tags=['dog', 'dog', 'Person']), tables)
+    expected = warm.detect(image)
+
+    stub = StubDetector(tags=['cat'])
+    cold = CachedDetector(stub, tables)
+
+    assert cold.detect(image) == expected == {'dog': 2, 'person': 1}
+    assert stub.calls == 0
+    assert cold.stats()['tableHits'] == 1
+    # and from memory after that
+    cold.detect(image)
+    assert cold.stats()['memoryHits'] == 1
+    assert stub.calls == 0
+
+
+def test_misses_are_written_for_other_containers(tables):
+    images = [os.urandom(256) for _ in range(3)]
+    CachedDetector(StubDetector(), tables).detect_batch(images)
+
+    stub = StubDetector()
+    results = CachedDetector(stub, tables).detect_batch(images)
+
+    assert results == StubDetector().detect_batch(images)
+    assert stub.calls == 0
+
+
+def test_incomplete_detector_fails_when_constructed():
+    class Incomplete(Detector):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
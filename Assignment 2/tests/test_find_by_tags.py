@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import test_data
+from conftest import load_handler
+from pixtag.tagging import mutate_tags
+
+
+@pytest.fixture
+def handler(tables):
+    test_data.seed_catalog(tables, 60, seed=1)
+    module = load_handler('queries/Find by Tags.py')
+    module.dynamodb = tables
+    return module
+
+
+def call(handler, **params):
+    response = handler.lambda_handler({'queryStringParameters': params}, None)
+    body = json.loads(response['body']) if response.get('body') else None
+    return response['statusCode'], body
+
+
+def test_counts_default_to_one(handler):
+    status, plain = call(handler, tags='person')
+    assert status == 200
+    assert call(handler, tags='person', counts='1') == (200, plain)
+    assert call(handler, tags='person', counts='') == (200, plain)
+    assert call(handler, tags='person', counts='0') == (200, plain)
+
+
+def test_missing_entries_in_counts_default_to_one(handler):
+    assert call(handler, tags='person,car', counts=',1') == call(handler, tags='person,car', counts='1,1')
+    assert call(handler, tags='person,car', counts='2') == call(handler, tags='person,car', counts='2,1')
+
+
+@pytest.mark.parametrize('counts', ['x', '-1', '1.5', '1,two'])
+def test_invalid_counts_are_client_errors(handler, counts):
+    status, body = call(handler, tags='person,car', counts=counts)
+    assert status == 400
+    assert 'counts' in body['error']
+
+
+def get(handler, headers=None, **params):
+    return handler.lambda_handler({'queryStringParameters': params, 'headers': headers or {}}, None)
+
+
+def test_unchanged_page_is_not_modified_until_a_tag_is_written(handler, tables):
+    first = get(handler, tags='person,car', pageSize='5')
+    etag = first['headers']['ETag']
+
+    again = get(handler, {'If-None-Match': etag}, tags='car,person', pageSize='5')
+    assert again['statusCode'] == 304
+    assert get(handler, {'If-None-Match': f'W/{etag}'}, tags='person,car', pageSize='5')['statusCode'] == 304
+    # Another page size or format is another representation
+    assert get(handler, {'If-None-Match': etag}, tags='person,car', pageSize='6')['statusCode'] == 200
+    assert get(handler, {'If-None-Match': etag}, tags='person,car', pageSize='5', format='compact')['statusCode'] == 200
+
+    image_id = json.loads(first['body'])['links'][0].rsplit('/', 1)[1].split('.')[0]
+    mutate_tags(tables, [('u', image_id)], ['car'], add=False)
+
+    changed = get(handler, {'If-None-Match': etag}, tags='person,car', pageSize='5')
+    assert changed['statusCode'] == 200
+    assert changed['headers']['ETag'] != etag
+    assert image_id not in changed['body']
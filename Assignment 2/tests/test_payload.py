@@ -0,0 +1,113 @@
+import base64
+import io
+import json
+import os
+
+import pytest
+
+from pixtag import payload
+from pixtag.payload import ViewReader, read_image
+
+IMAGE = b'\xff\xd8\xff\xe0' + os.urandom(3000) + b'\r\n--not-a-boundary\r\n' + os.urandom(500)
+
+
+def event(body, content_type=None, encoded=False):
+    headers = {'Content-Type': content_type} if content_type else {}
+    return {'headers': headers, 'body': body, 'isBase64Encoded': encoded}
+
+
+def multipart(boundary, parts):
+    body = b''
+    for headers, content in parts:
+        body += b'--' + boundary + b'\r\n' + headers + b'\r\n\r\n' + content + b'\r\n'
+    return body + b'--' + boundary + b'--\r\n'
+
+
+def b64(data):
+    return base64.b64encode(data).decode()
+
+
+def test_json_image_data_and_other_fields():
+    body = json.dumps({'imageData': b64(IMAGE), 'minScore': 0.5})
+    with read_image(event(body)) as image:
+        assert bytes(image.data) == IMAGE
+        assert image.fields == {'minScore': 0.5}
+        assert not image.spooled
+
+
+def test_base64_encoded_json_body():
+    body = b64(json.dumps({'imageData': b64(IMAGE)}).encode())
+    with read_image(event(body, 'application/json; charset=utf-8', encoded=True)) as image:
+        assert bytes(image.data) == IMAGE
+
+
+@pytest.mark.parametrize('content_type', ['application/octet-stream', 'image/jpeg'])
+def test_binary_body(content_type):
+    with read_image(event(b64(IMAGE), content_type, encoded=True)) as image:
+        assert bytes(image.data) == IMAGE
+        assert image.size == len(IMAGE)
+
+
+def test_multipart_image_part_and_text_fields():
+    body = multipart(b'XyZ', [
+        (b'Content-Disposition: form-data; name="note"', b'hello'),
+        (b'Content-Disposition: form-data; name="upload"; filename="a.jpg"\r\nContent-Type: image/jpeg', IMAGE),
+        (b'Content-Disposition: form-data; name="tags"', b'dog,cat')
+    ])
+    with read_image(event(b64(body), 'multipart/form-data; boundary="XyZ"', encoded=True)) as image:
+        assert bytes(image.data) == IMAGE
+        assert image.fields == {'note': 'hello', 'tags': 'dog,cat'}
+
+
+def test_spooled_mime_wrapped_base64(monkeypatch):
+    monkeypatch.setattr(payload, 'SPOOL_LIMIT', 1024)
+    # Chunks end mid-line and mid-group, so groups carry over
+    monkeypatch.setattr(payload, 'DECODE_CHUNK', 4 * 37)
+    wrapped = base64.encodebytes(IMAGE).decode()
+    assert '\n' in wrapped
+
+    with read_image(event(wrapped, 'application/octet-stream', encoded=True)) as image:
+        assert image.spooled
+        assert bytes(image.data) == IMAGE
+
+
+def test_spooled_multipart(monkeypatch):
+    monkeypatch.setattr(payload, 'SPOOL_LIMIT', 1024)
+    body = multipart(b'b', [(b'Content-Disposition: form-data; name="image"', IMAGE)])
+    with read_image(event(b64(body), 'multipart/form-data; boundary=b', encoded=True)) as image:
+        assert image.spooled
+        assert bytes(image.data) == IMAGE
+
+
+@pytest.mark.parametrize('spool_limit', [payload.SPOOL_LIMIT, 16])
+def test_invalid_base64_is_rejected(monkeypatch, spool_limit):
+    monkeypatch.setattr(payload, 'SPOOL_LIMIT', spool_limit)
+    with pytest.raises(ValueError, match='Invalid base64'):
+        read_image(event('QUJD' * 10 + 'Q', 'application/octet-stream', encoded=True))
+
+
+@pytest.mark.parametrize('bad_event, message', [
+    (event('{not json'), 'Invalid JSON'),
+    (event('{"minScore": 1}'), 'imageData required'),
+    (event('[]'), 'imageData required'),
+    (event(b64(IMAGE), 'application/octet-stream'), 'must be base64 encoded'),
+    (event('', 'application/octet-stream', encoded=True), 'Empty image body'),
+    (event(b64(IMAGE), 'multipart/form-data', encoded=True), 'boundary missing'),
+    (event(b64(multipart(b'b', [(b'Content-Disposition: form-data; name="note"', b'hi')])),
+           'multipart/form-data; boundary=b', encoded=True), 'No image part'),
+    (event(b64(b'--b\r\nContent-Disposition: form-data; name="image"\r\n\r\n' + IMAGE),
+           'multipart/form-data; boundary=b', encoded=True), 'Malformed multipart'),
+])
+def test_unreadable_bodies_raise_value_error(bad_event, message):
+    with pytest.raises(ValueError, match=message):
+        read_image(bad_event)
+
+
+def test_view_reader_reads_and_seeks_like_a_file():
+    reader = io.BufferedReader(ViewReader(memoryview(IMAGE)[10:]))
+
+    assert reader.read(5) == IMAGE[10:15]
+    reader.seek(-3, io.SEEK_END)
+    assert reader.read() == IMAGE[-3:]
+    reader.seek(0)
+    assert reader.read() == IMAGE[10:]
@@ -0,0 +1,113 @@
+import json
+
+import boto3
+import pytest
+
+import test_data
+from conftest import brute_force, load_handler
+from pixtag import IMAGES_TABLE
+from pixtag.results import find_page, page_tag
+from pixtag.tagging import apply_detections, mutate_tags
+
+
+@pytest.fixture
+def catalog(tables):
+    test_data.seed_catalog(tables, 120, seed=2)
+    s3 = boto3.client('s3')
+    for bucket in (test_data.FULL_IMAGES_BUCKET, test_data.THUMBNAILS_BUCKET):
+        s3.create_bucket(Bucket=bucket)
+    return tables
+
+
+@pytest.fixture
+def handlers(catalog):
+    modules = {}
+    for name in ('Manage tags', 'Delete images'):
+        modules[name] = load_handler(f'queries/{name}.py')
+        modules[name].dynamodb = catalog
+    modules['Delete images'].s3 = boto3.client('s3')
+    return modules
+
+
+def calls_made(client):
+    calls = []
+    client.meta.events.register('provide-client-params.dynamodb.*',
+                                lambda params, event_name, **kwargs: calls.append(event_name))
+    return calls
+
+
+def thumbnail_url(image_id):
+    return test_data.image_item(image_id, {})['thumbnailUrl']
+
+
+def image_ids(client):
+    return [item['imageId'] for item in client.scan(TableName=IMAGES_TABLE, ProjectionExpression='imageId')['Items']]
+
+
+def post(handler, body):
+    response = handler.lambda_handler({'body': json.dumps(body)}, None)
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])
+
+
+def test_repeated_page_is_served_without_dynamodb_calls(catalog):
+    query = {'person': 1, 'car': 1}
+    links, cursor, tag = find_page(catalog, query, 5)
+    assert links == [thumbnail_url(image_id) for image_id in brute_force(catalog, query)[:5]]
+
+    calls = calls_made(catalog)
+    assert find_page(catalog, {'car': 1, 'person': 1}, 5) == (links, cursor, tag)
+    assert page_tag(catalog, query, 5) == tag
+    assert calls == []
+
+
+def test_write_to_another_tag_keeps_the_page(catalog):
+    page = find_page(catalog, {'person': 1}, 5)
+    mutate_tags(catalog, [('u', brute_force(catalog, {'car': 1})[0])], ['zebra'])
+
+    calls = calls_made(catalog)
+    assert find_page(catalog, {'person': 1}, 5) == page
+    assert calls == []
+
+
+def test_manage_tags_invalidates_cached_pages(catalog, handlers):
+    query = {'person': 1}
+    links, _, tag = find_page(catalog, query, 1000)
+    untagged = sorted(set(image_ids(catalog)) - set(brute_force(catalog, query)))[:3]
+
+    results = post(handlers['Manage tags'], {'url': [thumbnail_url(i) for i in untagged], 'type': 1, 'tags': ['Person']})
+    assert [result['status'] for result in results['results']] == ['success'] * 3
+
+    new_links, _, new_tag = find_page(catalog, query, 1000)
+    assert new_tag != tag
+    assert new_links == [thumbnail_url(image_id) for image_id in brute_force(catalog, query)]
+    assert set(new_links) - set(links) == {thumbnail_url(image_id) for image_id in untagged}
+
+
+def test_delete_images_invalidates_cached_pages(catalog, handlers):
+    query = {'person': 1, 'car': 1}
+    links, _, tag = find_page(catalog, query, 10)
+
+    results = post(handlers['Delete images'], {'url': links[:2]})
+    assert results['deleted'] == 2
+
+    new_links, _, new_tag = find_page(catalog, query, 10)
+    assert new_tag != tag
+    assert not set(links[:2]) & set(new_links)
+    assert new_links == [thumbnail_url(image_id) for image_id in brute_force(catalog, query)[:10]]
+
+
+def test_pages_with_pending_thumbnails_are_not_cached(catalog):
+    item = test_data.image_item('00000000-pending', {})
+    for attribute in ('tags', 'thumbnailUrl', 'thumbnailKey'):
+        del item[attribute]
+    catalog.put_item(TableName=IMAGES_TABLE, Item=item)
+    apply_detections(catalog, {'00000000-pending': {'person': 1}})
+
+    links, _, tag = find_page(catalog, {'person': 1}, 5)
+    assert tag is None
+    assert len(links) == 4
+
+    calls = calls_made(catalog)
+    find_page(catalog, {'person': 1}, 5)
+    assert calls
@@ -0,0 +1,168 @@
+import pytest
+
+import test_data
+from conftest import all_pages, brute_force
+from pixtag import search, shards
+from pixtag.search import find_images, plan_query
+from pixtag.stats import add_to_tag_counts, get_tag_shards
+from pixtag.tag_index import COUNT_INDEX, decode_cursor, encode_cursor, finish_reshard, start_reshard
+
+QUERIES = [
+    {'person': 1},
+    {'person': 1, 'car': 1},
+    {'car': 1, 'person': 2},
+    {'person': 2, 'car': 2},
+    {'person': 1, 'chair': 1, 'cup': 1},
+    {'kite': 1, 'person': 1},
+    {'dog': 3},
+    {'person': 1, 'unicorn': 1},
+    {'person': 25},
+]
+
+
+@pytest.fixture
+def catalog(tables):
+    test_data.seed_catalog(tables, 400, seed=7)
+    return tables
+
+
+@pytest.fixture
+def sharded_catalog(tables, monkeypatch):
+    # Hot tags of a 400-image catalog end up in 2 to 8 shards
+    monkeypatch.setattr(shards, 'SHARD_SIZE', 50)
+    test_data.seed_catalog(tables, 400, seed=7)
+    return tables
+
+
+def filters_used(monkeypatch):
+    """Names of the filters each index-answered query opened"""
+    used = []
+    open_tags = search._open_tags
+
+    def recording(*args, **kwargs):
+        stream, filters = open_tags(*args, **kwargs)
+        used.append([type(tag_filter).__name__ for tag_filter in filters])
+        return stream, filters
+
+    monkeypatch.setattr(search, '_open_tags', recording)
+    return used
+
+
+def queries_sent(client):
+    sent = []
+    client.meta.events.register('provide-client-params.dynamodb.Query', lambda params, **kwargs: sent.append(params))
+    return sent
+
+
+@pytest.mark.parametrize('query', QUERIES, ids=lambda query: ','.join(f'{t}>={c}' for t, c in query.items()))
+def test_pages_match_brute_force(catalog, query):
+    expected = brute_force(catalog, query)
+    for page_size in (None, 7, 50):
+        assert all_pages(catalog, query, page_size) == expected
+
+
+def test_rarest_tag_drives_the_query(catalog):
+    order, estimates = plan_query(catalog, {'person': 1, 'unicorn': 1, 'kite': 1, 'car': 1})
+
+    assert order == ['kite', 'car', 'person', 'unicorn']
+    assert estimates == {'person': 219, 'unicorn': None, 'kite': 11, 'car': 129}
+
+
+@pytest.mark.parametrize('query, probe_ratio, expected', [
+    ({'car': 1, 'person': 1}, search.PROBE_RATIO, ['MergeFilter']),
+    ({'car': 1, 'person': 1}, 1, ['ProbeFilter']),
+    # A count threshold on a filtering tag rules out merging
+    ({'car': 1, 'person': 2}, search.PROBE_RATIO, ['ProbeFilter']),
+    ({'kite': 1, 'car': 1, 'person': 1}, 12, ['MergeFilter', 'ProbeFilter']),
+])
+def test_merge_and_probe_filters_match_brute_force(catalog, monkeypatch, query, probe_ratio, expected):
+    monkeypatch.setattr(search, 'PROBE_RATIO', probe_ratio)
+    used = filters_used(monkeypatch)
+
+    assert all_pages(catalog, query, 20) == brute_force(catalog, query)
+    assert used[0] == expected
+
+
+def test_memory_filter_after_a_tag_was_read_whole(catalog, monkeypatch):
+    used = filters_used(monkeypatch)
+    # Reading person to its end caches its posting list
+    find_images(catalog, {'person': 1})
+
+    for query in ({'car': 1, 'person': 1}, {'car': 1, 'person': 3}):
+        assert all_pages(catalog, query, 20) == brute_force(catalog, query)
+        assert used[-1] == ['MemoryFilter']
+
+
+def test_cached_driving_tag_keeps_cursors_working(catalog):
+    query = {'person': 2}
+    first, cursor = find_images(catalog, query, page_size=10)
+    # Cache person, then resume the uncached page's cursor from the cache
+    find_images(catalog, {'person': 1})
+    rest = []
+    while cursor:
+        images, cursor = find_images(catalog, query, page_size=10, cursor=cursor)
+        rest.extend(images)
+
+    assert first + rest == brute_force(catalog, query)
+
+
+def test_count_threshold_reads_only_qualifying_rows(catalog):
+    sent = queries_sent(catalog)
+
+    images, _ = find_images(catalog, {'dog': 2})
+
+    assert images == brute_force(catalog, {'dog': 2})
+    assert [params.get('IndexName') for params in sent] == [COUNT_INDEX]
+    assert sent[0]['KeyConditionExpression'].endswith('>= :from')
+
+
+def test_sharded_tags_match_brute_force(sharded_catalog):
+    layouts = get_tag_shards(sharded_catalog, ['person', 'car', 'chair', 'kite'])
+    assert layouts == {'person': (8, None), 'car': (4, None), 'chair': (2, None), 'kite': (1, None)}
+
+    for query in QUERIES:
+        assert all_pages(sharded_catalog, query, 13) == brute_force(sharded_catalog, query)
+
+
+@pytest.mark.parametrize('probe_ratio', [search.PROBE_RATIO, 0])
+def test_reads_stay_complete_while_a_tag_is_resharded(sharded_catalog, monkeypatch, probe_ratio):
+    monkeypatch.setattr(search, 'PROBE_RATIO', probe_ratio)
+    queries = [{'person': 1}, {'car': 1, 'person': 1}, {'car': 1, 'person': 2}, {'person': 2}]
+    expected = [brute_force(sharded_catalog, query) for query in queries]
+
+    assert start_reshard(sharded_catalog, 'person', 8, 16)
+    assert [all_pages(sharded_catalog, query, 40) for query in queries] == expected
+
+    assert finish_reshard(sharded_catalog, 'person', 8, 16) > 0
+    assert [all_pages(sharded_catalog, query, 40) for query in queries] == expected
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor!',
+    encode_cursor(['person']),
+    encode_cursor({'tag': 'car', 'imageId': 'x'}),
+    encode_cursor({'tag': 'person'}),
+    # A count cursor for a query without a threshold, and the reverse
+    encode_cursor({'tag': 'person', 'imageId': 'x', 'countKey': '00002#x'}),
+])
+def test_cursors_of_other_queries_are_rejected(catalog, cursor):
+    with pytest.raises(ValueError):
+        find_images(catalog, {'person': 1, 'kite': 1}, page_size=5, cursor=cursor)
+
+
+def test_cursor_keeps_the_driving_tag_when_counters_move(catalog):
+    query = {'kite': 1, 'person': 1}
+    images, cursor = find_images(catalog, query, page_size=2)
+    assert decode_cursor(cursor)['tag'] == 'kite'
+    # person becomes the rarer tag on paper
+    add_to_tag_counts(catalog, {'person': -215})
+    assert plan_query(catalog, query)[0][0] == 'person'
+
+    rest = []
+    while cursor:
+        page, cursor = find_images(catalog, query, page_size=2, cursor=cursor)
+        rest.extend(page)
+        if cursor:
+            assert decode_cursor(cursor)['tag'] == 'kite'
+
+    assert images + rest == brute_force(catalog, query)
@@ -0,0 +1,123 @@
+import json
+
+import boto3
+import pytest
+
+import setup_assignment2
+from setup_assignment2 import BUCKET_PREFIXES, LAMBDA_POLICIES, LAMBDA_ROLE, TABLES, create_assignment2_resources
+
+
+@pytest.fixture
+def clients(aws, monkeypatch):
+    monkeypatch.setattr(setup_assignment2, 'POLL_DELAY', 0)
+    return {
+        's3': boto3.client('s3', region_name='us-east-1'),
+        'dynamodb': boto3.client('dynamodb', region_name='us-east-1'),
+        'iam': boto3.client('iam')
+    }
+
+
+def provision(clients, config_file):
+    return create_assignment2_resources(config_file=str(config_file), **clients)
+
+
+def table_report(capsys):
+    """{table: actions as printed} from the last run's output"""
+    report = {}
+    for line in capsys.readouterr().out.splitlines():
+        name, _, actions = line.strip().removeprefix('✅ ').partition(': ')
+        if name in {table['TableName'] for table in TABLES}:
+            report[name] = actions
+    return report
+
+
+def test_fresh_account(clients, tmp_path, capsys):
+    config = provision(clients, tmp_path / 'config.json')
+
+    assert set(config['s3_buckets']) == set(BUCKET_PREFIXES)
+    suffixes = {name.rsplit('-', 1)[1] for name in config['s3_buckets'].values()}
+    assert len(suffixes) == 1
+    buckets = {bucket['Name'] for bucket in clients['s3'].list_buckets()['Buckets']}
+    assert set(config['s3_buckets'].values()) <= buckets
+
+    dynamodb = clients['dynamodb']
+    assert set(dynamodb.list_tables()['TableNames']) == {table['TableName'] for table in TABLES}
+    images = dynamodb.describe_table(TableName='assignment2-images')['Table']
+    assert [index['IndexName'] for index in images['GlobalSecondaryIndexes']] == ['thumbnailKey-index']
+    assert images['StreamSpecification']['StreamViewType'] == 'NEW_AND_OLD_IMAGES'
+    assert config['dynamodb_streams'] == {'assignment2-images': images['LatestStreamArn']}
+    ttl = dynamodb.describe_time_to_live(TableName='assignment2-tag-index')['TimeToLiveDescription']
+    assert ttl == {'TimeToLiveStatus': 'ENABLED', 'AttributeName': 'expires'}
+
+    attached = clients['iam'].list_attached_role_policies(RoleName=LAMBDA_ROLE)['AttachedPolicies']
+    assert {policy['PolicyArn'] for policy in attached} == set(LAMBDA_POLICIES)
+    assert json.loads((tmp_path / 'config.json').read_text()) == config
+    assert set(table_report(capsys).values()) == {'created', 'created, enabled TTL on expires'}
+
+
+def test_second_run_changes_nothing(clients, tmp_path, capsys):
+    first = provision(clients, tmp_path / 'config.json')
+    capsys.readouterr()
+    second = provision(clients, tmp_path / 'config.json')
+
+    assert second['s3_buckets'] == first['s3_buckets']
+    assert second['dynamodb_streams'] == first['dynamodb_streams']
+    assert second['created'] == first['created']
+    assert set(table_report(capsys).values()) == {'up to date'}
+    assert len(clients['s3'].list_buckets()['Buckets']) == len(BUCKET_PREFIXES)
+
+
+def test_upgrade_from_legacy_layout(clients, tmp_path, capsys):
+    # What the original script left behind: two buckets, two bare tables,
+    # a role with three policies and a config naming them
+    s3, dynamodb, iam = clients['s3'], clients['dynamodb'], clients['iam']
+    legacy_buckets = {'full_images': 'assignment2-images-4242', 'thumbnails': 'assignment2-thumbnails-4242'}
+    for name in legacy_buckets.values():
+        s3.create_bucket(Bucket=name)
+    dynamodb.create_table(
+        TableName='assignment2-images',
+        KeySchema=[{'AttributeName': 'imageId', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'imageId', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    dynamodb.create_table(
+        TableName='assignment2-tag-index',
+        KeySchema=[
+            {'AttributeName': 'tag', 'KeyType': 'HASH'},
+            {'AttributeName': 'imageId', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'tag', 'AttributeType': 'S'},
+            {'AttributeName': 'imageId', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    dynamodb.put_item(TableName='assignment2-images', Item={'imageId': {'S': 'kept'}})
+    iam.create_role(RoleName=LAMBDA_ROLE, AssumeRolePolicyDocument=json.dumps({
+        'Version': '2012-10-17',
+        'Statement': [{'Effect': 'Allow', 'Principal': {'Service': 'lambda.amazonaws.com'}, 'Action': 'sts:AssumeRole'}]
+    }))
+    iam.attach_role_policy(RoleName=LAMBDA_ROLE, PolicyArn=LAMBDA_POLICIES[0])
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({'created': '2024-01-01 00:00:00', 's3_buckets': legacy_buckets}))
+
+    config = provision(clients, config_file)
+
+    assert config['created'] == '2024-01-01 00:00:00'
+    assert config['s3_buckets'] == {**legacy_buckets, 'snapshots': 'assignment2-snapshots-4242'}
+    report = table_report(capsys)
+    assert report['assignment2-images'] == 'added thumbnailKey-index, enabled NEW_AND_OLD_IMAGES stream'
+    assert report['assignment2-tag-index'] == 'added tag-count-index, enabled TTL on expires'
+    assert report['assignment2-tag-stats'] == 'created'
+
+    images = dynamodb.describe_table(TableName='assignment2-images')['Table']
+    assert images['StreamSpecification']['StreamViewType'] == 'NEW_AND_OLD_IMAGES'
+    assert dynamodb.get_item(TableName='assignment2-images', Key={'imageId': {'S': 'kept'}}).get('Item')
+    tag_index = dynamodb.describe_table(TableName='assignment2-tag-index')['Table']
+    assert [index['IndexName'] for index in tag_index['GlobalSecondaryIndexes']] == ['tag-count-index']
+    attached = iam.list_attached_role_policies(RoleName=LAMBDA_ROLE)['AttachedPolicies']
+    assert {policy['PolicyArn'] for policy in attached} == set(LAMBDA_POLICIES)
+
+    capsys.readouterr()
+    provision(clients, config_file)
+    assert set(table_report(capsys).values()) == {'up to date'}
@@ -0,0 +1,78 @@
+import pytest
+
+import test_data
+from pixtag import IMAGES_TABLE, TAG_INDEX_TABLE, tagging
+from pixtag.stats import get_tag_counts
+from pixtag.tag_index import iter_image_ids
+
+
+@pytest.fixture
+def images(tables):
+    for image_id, tag_counts in (('a', {'dog': 2}), ('b', {'cat': 1})):
+        tables.put_item(TableName=IMAGES_TABLE, Item=test_data.image_item(image_id, tag_counts))
+        tagging.batch_write(tables, TAG_INDEX_TABLE, [
+            tagging.put_request(tagging.index_item(tag, image_id, count)) for tag, count in tag_counts.items()
+        ], ('tag', 'imageId'))
+    return tables
+
+
+def image_tags(client, image_id):
+    item = client.get_item(TableName=IMAGES_TABLE, Key={'imageId': image_id})['Item']
+    return set(item.get('tags', set())), dict(item.get('tagCounts', {}))
+
+
+def fail_first_index_write(monkeypatch):
+    """The first tag-index batch_write raises, like one out of retries"""
+    write = tagging.batch_write
+    calls = []
+
+    def flaky(client, table_name, requests, key_names):
+        calls.append(len(requests))
+        if len(calls) == 1:
+            # Part of the batch lands before the failure
+            write(client, table_name, requests[:1], key_names)
+            raise RuntimeError('writes still unprocessed')
+        return write(client, table_name, requests, key_names)
+
+    monkeypatch.setattr(tagging, 'batch_write', flaky)
+    return calls
+
+
+def test_add_updates_images_index_and_counters(images):
+    results = tagging.mutate_tags(images, [('u-a', 'a'), ('u-b', 'b'), ('bad', None)], ['Park'])
+
+    assert [result['status'] for result in results] == ['success', 'success', 'error']
+    assert results[0]['updatedTags'] == ['dog', 'park']
+    assert sorted(iter_image_ids(images, 'park')) == ['a', 'b']
+    assert get_tag_counts(images, ['park']) == {'park': 2}
+
+
+@pytest.mark.parametrize('add, tag', [(True, 'park'), (False, 'dog')])
+def test_failed_index_write_rolls_back_and_reports_errors(images, monkeypatch, add, tag):
+    before = {image_id: image_tags(images, image_id) for image_id in ('a', 'b')}
+    indexed = sorted(iter_image_ids(images, tag))
+    calls = fail_first_index_write(monkeypatch)
+
+    results = tagging.mutate_tags(images, [('u-a', 'a'), ('u-missing', 'zzz')], [tag], add=add)
+
+    assert results == [
+        {'url': 'u-a', 'status': 'error', 'error': 'writes still unprocessed'},
+        {'url': 'u-missing', 'status': 'not_found'}
+    ]
+    assert len(calls) == 2
+    assert {image_id: image_tags(images, image_id) for image_id in ('a', 'b')} == {
+        # A removed tag comes back with the default count
+        **before, 'a': before['a'] if add else ({'dog'}, {'dog': 1})
+    }
+    assert sorted(iter_image_ids(images, tag)) == indexed
+
+
+def test_retry_after_a_failed_index_write_applies_the_edit(images, monkeypatch):
+    fail_first_index_write(monkeypatch)
+    tagging.mutate_tags(images, [('u-a', 'a')], ['park'])
+
+    results = tagging.mutate_tags(images, [('u-a', 'a')], ['park'])
+
+    assert results[0]['status'] == 'success'
+    assert sorted(iter_image_ids(images, 'park')) == ['a']
+    assert get_tag_counts(images, ['park']) == {'park': 1}
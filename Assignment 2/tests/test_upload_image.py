@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from conftest import load_handler
+from pixtag import runtime
+
+
+class Invocations:
+    """Records the thumbnail Lambda invokes instead of making them"""
+
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, **kwargs):
+        self.calls.append(kwargs)
+        return {'StatusCode': 202}
+
+
+@pytest.fixture
+def upload(tables):
+    module = load_handler('upload/Upload image.py')
+    module.dynamodb = tables
+    module.s3 = runtime.new_client('s3')
+    module.s3.create_bucket(Bucket=module.FULL_IMAGES_BUCKET)
+    module.lambda_client = Invocations()
+    return module
+
+
+def call(upload, **body):
+    response = upload.lambda_handler({'body': json.dumps(body)}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def started(upload, data):
+    status, body = call(upload, action='start', contentType='image/jpeg', size=len(data))
+    assert status == 200
+    part = upload.s3.upload_part(
+        Bucket=upload.FULL_IMAGES_BUCKET, Key=f"{body['imageId']}.jpg",
+        UploadId=body['uploadId'], PartNumber=1, Body=data
+    )
+    return body, [{'partNumber': 1, 'etag': part['ETag']}]
+
+
+def test_complete_with_parts(upload):
+    session, parts = started(upload, b'jpeg bytes')
+
+    status, body = call(upload, action='complete', imageId=session['imageId'],
+                        uploadId=session['uploadId'], parts=parts)
+
+    assert status == 200
+    assert body['status'] == 'uploaded'
+    item = upload.dynamodb.get_item(TableName='assignment2-images', Key={'imageId': session['imageId']})['Item']
+    assert item['fileSize'] == len(b'jpeg bytes')
+    assert len(upload.lambda_client.calls) == 1
+
+
+def test_complete_without_parts_uses_the_uploaded_ones(upload):
+    session, _ = started(upload, b'jpeg bytes')
+
+    status, _ = call(upload, action='complete', imageId=session['imageId'], uploadId=session['uploadId'])
+
+    assert status == 200
+
+
+@pytest.mark.parametrize('parts', [
+    'all',
+    {'partNumber': 1, 'etag': 'x'},
+    ['x'],
+    [{'partNumber': 1}],
+    [{'etag': 'x'}],
+    [{'partNumber': '1', 'etag': 'x'}],
+    [{'partNumber': True, 'etag': 'x'}],
+    [{'partNumber': 0, 'etag': 'x'}],
+    [{'partNumber': 1, 'etag': 7}],
+])
+def test_malformed_parts_are_client_errors(upload, parts):
+    session, _ = started(upload, b'jpeg bytes')
+
+    status, body = call(upload, action='complete', imageId=session['imageId'],
+                        uploadId=session['uploadId'], parts=parts)
+
+    assert status == 400
+    assert 'parts' in body['error']
+    assert upload.lambda_client.calls == []
+
+
+def test_image_id_must_be_the_one_start_returned(upload):
+    session, parts = started(upload, b'jpeg bytes')
+
+    status, _ = call(upload, action='complete', imageId='../other', uploadId=session['uploadId'], parts=parts)
+
+    assert status == 400